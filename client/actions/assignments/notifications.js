@@ -238,6 +238,13 @@ const onAssignmentLocked = (_e, data) => (
  */
 const onAssignmentUnlocked = (_e, data) => (
     (dispatch, getState) => {
+        if (get(data, 'items')) {
+            // All the items unlocked at the end of a session are sent in one notification
+            return Promise.all(
+                data.items.map((item) => dispatch(self.onAssignmentUnlocked(_e, {...data, ...item, items: null})))
+            );
+        }
+
         if (get(data, 'item')) {
             return dispatch(assignments.api.fetchAssignmentById(data.item, false))
                 .then((assignmentInStore) => {
@@ -29,6 +29,13 @@ const onEventCreated = (_e, data) => (
  */
 const onEventUnlocked = (_e, data) => (
     (dispatch, getState) => {
+        if (get(data, 'items')) {
+            // All the items unlocked at the end of a session are sent in one notification
+            return Promise.all(
+                data.items.map((item) => dispatch(self.onEventUnlocked(_e, {...data, ...item, items: null})))
+            );
+        }
+
         if (data && data.item) {
             const events = selectors.events.storedEvents(getState());
             let eventInStore = get(events, data.item, {});
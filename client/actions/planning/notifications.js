@@ -135,6 +135,13 @@ const onPlanningLocked = (e, data) => (
  */
 const onPlanningUnlocked = (_e, data) => (
     (dispatch, getState) => {
+        if (get(data, 'items')) {
+            // All the items unlocked at the end of a session are sent in one notification
+            return Promise.all(
+                data.items.map((item) => dispatch(self.onPlanningUnlocked(_e, {...data, ...item, items: null})))
+            );
+        }
+
         if (get(data, 'item')) {
             let planningItem = selectors.planning.storedPlannings(getState())[data.item];
 
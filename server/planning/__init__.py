@@ -18,7 +18,7 @@ from .common import get_max_recurrent_events, get_street_map_url, get_event_max_
     planning_auto_assign_to_workflow, get_long_event_duration_threshold
 from apps.common.components.utils import register_component
 from .item_lock import LockService
-from .planning_notifications import PlanningNotifications
+from .planning_notifications import PlanningNotifications, send_email_digests as _send_email_digests
 from planning.events import init_app as init_events_app
 from planning.planning import init_app as init_planning_app
 from planning.assignments import init_app as init_assignments_app
@@ -26,6 +26,15 @@ from planning.search import init_app as init_search_app
 from planning.validate import init_app as init_validator_app
 from superdesk.celery_app import celery
 from .published_planning import PublishedPlanningResource, PublishedPlanningService
+from .planning_checkpoints import PlanningCheckpointsResource, PlanningCheckpointsService
+from .lock_metrics import PlanningLockMetricsResource, PlanningLockMetricsService
+from .reference_cache import init_app as init_reference_cache
+from .history import flush_history_on_teardown
+from .slack import configure as configure_slack
+from .notification_templates import preload_notification_templates
+from .attachment_cache import configure as configure_attachment_cache
+from .planning_email_digest import PlanningEmailDigestResource, PlanningEmailDigestService
+from .ingest_file_manifest import IngestFileManifestResource, IngestFileManifestService
 from superdesk.default_settings import celery_queue, CELERY_TASK_ROUTES as CTR, \
     CELERY_BEAT_SCHEDULE as CBS
 from celery.schedules import crontab
@@ -58,11 +67,31 @@ def init_app(app):
     init_assignments_app(app)
     init_search_app(app)
     init_validator_app(app)
+    init_reference_cache(app)
+    app.teardown_request(flush_history_on_teardown)
+    configure_slack(app.config)
+    configure_attachment_cache(app.config)
 
     endpoint_name = 'published_planning'
     planning_published_service = PublishedPlanningService(endpoint_name, backend=superdesk.get_backend())
     PublishedPlanningResource(endpoint_name, app=app, service=planning_published_service)
 
+    endpoint_name = 'planning_checkpoints'
+    planning_checkpoints_service = PlanningCheckpointsService(endpoint_name, backend=superdesk.get_backend())
+    PlanningCheckpointsResource(endpoint_name, app=app, service=planning_checkpoints_service)
+
+    endpoint_name = 'planning_lock_metrics'
+    planning_lock_metrics_service = PlanningLockMetricsService(endpoint_name, backend=superdesk.get_backend())
+    PlanningLockMetricsResource(endpoint_name, app=app, service=planning_lock_metrics_service)
+
+    endpoint_name = 'planning_email_digest'
+    planning_email_digest_service = PlanningEmailDigestService(endpoint_name, backend=superdesk.get_backend())
+    PlanningEmailDigestResource(endpoint_name, app=app, service=planning_email_digest_service)
+
+    endpoint_name = 'ingest_file_manifest'
+    ingest_file_manifest_service = IngestFileManifestService(endpoint_name, backend=superdesk.get_backend())
+    IngestFileManifestResource(endpoint_name, app=app, service=ingest_file_manifest_service)
+
     superdesk.privilege(
         name='planning',
         label='Planning',
@@ -103,6 +132,14 @@ def init_app(app):
         'category': 'notifications'
     })
 
+    superdesk.register_default_user_preference('planning:email_digest', {
+        'type': 'bool',
+        'enabled': False,
+        'default': False,
+        'label': 'Receive Assignment Emails As A Digest',
+        'category': 'notifications'
+    })
+
     superdesk.register_default_user_preference('planning:calendar', {
         'type': 'dict',
         'label': 'Default Calendar',
@@ -185,6 +222,13 @@ def init_app(app):
             'schedule': timedelta(seconds=60)  # Runs once every minute
         }
 
+    if app.config.get('PLANNING_EMAIL_DIGEST_MINUTES', 0) != 0 and \
+            not app.config['CELERY_BEAT_SCHEDULE'].get('planning:email_digests'):
+        app.config['CELERY_BEAT_SCHEDULE']['planning:email_digests'] = {
+            'task': 'planning.send_email_digests',
+            'schedule': timedelta(seconds=60)  # Runs once every minute
+        }
+
     # Create 'type' required for planning module if not already preset
     with app.app_context():
         vocabulary_service = superdesk.get_resource_service('vocabularies')
@@ -212,6 +256,7 @@ def init_app(app):
         custom_loaders = jinja2.ChoiceLoader(app.jinja_loader.loaders + [jinja2.FileSystemLoader(
             os.path.join(os.path.dirname(os.path.realpath(__file__)), 'templates'))])
         app.jinja_loader = custom_loaders
+        preload_notification_templates(app)
 
 
 @celery.task(soft_time_limit=600)
@@ -227,3 +272,8 @@ def delete_spiked():
 @celery.task(soft_time_limit=600)
 def delete_assignments():
     DeleteMarkedAssignments().run()
+
+
+@celery.task(soft_time_limit=600)
+def send_email_digests():
+    _send_email_digests()
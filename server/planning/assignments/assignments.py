@@ -31,9 +31,10 @@ from planning.item_lock import LockService, LOCK_USER, LOCK_ACTION
 from superdesk.users.services import current_user_has_privilege
 from planning.common import ASSIGNMENT_WORKFLOW_STATE, assignment_workflow_state, remove_lock_information, \
     is_locked_in_this_session, get_coverage_type_name, get_version_item_for_post, \
-    enqueue_planning_item, WORKFLOW_STATE
+    enqueue_planning_item, WORKFLOW_STATE, bulk_delete, get_id_lookup
 from flask import request, json, current_app as app
 from planning.planning_notifications import PlanningNotifications
+from planning.reference_cache import get_reference_item
 from apps.content import push_content_notification
 from .assignments_history import ASSIGNMENT_HISTORY_ACTIONS
 
@@ -273,11 +274,11 @@ class AssignmentsService(superdesk.Service):
         user = get_user()
 
         # Determine the name of the desk that the assigment has been allocated to
-        assigned_to_desk = get_resource_service('desks').find_one(req=None, _id=assigned_to.get('desk'))
+        assigned_to_desk = get_reference_item('desks', assigned_to.get('desk'))
         desk_name = assigned_to_desk.get('name') if assigned_to_desk else 'Unknown'
 
         # Determine the display name of the assignee
-        assigned_to_user = get_resource_service('users').find_one(req=None, _id=assigned_to.get('user'))
+        assigned_to_user = get_reference_item('users', assigned_to.get('user'))
         assignee = assigned_to_user.get('display_name') if assigned_to_user else 'Unknown'
 
         coverage_type = updates.get('planning', original.get('planning', {})).get('g2_content_type', '')
@@ -293,7 +294,7 @@ class AssignmentsService(superdesk.Service):
             event_item = get_resource_service('events').find_one(req=None, _id=planning_item.get('event_item'))
             contacts = []
             for contact_id in event_item.get('event_contact_info', []):
-                contact_details = get_resource_service('contacts').find_one(req=None, _id=contact_id)
+                contact_details = get_reference_item('contacts', contact_id)
                 if contact_details:
                     contacts.append(contact_details)
             if len(contacts):
@@ -322,13 +323,10 @@ class AssignmentsService(superdesk.Service):
                     if original.get('assigned_to') and original.get('assigned_to').get('desk') != updates.get(
                             'assigned_to').get('desk'):
                         # Determine the name of the desk that the assigment was allocated to
-                        assigned_from_desk = get_resource_service('desks').find_one(req=None,
-                                                                                    _id=original.get('assigned_to').get(
-                                                                                        'desk'))
+                        assigned_from_desk = get_reference_item('desks', original.get('assigned_to').get('desk'))
                         desk_from_name = assigned_from_desk.get('name') if assigned_from_desk else 'Unknown'
                         assigned_from = original.get('assigned_to')
-                        assigned_from_user = get_resource_service('users').find_one(req=None,
-                                                                                    _id=assigned_from.get('user'))
+                        assigned_from_user = get_reference_item('users', assigned_from.get('user'))
                         old_assignee = assigned_from_user.get('display_name') if assigned_from_user else ''
                         PlanningNotifications().notify_assignment(target_desk=assigned_to.get('desk'),
                                                                   target_desk2=original.get('assigned_to').get('desk'),
@@ -366,8 +364,7 @@ class AssignmentsService(superdesk.Service):
                                                                   omit_user=True)
                         # notify the assignee
                         assigned_from = original.get('assigned_to')
-                        assigned_from_user = get_resource_service('users').find_one(req=None,
-                                                                                    _id=assigned_from.get('user'))
+                        assigned_from_user = get_reference_item('users', assigned_from.get('user'))
                         old_assignee = assigned_from_user.get('display_name') if assigned_from_user else None
                         PlanningNotifications().notify_assignment(target_user=assigned_to.get('user'),
                                                                   message='assignment_reassigned_4_msg',
@@ -403,8 +400,7 @@ class AssignmentsService(superdesk.Service):
             if original.get('assigned_to') and original.get('assigned_to').get('desk') != updates.get(
                     'assigned_to', {}).get('desk'):
                 # Determine the name of the desk that the assigment was allocated to
-                assigned_from_desk = get_resource_service('desks').find_one(req=None,
-                                                                            _id=original.get('assigned_to').get('desk'))
+                assigned_from_desk = get_reference_item('desks', original.get('assigned_to').get('desk'))
                 desk_from_name = assigned_from_desk.get('name') if assigned_from_desk else 'Unknown'
 
                 PlanningNotifications().notify_assignment(target_desk=assigned_to.get('desk'),
@@ -449,7 +445,7 @@ class AssignmentsService(superdesk.Service):
         slugline = assignment.get('planning').get('slugline', '')
         coverage_type = assignment.get('planning').get('g2_content_type', '')
 
-        desk = get_resource_service('desks').find_one(req=None, _id=assigned_to.get('desk'))
+        desk = get_reference_item('desks', assigned_to.get('desk'))
         if event_cancellation:
             PlanningNotifications().notify_assignment(target_user=assigned_to.get('user'),
                                                       target_desk=assigned_to.get('desk') if not assigned_to.get(
@@ -592,8 +588,7 @@ class AssignmentsService(superdesk.Service):
                     # publish planning
                     self.publish_planning(assignment_update_data.get('assignment').get('planning_item'))
 
-                    assigned_to_user = get_resource_service('users').find_one(req=None,
-                                                                              _id=get_user().get(config.ID_FIELD, ''))
+                    assigned_to_user = get_reference_item('users', get_user().get(config.ID_FIELD, ''))
                     assignee = assigned_to_user.get('display_name') if assigned_to_user else 'Unknown'
                     target_user = assignment_update_data['assignment'].get('assigned_to', {}).get('assignor_desk')
                     PlanningNotifications().notify_assignment(target_user=target_user,
@@ -785,50 +780,94 @@ class AssignmentsService(superdesk.Service):
             * Delete the Delivery record associated with the Assignment & Archive items (if linked)
             * Removing 'assigned_to' dictionary from the associated Coverage
         """
+        self.on_deleted_many([doc])
+
+    def on_deleted_many(self, docs):
+        """Clean up after a batch of deleted Assignments, see `on_deleted`
+
+        The linked Archive items and their Delivery records are updated with one query each for the whole batch
+        """
         archive_service = get_resource_service('archive')
         delivery_service = get_resource_service('delivery')
         planning_service = get_resource_service('planning')
-        assignment_id = doc.get(config.ID_FIELD)
+        assignment_ids = [doc.get(config.ID_FIELD) for doc in docs]
 
         # If we have a Content Item linked, then we need to remove the
         # assignment_id from it and remove the delivery record
         # Then send a notification that the content has been updated
-        archive_item = archive_service.find_one(req=None, assignment_id=assignment_id)
-        if archive_item:
-            archive_service.system_update(
-                archive_item[config.ID_FIELD],
-                {'assignment_id': None},
-                archive_item
-            )
+        archive_items = {}
+        for archive_item in archive_service.find({'assignment_id': {'$in': get_id_lookup(assignment_ids)}}):
+            archive_items.setdefault(str(archive_item['assignment_id']), archive_item)
+
+        if archive_items:
+            for archive_item in archive_items.values():
+                archive_service.system_update(
+                    archive_item[config.ID_FIELD],
+                    {'assignment_id': None},
+                    archive_item
+                )
 
-            delivery_service.delete_action(lookup={
+            delivery_service.delete_action(lookup={'$or': [{
                 'assignment_id': ObjectId(assignment_id),
                 'item_id': archive_item[config.ID_FIELD]
-            })
+            } for assignment_id, archive_item in archive_items.items()]})
 
             # Push content nofitication so connected clients can update the
             # content views (i.e. removes the Calendar icon from Monitoring)
-            push_content_notification([archive_item])
-
-        # Remove assignment information from coverage
-        updated_planning = planning_service.remove_assignment(doc, unlock_planning=True)
-
-        # Finally send a notification to connected clients that the Assignment
-        # has been removed
-        if updated_planning and updated_planning.get('state') not in [WORKFLOW_STATE.KILLED, WORKFLOW_STATE.SPIKED]:
-            push_notification(
-                'assignments:removed',
-                item=archive_item[config.ID_FIELD] if archive_item else None,
-                assignment=assignment_id,
-                planning=doc.get('planning_item'),
-                coverage=doc.get('coverage_item'),
-                planning_etag=updated_planning.get(config.ETAG),
-                session=get_auth().get('_id')
-            )
+            push_content_notification(list(archive_items.values()))
+
+        plannings_to_publish = []
+        for doc in docs:
+            assignment_id = doc.get(config.ID_FIELD)
+            archive_item = archive_items.get(str(assignment_id))
+
+            # Remove assignment information from coverage
+            updated_planning = planning_service.remove_assignment(doc, unlock_planning=True)
+
+            # Finally send a notification to connected clients that the Assignment
+            # has been removed
+            if updated_planning and updated_planning.get('state') not in [WORKFLOW_STATE.KILLED, WORKFLOW_STATE.SPIKED]:
+                push_notification(
+                    'assignments:removed',
+                    item=archive_item[config.ID_FIELD] if archive_item else None,
+                    assignment=assignment_id,
+                    planning=doc.get('planning_item'),
+                    coverage=doc.get('coverage_item'),
+                    planning_etag=updated_planning.get(config.ETAG),
+                    session=get_auth().get('_id')
+                )
+
+            if not doc.get('_to_delete') and doc.get('planning_item') not in plannings_to_publish:
+                plannings_to_publish.append(doc.get('planning_item'))
+
+        # publish planning
+        for planning_id in plannings_to_publish:
+            self.publish_planning(planning_id)
+
+    def delete_assignments(self, docs):
+        """Delete a batch of Assignments
+
+        Each Assignment is validated with `on_delete`, then the valid ones are deleted with one bulk delete
+        and cleaned up with `on_deleted_many`
+
+        :param list docs: the Assignments to delete
+        :return tuple: the deleted Assignments and the ids of the ones that failed validation
+        """
+        deleted = []
+        failed = []
+        for doc in docs:
+            try:
+                self.on_delete(doc)
+                deleted.append(doc)
+            except SuperdeskApiError as e:
+                logger.warning('Failed to delete assignment {}: {}'.format(doc.get(config.ID_FIELD), e))
+                failed.append(doc.get(config.ID_FIELD))
+
+        if deleted:
+            bulk_delete(self.datasource, [doc[config.ID_FIELD] for doc in deleted])
+            self.on_deleted_many(deleted)
 
-        if not doc.get('_to_delete'):
-            # publish planning
-            self.publish_planning(doc.get('planning_item'))
+        return deleted, failed
 
     def is_assignment_draft(self, updates, original):
         return updates.get('assigned_to', original.get('assigned_to')).get('state') ==\
@@ -840,7 +879,7 @@ class AssignmentsService(superdesk.Service):
 
     def is_text_assignment(self, assignment):
         text_assignment = False
-        content_types = get_resource_service('vocabularies').find_one(req=None, _id='g2_content_type')
+        content_types = get_reference_item('vocabularies', 'g2_content_type')
         if content_types:
             content_type = [t for t in (content_types.get('items') or [])
                             if t.get('qcode') == assignment.get('planning', {}).get('g2_content_type')]
@@ -987,6 +1026,7 @@ class AssignmentsResource(superdesk.Resource):
         'coverage_item_1': ([('coverage_item', 1)], {'background': True}),
         'planning_item_1': ([('planning_item', 1)], {'background': True}),
         'published_state_1': ([('published_state', 1)], {'background': True}),
+        'lock_session_1': ([('lock_session', 1)], {'background': True}),
     }
 
     datasource = {
@@ -9,7 +9,6 @@
 """Superdesk Files"""
 
 from superdesk import Resource, get_resource_service
-from copy import deepcopy
 from planning.history import HistoryService
 import logging
 from eve.utils import config
@@ -39,6 +38,11 @@ class AssignmentsHistoryResource(Resource):
         'update': {'type': 'dict', 'nullable': True}
     }
 
+    mongo_indexes = {
+        'assignment_id_1__created_1': ([('assignment_id', 1), ('_created', 1)], {'background': True}),
+        '_created_1': ([('_created', 1)], {'background': True}),
+    }
+
 
 class AssignmentsHistoryService(HistoryService):
 
@@ -50,10 +54,10 @@ class AssignmentsHistoryService(HistoryService):
             'update': update
         }
 
-        self.post([history])
+        self._record_history(history)
 
     def on_item_updated(self, updates, original, operation=None):
-        item = deepcopy(original)
+        item = dict(original)
         if updates:
             item.update(updates)
 
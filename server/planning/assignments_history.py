@@ -38,4 +38,4 @@ class AssignmentsHistoryService(HistoryService):
             'update': update
         }
 
-        self.post([history])
+        self._record_history(history)
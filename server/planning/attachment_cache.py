@@ -0,0 +1,103 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+"""Cache of the event files attached to assignment emails
+
+The content of an event file is read from media storage once, and reused for every email it is attached to,
+until it is evicted by the least recently used policy once the cache grows over ``PLANNING_ATTACHMENT_CACHE_SIZE``.
+"""
+
+import threading
+from collections import OrderedDict
+from flask import current_app as app
+from superdesk import get_resource_service
+
+DEFAULT_CACHE_SIZE = 50 * 1024 * 1024
+
+email_stats = {
+    'emails_sent': 0,
+    'digest_entries_queued': 0,
+    'media_bytes_read': 0,
+    'attachment_cache_hits': 0,
+    'attachment_cache_misses': 0,
+}
+
+
+def get_email_stats():
+    """Get a copy of the email counters of the current process"""
+    return dict(email_stats)
+
+
+def reset_email_stats():
+    for key in email_stats:
+        email_stats[key] = 0
+
+
+class AttachmentCache:
+    """LRU cache of the event files, limited to `max_size` bytes"""
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file_id):
+        """Get the file as a (filename, content_type, data) tuple, reading it from media storage on a miss
+
+        :param file_id: id of the events_files item
+        :return tuple: the file, or None if the events_files item doesn't exist
+        """
+        key = str(file_id)
+        with self._lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                email_stats['attachment_cache_hits'] += 1
+                return self.items[key]
+
+        event_file = get_resource_service('events_files').find_one(req=None, _id=file_id)
+        if not event_file:
+            return None
+
+        media = app.media.get(event_file['media'], resource='events_files')
+        attachment = (media.name, media.content_type, media.read())
+
+        with self._lock:
+            email_stats['attachment_cache_misses'] += 1
+            email_stats['media_bytes_read'] += len(attachment[2])
+            self._add(key, attachment)
+
+        return attachment
+
+    def _add(self, key, attachment):
+        size = len(attachment[2])
+        if size > self.max_size:
+            return
+
+        if key in self.items:
+            self.size -= len(self.items.pop(key)[2])
+
+        self.items[key] = attachment
+        self.size += size
+        while self.size > self.max_size:
+            _key, evicted = self.items.popitem(last=False)
+            self.size -= len(evicted[2])
+
+    def clear(self):
+        with self._lock:
+            self.items.clear()
+            self.size = 0
+
+
+attachment_cache = AttachmentCache()
+
+
+def configure(config):
+    attachment_cache.max_size = config.get('PLANNING_ATTACHMENT_CACHE_SIZE', DEFAULT_CACHE_SIZE)
@@ -2,3 +2,6 @@ from .flag_expired_items import FlagExpiredItems # noqa
 from .delete_spiked_items import DeleteSpikedItems # noqa
 from .delete_marked_assignments import DeleteMarkedAssignments # noqa
 from .export_to_newsroom import ExportToNewsroom # noqa
+from .populate_combined_id import PopulateCombinedId # noqa
+from .lock_contention import LockContention # noqa
+from .compact_history import CompactHistory # noqa
@@ -0,0 +1,212 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+import base64
+import zlib
+from collections import Counter
+from flask import current_app as app
+from superdesk import Command, command, Option
+from superdesk.logging import logger
+from superdesk.utc import utcnow
+from superdesk.celery_task_utils import get_lock_id
+from superdesk.lock import lock, unlock
+from datetime import timedelta
+from eve.utils import config
+from bson import json_util
+from pymongo import ASCENDING
+from planning.common import get_mongo_collection, iter_batches
+
+COMPACTED_OPERATION = 'compacted'
+
+# (history resource, field referencing the item, item resource)
+HISTORY_RESOURCES = (
+    ('events_history', 'event_id', 'events'),
+    ('planning_history', 'planning_id', 'planning'),
+    ('assignments_history', 'assignment_id', 'assignments'),
+)
+
+
+def compress_history(entries):
+    """Compress the history entries into a base64 string of zlib compressed extended json"""
+    return base64.b64encode(zlib.compress(json_util.dumps(entries).encode('utf-8'))).decode('ascii')
+
+
+def decompress_history(data):
+    """Restore the history entries compressed with `compress_history`"""
+    return json_util.loads(zlib.decompress(base64.b64decode(data)).decode('utf-8'))
+
+
+class CompactHistory(Command):
+    """
+    Compact the `events_history`, `planning_history` and `assignments_history` collections.
+
+    The history of expired items is folded into one compressed `compacted` entry per item.
+    Entries older than `PLANNING_HISTORY_ARCHIVE_DAYS` are moved to a `<collection>_archive` collection,
+    which expire after `PLANNING_HISTORY_ARCHIVE_TTL_DAYS` when set.
+
+    archive-days: Override `PLANNING_HISTORY_ARCHIVE_DAYS`, 0 disables the archiving.
+    Example:
+    ::
+
+        $ python manage.py planning:compact_history
+        $ python manage.py planning:compact_history --archive-days=365
+    """
+
+    option_list = (
+        Option('--archive-days', '-a', dest='archive_days', required=False),
+    )
+
+    # Number of items (or history entries) processed per batch
+    batch_size = 500
+
+    def run(self, archive_days=None):
+        now = utcnow()
+        self.log_msg = 'Compact History Time: {}.'.format(now)
+
+        if archive_days is None:
+            archive_days = app.config.get('PLANNING_HISTORY_ARCHIVE_DAYS', 0)
+        archive_days = int(archive_days or 0)
+        ttl_days = int(app.config.get('PLANNING_HISTORY_ARCHIVE_TTL_DAYS', 0) or 0)
+
+        lock_name = get_lock_id('planning', 'compact_history')
+        if not lock(lock_name, expire=3600):
+            logger.info('{} Compact history task is already running'.format(self.log_msg))
+            return
+
+        try:
+            size_before = self._get_size()
+            folded = archived = 0
+
+            for history_resource, id_field, item_resource in HISTORY_RESOURCES:
+                try:
+                    if item_resource != 'assignments':
+                        # Assignments are deleted rather than expired, removing their history with them
+                        folded += self._fold_expired_history(history_resource, id_field, item_resource)
+
+                    if archive_days:
+                        archived += self._archive_history(history_resource, now - timedelta(days=archive_days))
+
+                    if ttl_days:
+                        self._ensure_archive_ttl(history_resource, ttl_days)
+                except Exception as e:
+                    logger.exception(e)
+
+            reclaimed = size_before - self._get_size()
+            logger.info('{} Completed compacting history. {} entries folded, {} entries archived, '
+                        '{} bytes reclaimed in {:.2f} seconds'.format(
+                            self.log_msg, folded, archived, reclaimed, (utcnow() - now).total_seconds()))
+
+            return {'folded': folded, 'archived': archived, 'reclaimed': reclaimed}
+        finally:
+            unlock(lock_name)
+
+    def _fold_expired_history(self, history_resource, id_field, item_resource):
+        """Replace the history entries of expired items with one compressed entry per item
+
+        :return int: number of history entries folded
+        """
+        history = get_mongo_collection(history_resource)
+        expired = get_mongo_collection(item_resource).find({'expired': True}, {config.ID_FIELD: 1})
+        folded = 0
+
+        for items in iter_batches(expired, self.batch_size):
+            item_ids = [str(item[config.ID_FIELD]) for item in items]
+            entries = {}
+            for entry in history.find(
+                {id_field: {'$in': item_ids}, 'operation': {'$ne': COMPACTED_OPERATION}}
+            ).sort([(id_field, ASCENDING), ('_created', ASCENDING)]):
+                entries.setdefault(entry[id_field], []).append(entry)
+
+            if not entries:
+                continue
+
+            history.insert_many([
+                self._get_compacted_entry(id_field, item_id, item_entries)
+                for item_id, item_entries in entries.items()
+            ], ordered=False)
+            history.delete_many({
+                config.ID_FIELD: {'$in': [entry[config.ID_FIELD] for item_entries in entries.values()
+                                          for entry in item_entries]}
+            })
+            folded += sum(len(item_entries) for item_entries in entries.values())
+
+        logger.info('{} Folded {} {} entries'.format(self.log_msg, folded, history_resource))
+        return folded
+
+    @staticmethod
+    def _get_compacted_entry(id_field, item_id, entries):
+        now = utcnow()
+        return {
+            id_field: item_id,
+            'user_id': None,
+            'operation': COMPACTED_OPERATION,
+            'update': {
+                'count': len(entries),
+                'operations': dict(Counter(entry.get('operation') for entry in entries)),
+                'first_created': entries[0].get('_created'),
+                'last_created': entries[-1].get('_created'),
+                'entries': compress_history(entries),
+            },
+            '_created': entries[-1].get('_created') or now,
+            '_updated': now,
+        }
+
+    def _archive_history(self, history_resource, older_than):
+        """Move the history entries created before `older_than` to the archive collection
+
+        Compacted entries stay in place, they are the only history left for expired items.
+
+        :return int: number of history entries archived
+        """
+        history = get_mongo_collection(history_resource)
+        archive = self._get_archive_collection(history_resource)
+        archived = 0
+
+        cursor = history.find({'_created': {'$lt': older_than}, 'operation': {'$ne': COMPACTED_OPERATION}})
+        for entries in iter_batches(cursor, self.batch_size):
+            # Inserting first means an interrupted run leaves duplicates in the archive, never lost entries
+            archive.insert_many(entries, ordered=False)
+            history.delete_many({config.ID_FIELD: {'$in': [entry[config.ID_FIELD] for entry in entries]}})
+            archived += len(entries)
+
+        logger.info('{} Archived {} {} entries'.format(self.log_msg, archived, history_resource))
+        return archived
+
+    def _ensure_archive_ttl(self, history_resource, ttl_days):
+        """Create (or update) the TTL index expiring archived entries `ttl_days` after their creation"""
+        archive = self._get_archive_collection(history_resource)
+        expire_after = ttl_days * 24 * 60 * 60
+        index_name = '_created_ttl'
+
+        index = archive.index_information().get(index_name)
+        if index and index.get('expireAfterSeconds') == expire_after:
+            return
+        elif index:
+            archive.drop_index(index_name)
+
+        archive.create_index([('_created', ASCENDING)], name=index_name, expireAfterSeconds=expire_after,
+                             background=True)
+
+    @staticmethod
+    def _get_archive_collection(history_resource):
+        history = get_mongo_collection(history_resource)
+        return history.database['{}_archive'.format(history.name)]
+
+    @staticmethod
+    def _get_size():
+        """Get the total size in bytes of the history collections"""
+        size = 0
+        for history_resource, _id_field, _item_resource in HISTORY_RESOURCES:
+            history = get_mongo_collection(history_resource)
+            size += history.database.command('collStats', history.name).get('size', 0)
+        return size
+
+
+command('planning:compact_history', CompactHistory())
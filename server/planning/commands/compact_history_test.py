@@ -0,0 +1,76 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from datetime import timedelta
+from superdesk.utc import utcnow
+from planning.tests import TestCase
+from planning.common import get_mongo_collection
+from .compact_history import CompactHistory, COMPACTED_OPERATION, decompress_history
+
+
+class CompactHistoryTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        now = utcnow()
+        with self.app.app_context():
+            self.app.data.insert('events', [
+                {'_id': 'e1', 'guid': 'e1', 'name': 'expired', 'expired': True,
+                 'dates': {'start': now - timedelta(days=3), 'end': now - timedelta(days=2)}},
+                {'_id': 'e2', 'guid': 'e2', 'name': 'active',
+                 'dates': {'start': now + timedelta(days=2), 'end': now + timedelta(days=3)}},
+            ])
+
+            get_mongo_collection('events_history').insert_many([
+                {'event_id': 'e1', 'operation': 'create', 'update': {'name': 'expired'},
+                 '_created': now - timedelta(days=5)},
+                {'event_id': 'e1', 'operation': 'edited', 'update': {'name': 'expired'},
+                 '_created': now - timedelta(days=4)},
+                {'event_id': 'e1', 'operation': 'edited', 'update': {'definition_short': 'short'},
+                 '_created': now - timedelta(days=3)},
+                {'event_id': 'e2', 'operation': 'create', 'update': {'name': 'active'},
+                 '_created': now - timedelta(days=400)},
+                {'event_id': 'e2', 'operation': 'edited', 'update': {'name': 'active'},
+                 '_created': now - timedelta(days=1)},
+            ])
+
+    def test_fold_expired_history(self):
+        with self.app.app_context():
+            result = CompactHistory().run()
+
+            self.assertEqual(result['folded'], 3)
+            self.assertEqual(result['archived'], 0)
+            self.assertGreater(result['reclaimed'], 0)
+
+            history = list(get_mongo_collection('events_history').find({'event_id': 'e1'}))
+            self.assertEqual(len(history), 1)
+            self.assertEqual(history[0]['operation'], COMPACTED_OPERATION)
+            self.assertEqual(history[0]['update']['count'], 3)
+            self.assertEqual(history[0]['update']['operations'], {'create': 1, 'edited': 2})
+
+            entries = decompress_history(history[0]['update']['entries'])
+            self.assertEqual([entry['operation'] for entry in entries], ['create', 'edited', 'edited'])
+            self.assertEqual(entries[2]['update'], {'definition_short': 'short'})
+
+            self.assertEqual(get_mongo_collection('events_history').count({'event_id': 'e2'}), 2)
+
+            # Running again doesn't fold the compacted entry
+            self.assertEqual(CompactHistory().run()['folded'], 0)
+
+    def test_archive_old_history(self):
+        self.app.config['PLANNING_HISTORY_ARCHIVE_TTL_DAYS'] = 30
+        with self.app.app_context():
+            result = CompactHistory().run(archive_days=365)
+            self.assertEqual(result['archived'], 1)
+
+            history = get_mongo_collection('events_history')
+            archive = history.database['{}_archive'.format(history.name)]
+            self.assertEqual(history.count({'event_id': 'e2'}), 1)
+            self.assertEqual(archive.find_one({'event_id': 'e2'})['operation'], 'create')
+            self.assertEqual(archive.index_information()['_created_ttl']['expireAfterSeconds'], 30 * 24 * 60 * 60)
@@ -8,7 +8,7 @@
 # AUTHORS and LICENSE files distributed with this source code, or
 # at https://www.sourcefabric.org/superdesk/license
 
-from superdesk.errors import SuperdeskApiError
+import time
 from superdesk import Command, command, get_resource_service
 from superdesk.logging import logger
 from superdesk.utc import utcnow
@@ -31,6 +31,9 @@ class DeleteMarkedAssignments(Command):
 
     log_msg = ''
 
+    # Number of Assignments to delete in a single bulk request
+    batch_size = 500
+
     def run(self):
         now = utcnow()
         self.log_msg = 'Delete Marked Assignments Time: {}.'.format(now)
@@ -54,40 +57,32 @@ class DeleteMarkedAssignments(Command):
     def _delete_marked_assignments(self):
         logger.info('{} Starting to delete marked assignments'.format(self.log_msg))
         assignments_service = get_resource_service('assignments')
+        start = time.perf_counter()
 
-        query = {
-            'query': {
-                'filtered': {
-                    'filter': {
-                        'bool': {
-                            'must': {
-                                'term': {'_to_delete': True}
-                            },
-                        }
-                    }
-                }
-            }
-        }
-        req = ParsedRequest()
-        req.args = {'source': json.dumps(query)}
-        assignments_to_delete = assignments_service.get(req=req, lookup=None)
         failed_assignments = []
         assignments_deleted = []
-
-        for assignment in assignments_to_delete:
-            assign_id = assignment.get(config.ID_FIELD)
-            try:
-                assignments_service.delete_action(lookup={'_id': assign_id})
-                assignments_deleted.append(
-                    {
-                        'id': assign_id,
-                        'slugline': assignment.get('planning', {}).get('slugline'),
-                        'type': assignment.get('planning', {}).get('g2_content_type')
-                    }
-                )
-            except SuperdeskApiError as e:
-                logger.exception(e)
-                failed_assignments.append(assign_id)
+        processed_ids = set()
+        batches = 0
+
+        # The Assignments already processed, deleted or failed, are excluded from the query,
+        # so requesting the first page again continues after the previous page
+        while True:
+            assignments_to_delete = [
+                assignment for assignment in self._get_marked_assignments(processed_ids)
+                if str(assignment.get(config.ID_FIELD)) not in processed_ids
+            ]
+            if not assignments_to_delete:
+                break
+
+            batches += 1
+            processed_ids.update(str(assignment.get(config.ID_FIELD)) for assignment in assignments_to_delete)
+            deleted, failed = assignments_service.delete_assignments(assignments_to_delete)
+            failed_assignments.extend(failed)
+            assignments_deleted.extend({
+                'id': assignment.get(config.ID_FIELD),
+                'slugline': assignment.get('planning', {}).get('slugline'),
+                'type': assignment.get('planning', {}).get('g2_content_type')
+            } for assignment in deleted)
 
         logger.info('{} {} Assignments deleted: {}'.format(self.log_msg,
                                                            len(assignments_deleted),
@@ -105,5 +100,38 @@ class DeleteMarkedAssignments(Command):
                                                                len(failed_assignments),
                                                                str(failed_assignments)))
 
+        logger.info('{} Metrics: {}'.format(self.log_msg, json.dumps({
+            'task': 'planning:delete_assignments',
+            'deleted': len(assignments_deleted),
+            'failed': len(failed_assignments),
+            'batches': batches,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 1)
+        })))
+
+    def _get_marked_assignments(self, exclude_ids):
+        query = {
+            'query': {
+                'filtered': {
+                    'filter': {
+                        'bool': {
+                            'must': {
+                                'term': {'_to_delete': True}
+                            },
+                        }
+                    }
+                }
+            },
+            'size': self.batch_size
+        }
+        if exclude_ids:
+            query['query']['filtered']['filter']['bool']['must_not'] = {
+                'terms': {'_id': sorted(str(assignment_id) for assignment_id in exclude_ids)}
+            }
+
+        req = ParsedRequest()
+        req.args = {'source': json.dumps(query)}
+        req.max_results = self.batch_size
+        return get_resource_service('assignments').get(req=req, lookup=None)
+
 
 command('planning:delete_assignments', DeleteMarkedAssignments())
@@ -14,6 +14,7 @@ from superdesk import get_resource_service
 from superdesk.utc import utcnow
 from datetime import timedelta
 from bson import ObjectId
+from unittest import mock
 import flask
 
 now = utcnow()
@@ -70,3 +71,37 @@ class DeleteMarkedAssignmentsTest(TestCase):
 
             self.assertAssignmentDeleted(['a1', 'a2'])
             self.assertAssignmentDeleted(['a3'], True)
+
+    def test_delete_marked_assignments_in_batches(self):
+        with self.app.app_context():
+            self.app.data.insert('users', self.users)
+            self.app.data.insert('auth', self.auth)
+            self.app.data.insert('planning', [{'_id': 'p{}'.format(i)} for i in range(25)])
+            self.app.data.insert('assignments', [
+                {'_id': 'a{}'.format(i), '_to_delete': True, 'planning_item': 'p{}'.format(i)} for i in range(25)
+            ] + [{'_id': 'keep', 'planning_item': 'p0'}])
+
+            flask.g.user = self.users[0]
+            flask.g.auth = self.auth[0]
+
+            command = DeleteMarkedAssignments()
+            command.batch_size = 10
+            command.run()
+
+            self.assertAssignmentDeleted(['a{}'.format(i) for i in range(25)])
+            self.assertAssignmentDeleted(['keep'], True)
+
+    def test_stops_when_page_was_already_processed(self):
+        with self.app.app_context():
+            command = DeleteMarkedAssignments()
+            page = [{'_id': 'a1'}, {'_id': 'a2'}]
+
+            # The same page is returned again, i.e. the index wasn't refreshed yet
+            with mock.patch.object(command, '_get_marked_assignments', return_value=page) as get_marked, \
+                    mock.patch.object(self.assignment_service, 'delete_assignments',
+                                      side_effect=lambda docs: ([docs[0]], [docs[1]['_id']])) as delete_assignments:
+                command._delete_marked_assignments()
+
+            delete_assignments.assert_called_once_with(page)
+            self.assertEqual(get_marked.call_count, 2)
+            self.assertEqual(get_marked.call_args[0][0], {'a1', 'a2'})
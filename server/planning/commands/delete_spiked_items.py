@@ -16,7 +16,7 @@ from superdesk.celery_task_utils import get_lock_id
 from superdesk.lock import lock, unlock, remove_locks
 from datetime import timedelta
 from eve.utils import config
-from planning.common import WORKFLOW_STATE
+from planning.common import WORKFLOW_STATE, bulk_delete, get_id_lookup, get_mongo_collection, iter_batches
 
 
 class DeleteSpikedItems(Command):
@@ -31,6 +31,9 @@ class DeleteSpikedItems(Command):
 
     log_msg = ''
 
+    # Number of items to delete in a single bulk request
+    batch_size = 500
+
     def run(self):
         now = utcnow()
         self.log_msg = 'Delete Spiked Items Time: {}.'.format(now)
@@ -67,49 +70,70 @@ class DeleteSpikedItems(Command):
         logger.info('{} Starting to delete spiked events'.format(self.log_msg))
         events_service = get_resource_service('events')
 
-        events_deleted = set()
-        series_to_delete = dict()
-
         # Obtain the full list of Events that we're to process first
         # As subsequent queries will change the list of returned items
-        events = dict()
+        events_to_delete = []
+        recurrence_ids = set()
         for items in events_service.get_expired_items(expiry_datetime, spiked_events_only=True):
-            events.update({item[config.ID_FIELD]: item for item in items})
-
-        for event_id, event in events.items():
-            if event.get('recurrence_id') and event['recurrence_id'] not in series_to_delete:
-                spiked, events = self.is_series_expired_and_spiked(event, expiry_datetime)
-                if spiked:
-                    series_to_delete[event['recurrence_id']] = events
-            else:
-                events_service.delete_action(lookup={'_id': event_id})
-                events_deleted.add(event_id)
-
-        # Delete recurring series
-        for recurrence_id, events in series_to_delete.items():
-            events_service.delete_action(lookup={'recurrence_id': recurrence_id})
-            events_deleted.add(events)
-
-        logger.info('{} {} Events deleted: {}'.format(self.log_msg, len(events_deleted), list(events_deleted)))
-
-    def is_series_expired_and_spiked(self, event, expiry_datetime):
-        historic, past, future = get_resource_service('events').get_recurring_timeline(event, spiked=True)
-
-        # There are future events, so the entire series is not expired.
-        if len(future) > 0:
-            return False
-
-        def check_series_expired_and_spiked(series):
-            for event in series:
-                if event.get('state') != WORKFLOW_STATE.SPIKED or event['dates']['end'] > expiry_datetime:
-                    return False
-
-            return True
-
-        if check_series_expired_and_spiked(historic) and check_series_expired_and_spiked(past):
-            return True, [historic + past]
-
-        return False
+            for item in items:
+                if item.get('recurrence_id'):
+                    recurrence_ids.add(item['recurrence_id'])
+                else:
+                    events_to_delete.append(item[config.ID_FIELD])
+
+        # Each series is checked once, and deleted as a whole only if every Event in it is spiked and expired
+        series_to_delete = self._get_expired_spiked_series(recurrence_ids, expiry_datetime)
+        for event_ids in series_to_delete.values():
+            events_to_delete.extend(event_ids)
+
+        events_deleted = 0
+        for event_ids in iter_batches(events_to_delete, self.batch_size):
+            events_deleted += bulk_delete('events', event_ids)
+            get_mongo_collection('events_history').delete_many({'event_id': {'$in': get_id_lookup(event_ids)}})
+            get_mongo_collection('event_autosave').delete_many({config.ID_FIELD: {'$in': get_id_lookup(event_ids)}})
+
+        logger.info('{} {} Events deleted, including {} recurring series: {}'.format(
+            self.log_msg,
+            events_deleted,
+            len(series_to_delete),
+            list(series_to_delete.keys())
+        ))
+
+    def _get_expired_spiked_series(self, recurrence_ids, expiry_datetime):
+        """Get the ids of the Events of the series where every Event is spiked and expired
+
+        Rescheduled and cancelled Events are not considered, as they are not part of the recurring timeline.
+
+        :param recurrence_ids: ids of the series to check
+        :param datetime expiry_datetime: Events must have ended before this time
+        :return dict: the ids of the Events by the recurrence_id of the series
+        """
+        series = {}
+        for batch in iter_batches(recurrence_ids, self.batch_size):
+            series_events = {}
+            for event in get_mongo_collection('events').find(
+                {'recurrence_id': {'$in': batch}},
+                {'recurrence_id': 1, 'state': 1, 'dates.end': 1}
+            ):
+                series_events.setdefault(event['recurrence_id'], []).append(event)
+
+            for recurrence_id, events in series_events.items():
+                timeline = [event for event in events if event.get('state') not in [
+                    WORKFLOW_STATE.RESCHEDULED,
+                    WORKFLOW_STATE.CANCELLED
+                ]]
+                if all(self._is_event_expired_and_spiked(event, expiry_datetime) for event in timeline):
+                    series[recurrence_id] = [event[config.ID_FIELD] for event in events]
+
+        return series
+
+    @staticmethod
+    def _is_event_expired_and_spiked(event, expiry_datetime):
+        end = ((event.get('dates') or {}).get('end'))
+        if end is not None and end.tzinfo is None:
+            end = end.replace(tzinfo=expiry_datetime.tzinfo)
+
+        return event.get('state') == WORKFLOW_STATE.SPIKED and end is not None and end <= expiry_datetime
 
     def _delete_spiked_planning(self, expiry_datetime):
         logger.info('{} Starting to delete spiked planning items'.format(self.log_msg))
@@ -121,30 +145,31 @@ class DeleteSpikedItems(Command):
         for items in planning_service.get_expired_items(expiry_datetime, spiked_planning_only=True):
             plans.update({item[config.ID_FIELD]: item for item in items})
 
-        plans_deleted = set()
-        assignments_deleted = set()
-        assignments_to_delete = []
-
-        for plan_id, plan in plans.items():
-            for coverage in plan.get('coverages') or []:
-                assignment_id = (coverage.get('assigned_to') or {}).get('assignment_id')
-                if assignment_id:
-                    assignments_to_delete.append(assignment_id)
-
-            # Now, delete the planning item
-            planning_service.delete_action(lookup={'_id': plan_id})
-            plans_deleted.add(plan_id)
-
-        # Delete assignments
-        assignment_service = get_resource_service('assignments')
-        for assign_id in assignments_to_delete:
-            assignment_service.delete(lookup={'_id': assign_id})
-            assignments_deleted.add(assign_id)
-
-        logger.info('{} {} Assignments deleted: {}'.format(self.log_msg,
-                                                           len(assignments_deleted),
-                                                           list(assignments_deleted)))
-        logger.info('{} {} Planning items deleted: {}'.format(self.log_msg, len(plans_deleted), list(plans_deleted)))
+        plans_deleted = 0
+        assignments_deleted = 0
+
+        for plan_ids in iter_batches(plans.keys(), self.batch_size):
+            assignment_ids = [
+                (coverage.get('assigned_to') or {}).get('assignment_id')
+                for plan_id in plan_ids
+                for coverage in plans[plan_id].get('coverages') or []
+            ]
+            assignment_ids = [assignment_id for assignment_id in assignment_ids if assignment_id]
+
+            plans_deleted += bulk_delete('planning', plan_ids)
+            get_mongo_collection('planning_history').delete_many({'planning_id': {'$in': get_id_lookup(plan_ids)}})
+            get_mongo_collection('planning_autosave').delete_many({
+                config.ID_FIELD: {'$in': get_id_lookup(plan_ids)}
+            })
+
+            if assignment_ids:
+                assignments_deleted += bulk_delete('assignments', assignment_ids)
+                get_mongo_collection('assignments_history').delete_many({
+                    'assignment_id': {'$in': get_id_lookup(assignment_ids)}
+                })
+
+        logger.info('{} {} Assignments deleted'.format(self.log_msg, assignments_deleted))
+        logger.info('{} {} Planning items deleted'.format(self.log_msg, plans_deleted))
 
 
 command('planning:delete_spiked', DeleteSpikedItems())
@@ -13,7 +13,7 @@ from planning.tests import TestCase
 from superdesk import get_resource_service
 from superdesk.utc import utcnow
 from datetime import timedelta
-from planning.common import WORKFLOW_STATE
+from planning.common import WORKFLOW_STATE, get_mongo_collection
 
 now = utcnow()
 yesterday = now - timedelta(hours=48)
@@ -245,3 +245,54 @@ class DeleteSpikedItemsTest(TestCase):
             self.assertAssignmentDeleted([assignments['p4']])
 
             self.assertEqual(self.get_assignments_count(), 3)
+
+    def test_bulk_delete_cascades(self):
+        with self.app.app_context():
+            events = []
+            for series in range(10):
+                for i in range(100):
+                    events.append({
+                        '_id': 'r{}e{}'.format(series, i),
+                        'guid': 'r{}e{}'.format(series, i),
+                        'recurrence_id': 'r{}'.format(series),
+                        **expired['event']
+                    })
+            # A series with an Event that is not spiked is kept
+            events.append({'_id': 'r9draft', 'guid': 'r9draft', 'recurrence_id': 'r9', 'state': 'draft',
+                           'dates': expired['event']['dates']})
+            self.app.data.insert('events', events)
+
+            get_mongo_collection('events_history').insert_many([
+                {'event_id': 'r0e{}'.format(i), 'operation': 'spiked'} for i in range(100)
+            ] + [{'event_id': 'r9e0', 'operation': 'spiked'}])
+            get_mongo_collection('event_autosave').insert_one({'_id': 'r0e0', 'name': 'autosave'})
+
+            DeleteSpikedItems().run()
+
+            self.assertEqual(self.event_service.find({'recurrence_id': {'$in': ['r0', 'r8']}}).count(), 0)
+            self.assertEqual(self.event_service.find({'recurrence_id': 'r9'}).count(), 101)
+            self.assertEqual(get_mongo_collection('events_history').count(), 1)
+            self.assertEqual(get_mongo_collection('event_autosave').count(), 0)
+
+    def test_bulk_delete_planning_cascades_to_assignments(self):
+        with self.app.app_context():
+            self.app.data.insert('desks', [{'_id': 'd1', 'name': 'd1'}])
+            self.insert('planning', [
+                {'guid': 'p{}'.format(i), **expired['plan'], 'coverages': [expired['assignment_d1']]}
+                for i in range(20)
+            ])
+            assignment_ids = [
+                self.planning_service.find_one(_id='p{}'.format(i), req=None)['coverages'][0]['assigned_to'][
+                    'assignment_id']
+                for i in range(20)
+            ]
+            get_mongo_collection('assignments_history').insert_many([
+                {'assignment_id': assignment_id, 'operation': 'create'} for assignment_id in assignment_ids
+            ])
+
+            DeleteSpikedItems().run()
+
+            self.assertDeleteOperation('planning', ['p{}'.format(i) for i in range(20)])
+            self.assertAssignmentDeleted(assignment_ids)
+            self.assertEqual(get_mongo_collection('planning_history').count(), 0)
+            self.assertEqual(get_mongo_collection('assignments_history').count(), 0)
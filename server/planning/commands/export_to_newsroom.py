@@ -1,23 +1,68 @@
 import json
+import time
+import requests
+from collections import deque
+from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from threading import Lock
 
-from eve.utils import config, ParsedRequest
+from flask import current_app as app
+from eve.utils import config, ParsedRequest, date_to_str
+from dateutil.parser import parse as parse_date
+from pytz import utc
 from superdesk import Command, command, get_resource_service, Option
 from superdesk.logging import logger
 from superdesk.celery_task_utils import get_lock_id
 from superdesk.lock import lock, unlock
-from superdesk.utils import json_serialize_datetime_objectId
 from superdesk.publish.transmitters.http_push import HTTPPushService
-from planning.common import get_version_item_for_post
+from planning.common import get_version_item_for_post, get_search_after_filter
 from planning.output_formatters import JsonPlanningFormatter, JsonEventFormatter
 
 
 class NewsroomHTTPTransmitter(HTTPPushService):
+    """Pushes the formatted items to Newsroom
+
+    Connections are kept alive and shared between threads through a pooled ``requests.Session``.
+    Connection errors and 5xx responses are retried with an exponential backoff.
+    """
+
+    def __init__(self, pool_size=10, retries=3, backoff=0.5, timeout=30):
+        super().__init__()
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
     def transmit(self, queue_item):
+        """Push the item, returning True if it was transmitted"""
         try:
-            self._transmit(queue_item, None)
+            self._post(queue_item['destination']['config']['resource_url'], queue_item['formatted_item'])
             logger.info('Successfully transmitted item {}'.format(queue_item.get('item_id')))
+            return True
         except Exception:
             logger.exception("Failed to transmit the item {}.".format(queue_item.get('item_id')))
+            return False
+
+    def _post(self, resource_url, data):
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.post(
+                    resource_url,
+                    data=data,
+                    headers={'Content-Type': 'application/json'},
+                    timeout=self.timeout
+                )
+                if response.status_code < 500 or attempt == self.retries:
+                    response.raise_for_status()
+                    return
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == self.retries:
+                    raise
+
+            time.sleep(self.backoff * (2 ** attempt))
 
 
 class ExportToNewsroom(Command):
@@ -27,19 +72,40 @@ class ExportToNewsroom(Command):
     resource-url: resource url of the Newsroom website
     assets-url: assets url of the Newsroom website
     page-size: No. of documents to process in a batch. Default is 200.
+    workers: No. of threads formatting the pages of documents. Default is 2.
+    concurrency: No. of documents being transmitted at the same time. Default is 4.
+    incremental: Only export the documents updated since the last incremental export.
+    since: Only export the documents updated since this date, overriding the last incremental export.
+    dry-run: Log the No. of documents that would be exported, without exporting them.
     Example:
     ::
 
         $ python manage.py planning:export_to_newsroom --resource-url=http://<host>:<port>/<path>
-        --assets-url=http://<host>:<port>/<path> --page-size=200
+        --assets-url=http://<host>:<port>/<path> --page-size=200 --workers=2 --concurrency=4
+
+        $ python manage.py planning:export_to_newsroom --resource-url=http://<host>:<port>/<path>
+        --assets-url=http://<host>:<port>/<path> --incremental
+
+        $ python manage.py planning:export_to_newsroom --resource-url=http://<host>:<port>/<path>
+        --assets-url=http://<host>:<port>/<path> --since=2018-06-01T00:00:00 --dry-run
     """
 
     option_list = (
         Option('--resource-url', '-u', dest='resource_url', required=True),
         Option('--assets-url', '-a', dest='assets_url', required=True),
         Option('--page-size', '-p', dest='size', required=False),
+        Option('--workers', '-w', dest='workers', required=False),
+        Option('--concurrency', '-c', dest='concurrency', required=False),
+        Option('--incremental', '-i', dest='incremental', action='store_true', default=False),
+        Option('--since', '-s', dest='since', required=False),
+        Option('--dry-run', '-d', dest='dry_run', action='store_true', default=False),
     )
     page_size = 200
+    workers = 2
+    concurrency = 4
+    incremental = False
+    since = None
+    dry_run = False
 
     # dummy subscriber
     subscriber = {
@@ -50,12 +116,22 @@ class ExportToNewsroom(Command):
     resource_url = None
     assets_url = None
 
-    def run(self, resource_url, assets_url, size=None):
+    def run(self, resource_url, assets_url, size=None, workers=None, concurrency=None, incremental=False,
+            since=None, dry_run=False):
         logger.info('Starting to export content')
 
         if size:
-            self.page_size = size
+            self.page_size = int(size)
+
+        if workers:
+            self.workers = int(workers)
+
+        if concurrency:
+            self.concurrency = int(concurrency)
 
+        self.incremental = incremental
+        self.since = self._parse_since(since) if since else None
+        self.dry_run = dry_run
         self.resource_url = resource_url
         self.assets_url = assets_url
 
@@ -74,8 +150,12 @@ class ExportToNewsroom(Command):
 
         logger.info('Completed export events and planning.')
 
-    def _fetch_items(self, fetch_callback):
-        """"""
+    @staticmethod
+    def _parse_since(since):
+        since = parse_date(since)
+        return since if since.tzinfo else since.replace(tzinfo=utc)
+
+    def _get_query(self, since=None):
         query = {
             'query': {
                 'bool': {
@@ -86,70 +166,198 @@ class ExportToNewsroom(Command):
                 }
             },
             'sort': [
-                {'versioncreated': {'order': 'asc'}}
+                {'versioncreated': {'order': 'asc'}},
+                {'guid': {'order': 'asc'}}
             ],
-            'size': 0
+            'size': self.page_size
         }
+
+        if since:
+            query['query']['bool']['must'].append({'range': {'_updated': {'gte': date_to_str(since)}}})
+
+        return query
+
+    def _count_items(self, fetch_callback, since=None):
+        query = self._get_query(since)
+        query['size'] = 0
         req = ParsedRequest()
         req.args = {'source': json.dumps(query)}
-        cursor = fetch_callback(req=req, lookup=None)
-        total_documents = cursor.count()
-
-        if total_documents > 0:
-            query['size'] = self.page_size
-            total_pages = len(range(0, total_documents, self.page_size))
-            for page_num in range(0, total_pages):
-                query['from'] = page_num * self.page_size
-                req = ParsedRequest()
-                req.args = {'source': json.dumps(query)}
-                cursor = fetch_callback(req=req, lookup=None)
-                yield list(cursor)
+        return fetch_callback(req=req, lookup=None).count()
+
+    def _fetch_items(self, fetch_callback, since=None):
+        """Fetch the published items, page by page
+
+        Each page is requested after the last item of the previous page (sorted on versioncreated and guid)
+
+        :param fetch_callback: callback to get the items from elastic
+        :param datetime since: only fetch the items updated since this date
+        """
+        query = self._get_query(since)
+        last_item = None
+
+        while True:
+            page_query = deepcopy(query)
+            if last_item:
+                page_query['query']['bool']['must'].append(
+                    get_search_after_filter('versioncreated', last_item.get('versioncreated'), last_item.get('guid'))
+                )
+
+            req = ParsedRequest()
+            req.args = {'source': json.dumps(page_query)}
+            items = list(fetch_callback(req=req, lookup=None))
+            if not items:
+                break
+
+            yield items
+
+            if len(items) < self.page_size:
+                break
+
+            last_item = items[-1]
 
     def _export_events(self):
         """Export events"""
-        logger.info('Starting to export events')
-        events_service = get_resource_service('events')
-
-        formatter = JsonEventFormatter()
-        destination = self._get_destination('json_event')
-        formatter.set_destination(destination=destination, subscriber=self.subscriber)
-        transmitter = NewsroomHTTPTransmitter()
-        for items in self._fetch_items(events_service.get):
-            for item in items:
-                try:
-                    logger.info('Processing event item: {}'.format(item.get('_id')))
-                    version, event = get_version_item_for_post(item)
-                    queue_item = self._get_queue_item(event, formatter._format_item, destination)
-                    transmitter.transmit(queue_item)
-                    logger.info('Processing processed item: {}'.format(item.get('_id')))
-                except Exception:
-                    logger.exception('Failed to export event: {}'.format(item.get('_id')))
+        self._export_resource('events', JsonEventFormatter(), 'event')
 
     def _export_planning(self):
-        """Export events"""
-        logger.info('Starting to export planning')
-        planning_service = get_resource_service('planning')
+        """Export planning"""
+        self._export_resource('planning', JsonPlanningFormatter(), 'planning')
+
+    def _export_resource(self, resource, formatter, item_type):
+        """Export the items of the resource
+
+        In incremental mode only the items updated since the high-water mark of the last export are exported,
+        and the mark is moved to the latest ``_updated`` exported once all items were transmitted
+
+        :param str resource: name of the resource
+        :param formatter: formatter of the items
+        :param str item_type: type of the items, used for logging
+        """
+        service = get_resource_service(resource)
+        checkpoint = 'export_to_newsroom_{}'.format(resource)
+        checkpoints_service = get_resource_service('planning_checkpoints')
 
-        formatter = JsonPlanningFormatter()
-        destination = self._get_destination('json_planning')
+        since = self.since
+        if not since and self.incremental:
+            since = (checkpoints_service.get_checkpoint(checkpoint) or {}).get('_updated')
+
+        if since:
+            logger.info('Exporting {} items updated since {}'.format(item_type, since))
+
+        if self.dry_run:
+            logger.info('Dry run: {} {} items would be exported'.format(
+                self._count_items(service.get, since),
+                item_type
+            ))
+            return
+
+        progress = self._export(service, formatter, item_type, since)
+
+        if not (self.incremental or self.since) or not progress.last_updated:
+            return
+        elif progress.counts['failed']:
+            logger.warning('Not moving the {} high-water mark, {} items failed to export'.format(
+                item_type,
+                progress.counts['failed']
+            ))
+        else:
+            checkpoints_service.set_checkpoint(checkpoint, {'_updated': progress.last_updated})
+
+    def _export(self, service, formatter, item_type, since=None):
+        """Export the items through a pipeline of fetching, formatting and transmitting
+
+        Pages are fetched on the current thread, formatted by a pool of ``workers`` threads and
+        the items are then transmitted by a pool of ``concurrency`` threads. No more than ``workers``
+        pages are formatted ahead of the transmission.
+
+        :param service: service of the resource to export
+        :param formatter: formatter of the items
+        :param str item_type: type of the items, used for logging
+        :param datetime since: only export the items updated since this date
+        :return ExportProgress: the counters of the export
+        """
+        logger.info('Starting to export {}'.format(item_type))
+
+        destination = self._get_destination(formatter.format_type)
         formatter.set_destination(destination=destination, subscriber=self.subscriber)
-        transmitter = NewsroomHTTPTransmitter()
-        for items in self._fetch_items(planning_service.get):
-            for item in items:
-                try:
-                    logger.info('Processing planning item: {}'.format(item.get('_id')))
-                    version, plan = get_version_item_for_post(item)
-                    queue_item = self._get_queue_item(plan, formatter._format_item, destination)
-                    transmitter.transmit(queue_item)
-                    logger.info('Processed planning item: {}'.format(item.get('item_id')))
-                except Exception:
-                    logger.exception('Failed to export planning item: {}'.format(item.get('_id')))
-
-    def _get_queue_item(self, item, format_callback, destination):
+        transmitter = NewsroomHTTPTransmitter(pool_size=self.concurrency)
+        flask_app = app._get_current_object()
+        progress = ExportProgress(item_type)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as format_pool, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as transmit_pool:
+            formatting = deque()
+            transmitting = set()
+
+            def transmit_next_page():
+                for item, formatted_item in formatting.popleft().result():
+                    queue_item = self._get_queue_item(item, formatted_item, destination)
+                    transmitting.add(transmit_pool.submit(self._transmit_item, transmitter, queue_item, progress))
+
+                # Wait for the transmissions to catch up before formatting any more pages
+                while len(transmitting) > self.concurrency * 2:
+                    done, not_done = wait(transmitting, return_when=FIRST_COMPLETED)
+                    transmitting.difference_update(done)
+
+            for items in self._fetch_items(service.get, since):
+                progress.add('fetched', len(items))
+                progress.set_last_updated(items)
+                formatting.append(format_pool.submit(
+                    self._format_items,
+                    flask_app,
+                    formatter,
+                    [get_version_item_for_post(item)[1] for item in items],
+                    progress
+                ))
+
+                while len(formatting) > self.workers:
+                    transmit_next_page()
+
+            while formatting:
+                transmit_next_page()
+
+            wait(transmitting)
+
+        progress.report()
+        return progress
+
+    def _format_items(self, flask_app, formatter, items, progress):
+        """Format a page of items in one batch
+
+        If the batch fails to format, the items are formatted one at a time so only the failing items are skipped
+
+        :return list: list of (item, formatted_item) tuples
+        """
+        with flask_app.app_context():
+            try:
+                formatted_items = list(zip(items, formatter.format_batch(items)))
+            except Exception:
+                logger.exception('Failed to format the batch of {} items, formatting them one at a time'.format(
+                    progress.item_type
+                ))
+                formatted_items = []
+                for item in items:
+                    try:
+                        formatted_items.append((item, formatter.format_batch([item])[0]))
+                    except Exception:
+                        logger.exception('Failed to format {} item: {}'.format(progress.item_type, item.get('item_id')))
+
+        progress.add('formatted', len(formatted_items))
+        progress.add('failed', len(items) - len(formatted_items))
+        return formatted_items
+
+    @staticmethod
+    def _transmit_item(transmitter, queue_item, progress):
+        if transmitter.transmit(queue_item) is False:
+            progress.add('failed')
+        else:
+            progress.add('transmitted')
+
+    def _get_queue_item(self, item, formatted_item, destination):
         """Get the queue item
 
         :param dict item: item to transmit
-        :param func format_callback: callback to format the item
+        :param str formatted_item: the item formatted to json
         :param dict destination: destination for the queue item
         """
         return {
@@ -157,7 +365,7 @@ class ExportToNewsroom(Command):
             'item_version': item.get(config.VERSION),
             'subscriber_id': self.subscriber.get('_id'),
             'destination': destination,
-            'formatted_item': json.dumps(format_callback(item), default=json_serialize_datetime_objectId),
+            'formatted_item': formatted_item,
             'content_type': item.get('type')
         }
 
@@ -177,4 +385,38 @@ class ExportToNewsroom(Command):
         }
 
 
+class ExportProgress:
+    """Thread safe counters of the items processed by the export"""
+
+    def __init__(self, item_type):
+        self.item_type = item_type
+        self.counts = {'fetched': 0, 'formatted': 0, 'transmitted': 0, 'failed': 0}
+        self.started = time.perf_counter()
+        self.last_updated = None
+        self._lock = Lock()
+
+    def set_last_updated(self, items):
+        """Keep track of the latest ``_updated`` of the fetched items"""
+        for item in items:
+            updated = item.get(config.LAST_UPDATED)
+            if updated and (self.last_updated is None or updated > self.last_updated):
+                self.last_updated = updated
+
+    def add(self, name, count=1):
+        with self._lock:
+            self.counts[name] += count
+
+    def report(self):
+        duration = time.perf_counter() - self.started
+        logger.info(
+            'Exported {transmitted} of {fetched} {item_type} items ({formatted} formatted, {failed} failed) '
+            'in {duration:.2f} seconds ({throughput:.1f} items/sec)'.format(
+                item_type=self.item_type,
+                duration=duration,
+                throughput=self.counts['transmitted'] / duration if duration else 0,
+                **self.counts
+            )
+        )
+
+
 command('planning:export_to_newsroom', ExportToNewsroom())
@@ -8,8 +8,12 @@
 # AUTHORS and LICENSE files distributed with this source code, or
 # at https://www.sourcefabric.org/superdesk/license
 import mock
+import json
 from datetime import timedelta
-from .export_to_newsroom import ExportToNewsroom
+from itertools import islice
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from .export_to_newsroom import ExportToNewsroom, NewsroomHTTPTransmitter
 from superdesk import get_resource_service
 from superdesk.utc import utcnow
 from planning.tests import TestCase
@@ -26,6 +30,23 @@ class MockTransmitter:
             self.planning.append(queue_item.get('item_id'))
 
 
+class StubNewsroomHandler(BaseHTTPRequestHandler):
+    """Records the pushed items, failing the first request of every item listed in `fail_once`"""
+
+    def do_POST(self):
+        item = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        if item['_id'] in self.server.fail_once:
+            self.server.fail_once.remove(item['_id'])
+            self.send_response(503)
+        else:
+            self.server.received.append((item['type'], item['_id']))
+            self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
 class ExportToNewsroomTest(TestCase):
 
     def setUp(self):
@@ -231,3 +252,97 @@ class ExportToNewsroomTest(TestCase):
 
             for item_id in mock_transmitter.return_value.planning:
                 self.assertIn(item_id, valid_ids)
+
+    def start_stub_server(self, fail_once=None):
+        server = HTTPServer(('127.0.0.1', 0), StubNewsroomHandler)
+        server.received = []
+        server.fail_once = set(fail_once or [])
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, 'http://127.0.0.1:{}/push'.format(server.server_port)
+
+    def test_export_to_stub_server(self):
+        with self.app.app_context():
+            self.setUp_data()
+            server, url = self.start_stub_server()
+
+            ExportToNewsroom().run(assets_url='foo', resource_url=url, size=2, workers=2, concurrency=3)
+
+            valid_ids = ['scheduled', 'postponed', 'rescheduled']
+            self.assertEqual(
+                sorted(server.received),
+                sorted([('event', item_id) for item_id in valid_ids] + [('planning', item_id) for item_id in valid_ids])
+            )
+
+    def test_transmitter_retries_server_errors(self):
+        server, url = self.start_stub_server(fail_once=['e1'])
+        transmitter = NewsroomHTTPTransmitter(backoff=0)
+        queue_item = {
+            'item_id': 'e1',
+            'destination': {'config': {'resource_url': url}},
+            'formatted_item': json.dumps({'_id': 'e1', 'type': 'event'})
+        }
+
+        self.assertTrue(transmitter.transmit(queue_item))
+        self.assertEqual(server.received, [('event', 'e1')])
+
+        transmitter = NewsroomHTTPTransmitter(backoff=0, retries=0)
+        server.fail_once.add('e2')
+        queue_item['item_id'] = 'e2'
+        queue_item['formatted_item'] = json.dumps({'_id': 'e2', 'type': 'event'})
+        self.assertFalse(transmitter.transmit(queue_item))
+
+    def test_incremental_export(self):
+        with self.app.app_context():
+            self.setUp_data()
+            server, url = self.start_stub_server()
+            checkpoints_service = get_resource_service('planning_checkpoints')
+
+            # Nothing was updated since the last export
+            last_export = utcnow() + timedelta(hours=1)
+            checkpoints_service.set_checkpoint('export_to_newsroom_events', {'_updated': last_export})
+            checkpoints_service.set_checkpoint('export_to_newsroom_planning', {'_updated': last_export})
+            ExportToNewsroom().run(assets_url='foo', resource_url=url, incremental=True)
+            self.assertEqual(server.received, [])
+
+            original = self.event_service.find_one(req=None, _id='scheduled')
+            updated = (last_export + timedelta(hours=1)).replace(microsecond=0)
+            self.app.data.update('events', 'scheduled', {'_updated': updated}, original)
+
+            ExportToNewsroom().run(assets_url='foo', resource_url=url, incremental=True)
+            self.assertEqual(server.received, [('event', 'scheduled')])
+            self.assertEqual(
+                checkpoints_service.get_checkpoint('export_to_newsroom_events')['_updated'].replace(tzinfo=None),
+                updated.replace(tzinfo=None)
+            )
+
+    def test_items_sharing_versioncreated_across_pages(self):
+        with self.app.app_context():
+            # i.e. the occurrences of a recurring series, created in the same request
+            versioncreated = utcnow().replace(microsecond=123456)
+            self.app.data.insert('events', [{
+                '_id': 'e{}'.format(i),
+                'guid': 'e{}'.format(i),
+                'dates': {'start': versioncreated, 'end': versioncreated + timedelta(hours=1), 'tz': 'UTC'},
+                'name': 'event_name',
+                'state': 'scheduled',
+                'pubstatus': 'usable',
+                'type': 'event',
+                'versioncreated': versioncreated + timedelta(milliseconds=i // 2)
+            } for i in range(5)])
+
+            command = ExportToNewsroom()
+            command.page_size = 2
+            pages = list(islice(command._fetch_items(self.event_service.get), 10))
+            self.assertEqual([len(page) for page in pages], [2, 2, 1])
+            self.assertEqual([item['_id'] for page in pages for item in page], ['e{}'.format(i) for i in range(5)])
+
+    def test_dry_run(self):
+        with self.app.app_context():
+            self.setUp_data()
+            server, url = self.start_stub_server()
+
+            ExportToNewsroom().run(assets_url='foo', resource_url=url, dry_run=True, since='2000-01-01T00:00:00')
+            self.assertEqual(server.received, [])
+            self.assertIsNone(get_resource_service('planning_checkpoints').get_checkpoint('export_to_newsroom_events'))
@@ -18,6 +18,7 @@ from superdesk.notification import push_notification
 from datetime import timedelta, datetime
 from eve.utils import config
 from bson.objectid import ObjectId
+from planning.common import bulk_update, iter_batches
 
 
 class FlagExpiredItems(Command):
@@ -32,8 +33,17 @@ class FlagExpiredItems(Command):
 
     log_msg = ''
 
+    # Number of items to flag in a single bulk write
+    batch_size = 500
+    items_flagged = 0
+
+    # Names of the checkpoints storing the position of interrupted runs
+    events_checkpoint = 'flag_expired_events'
+    planning_checkpoint = 'flag_expired_planning'
+
     def run(self):
         now = utcnow()
+        self.items_flagged = 0
         self.log_msg = 'Expiry Time: {}.'.format(now)
         logger.info('{} Starting to remove expired content at.'.format(self.log_msg))
 
@@ -61,7 +71,13 @@ class FlagExpiredItems(Command):
 
         unlock(lock_name)
 
-        logger.info('{} Completed flagging expired items.'.format(self.log_msg))
+        duration = (utcnow() - now).total_seconds()
+        logger.info('{} Completed flagging expired items. {} items flagged in {:.2f} seconds ({:.1f} items/sec)'.format(
+            self.log_msg,
+            self.items_flagged,
+            duration,
+            self.items_flagged / duration if duration else 0
+        ))
         remove_locks()
         logger.info('{} Starting to remove expired planning versions.'.format(self.log_msg))
         self._remove_expired_published_planning()
@@ -70,33 +86,33 @@ class FlagExpiredItems(Command):
     def _flag_expired_events(self, expiry_datetime):
         logger.info('{} Starting to flag expired events'.format(self.log_msg))
         events_service = get_resource_service('events')
-        planning_service = get_resource_service('planning')
 
         locked_events = set()
         events_in_use = set()
         events_expired = set()
         plans_expired = set()
 
-        # Obtain the full list of Events that we're to process first
-        # As subsequent queries will change the list of returned items
-        events = dict()
-        for items in events_service.get_expired_items(expiry_datetime):
-            events.update({item[config.ID_FIELD]: item for item in items})
-
-        self._set_event_plans(events)
-
-        for event_id, event in events.items():
-            if event.get('lock_user'):
-                locked_events.add(event_id)
-            elif self._get_event_schedule(event) > expiry_datetime:
-                events_in_use.add(event_id)
-            else:
-                events_expired.add(event_id)
-                events_service.system_update(event_id, {'expired': True}, event)
-                for plan in event.get('_plans', []):
-                    plan_id = plan[config.ID_FIELD]
-                    planning_service.system_update(plan_id, {'expired': True}, plan)
-                    plans_expired.add(plan_id)
+        # Each page is flagged before the next one is requested, and the position is checkpointed
+        # So an interrupted run resumes after the last page that was flagged
+        for items in events_service.get_expired_items(expiry_datetime, checkpoint=self.events_checkpoint):
+            events = {item[config.ID_FIELD]: item for item in items}
+            self._set_event_plans(events)
+
+            page_events_expired = set()
+            page_plans_expired = set()
+            for event_id, event in events.items():
+                if event.get('lock_user'):
+                    locked_events.add(event_id)
+                elif self._get_event_schedule(event) > expiry_datetime:
+                    events_in_use.add(event_id)
+                else:
+                    page_events_expired.add(event_id)
+                    page_plans_expired.update(plan[config.ID_FIELD] for plan in event.get('_plans', []))
+
+            self._bulk_flag_expired('events', page_events_expired)
+            self._bulk_flag_expired('planning', page_plans_expired)
+            events_expired.update(page_events_expired)
+            plans_expired.update(page_plans_expired)
 
         if len(locked_events) > 0:
             logger.info('{} Skipping {} locked Events: {}'.format(
@@ -130,21 +146,19 @@ class FlagExpiredItems(Command):
         logger.info('{} Starting to flag expired planning items'.format(self.log_msg))
         planning_service = get_resource_service('planning')
 
-        # Obtain the full list of Planning items that we're to process first
-        # As subsequent queries will change the list of returnd items
-        plans = dict()
-        for items in planning_service.get_expired_items(expiry_datetime):
-            plans.update({item[config.ID_FIELD]: item for item in items})
-
         locked_plans = set()
         plans_expired = set()
 
-        for plan_id, plan in plans.items():
-            if plan.get('lock_user'):
-                locked_plans.add(plan_id)
-            else:
-                planning_service.system_update(plan[config.ID_FIELD], {'expired': True}, plan)
-                plans_expired.add(plan_id)
+        for items in planning_service.get_expired_items(expiry_datetime, checkpoint=self.planning_checkpoint):
+            page_plans_expired = set()
+            for plan in items:
+                if plan.get('lock_user'):
+                    locked_plans.add(plan[config.ID_FIELD])
+                else:
+                    page_plans_expired.add(plan[config.ID_FIELD])
+
+            self._bulk_flag_expired('planning', page_plans_expired)
+            plans_expired.update(page_plans_expired)
 
         if len(locked_plans) > 0:
             logger.info('{} Skipping {} locked Planning items: {}'.format(
@@ -161,6 +175,12 @@ class FlagExpiredItems(Command):
 
         logger.info('{} {} Planning items expired: {}'.format(self.log_msg, len(plans_expired), list(plans_expired)))
 
+    def _bulk_flag_expired(self, resource, ids):
+        """Flag the items as expired, in batches of bulk writes"""
+        for batch in iter_batches(sorted(ids), self.batch_size):
+            bulk_update(resource, batch, {'expired': True})
+            self.items_flagged += len(batch)
+
     @staticmethod
     def _set_event_plans(events):
         planning_service = get_resource_service('planning')
@@ -13,6 +13,7 @@ from planning.tests import TestCase
 from superdesk import get_resource_service
 from superdesk.utc import utcnow
 from datetime import timedelta
+from itertools import islice
 from bson.objectid import ObjectId
 
 now = utcnow()
@@ -375,6 +376,69 @@ class FlagExpiredItemsTest(TestCase):
                 'p16': True,
             })
 
+    def test_flag_expired_in_batches(self):
+        with self.app.app_context():
+            self.insert('events', [{'guid': 'e{}'.format(i), **expired['event']} for i in range(5)])
+            self.insert('planning', [
+                {'guid': 'p{}'.format(i), **expired['plan'], 'coverages': []} for i in range(5)
+            ])
+
+            command = FlagExpiredItems()
+            command.batch_size = 2
+            command.run()
+
+            self.assertEqual(command.items_flagged, 10)
+            self.assertExpired('events', {'e{}'.format(i): True for i in range(5)})
+            self.assertExpired('planning', {'p{}'.format(i): True for i in range(5)})
+
+    def test_resume_from_checkpoint(self):
+        with self.app.app_context():
+            planning_date = yesterday.replace(microsecond=123456)
+            self.insert('planning', [
+                {'guid': 'p{}'.format(i), 'planning_date': planning_date, 'coverages': []} for i in range(5)
+            ])
+
+            # Simulate a previous run that was interrupted after flagging up to p2
+            checkpoints_service = get_resource_service('planning_checkpoints')
+            checkpoints_service.set_checkpoint(
+                FlagExpiredItems.planning_checkpoint,
+                {'sort': planning_date, 'guid': 'p2'}
+            )
+
+            FlagExpiredItems().run()
+
+            self.assertExpired('planning', {
+                'p0': False,
+                'p1': False,
+                'p2': False,
+                'p3': True,
+                'p4': True,
+            })
+            self.assertIsNone(checkpoints_service.get_checkpoint(FlagExpiredItems.planning_checkpoint))
+
+            # The next run starts from the beginning again
+            FlagExpiredItems().run()
+            self.assertExpired('planning', {'p{}'.format(i): True for i in range(5)})
+
+    def test_page_after_sub_second_dates(self):
+        with self.app.app_context():
+            # The same second, only the milliseconds differ, and the last item is locked so it is never flagged
+            planning_date = yesterday.replace(microsecond=0)
+            self.insert('planning', [{
+                'guid': 'p{}'.format(i),
+                'planning_date': planning_date + timedelta(milliseconds=100 * i + 1),
+                'coverages': []
+            } for i in range(5)])
+            self.planning_service.system_update('p4', {'lock_user': 'user1'}, self.planning_service.find_one(
+                req=None, _id='p4'))
+
+            pages = list(islice(self.planning_service.get_expired_items(now - timedelta(hours=24)), 10))
+            self.assertEqual([plan['guid'] for page in pages for plan in page], ['p{}'.format(i) for i in range(5)])
+
+            command = FlagExpiredItems()
+            command.run()
+            self.assertExpired('planning', {'p{}'.format(i): i != 4 for i in range(5)})
+
     def test_bad_event_schedule(self):
         with self.app.app_context():
             self.insert('events', [
@@ -0,0 +1,78 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from superdesk import Command, command, get_resource_service, Option
+from eve.utils import config
+from planning.lock_metrics import HISTOGRAM_BUCKETS
+
+
+class LockContention(Command):
+    """
+    Print the most contended item locks.
+
+    The metrics are only recorded when `PLANNING_LOCK_METRICS_ENABLED` is set.
+
+    limit: No. of locks to print. Default is 20.
+    reset: Remove the recorded metrics after printing them.
+    Example:
+    ::
+
+        $ python manage.py planning:lock_contention --limit=20
+        $ python manage.py planning:lock_contention --reset
+    """
+
+    option_list = (
+        Option('--limit', '-l', dest='limit', required=False),
+        Option('--reset', '-r', dest='reset', action='store_true', default=False),
+    )
+
+    def run(self, limit=None, reset=False):
+        service = get_resource_service('planning_lock_metrics')
+        metrics = service.get_hottest(int(limit or 20))
+
+        if not metrics:
+            print('No lock metrics recorded')
+        else:
+            print(self._format_row((
+                'lock id', 'resource', 'attempts', 'contended', 'failed', 'retries',
+                'avg wait ms', 'avg hold ms', 'wait histogram'
+            )))
+            for item in metrics:
+                print(self._format_row(self._get_row(item)))
+
+        if reset:
+            service.reset()
+            print('Lock metrics reset')
+
+    @staticmethod
+    def _get_row(item):
+        attempts = item.get('attempts') or 0
+        acquired = item.get('acquired') or 0
+        buckets = ['le_{}'.format(bound) for bound in HISTOGRAM_BUCKETS] + ['gt_{}'.format(HISTOGRAM_BUCKETS[-1])]
+        wait_histogram = item.get('wait_histogram') or {}
+
+        return (
+            item[config.ID_FIELD],
+            item.get('resource'),
+            attempts,
+            item.get('contended') or 0,
+            item.get('failed') or 0,
+            item.get('retries') or 0,
+            '{:.1f}'.format((item.get('wait_ms') or 0) / attempts if attempts else 0),
+            '{:.1f}'.format((item.get('hold_ms') or 0) / acquired if acquired else 0),
+            ' '.join('{}={}'.format(bucket, wait_histogram[bucket]) for bucket in buckets if wait_histogram.get(bucket))
+        )
+
+    @staticmethod
+    def _format_row(row):
+        return '{:<60} {:<12} {:>8} {:>9} {:>6} {:>7} {:>11} {:>11}  {}'.format(*row)
+
+
+command('planning:lock_contention', LockContention())
@@ -0,0 +1,33 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from unittest import mock
+from superdesk import get_resource_service
+from planning.tests import TestCase
+from planning.lock_metrics import record_lock_metrics
+from .lock_contention import LockContention
+
+
+class LockContentionTest(TestCase):
+    def test_prints_and_resets_the_hottest_locks(self):
+        with self.app.app_context():
+            self.app.config['PLANNING_LOCK_METRICS_ENABLED'] = True
+            record_lock_metrics('item_lock e1', 'events', 0.2, 0.01, retries=2)
+            record_lock_metrics('item_lock p1', 'planning', 0.001, 0.01)
+
+            with mock.patch('builtins.print') as print_mock:
+                LockContention().run(limit='1', reset=True)
+
+            output = [call[0][0] for call in print_mock.call_args_list]
+            self.assertEqual(len(output), 3)
+            self.assertIn('item_lock e1', output[1])
+            self.assertIn('le_500=1', output[1])
+            self.assertEqual(output[2], 'Lock metrics reset')
+            self.assertEqual(get_resource_service('planning_lock_metrics').get_hottest(), [])
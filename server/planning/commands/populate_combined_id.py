@@ -0,0 +1,47 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from superdesk import Command, command, get_resource_service
+from superdesk.logging import logger
+from eve.utils import config
+
+
+class PopulateCombinedId(Command):
+    """
+    Populate the `_combined_id` field of existing `Events` and `Planning` items.
+
+    This field is used to group Events with their Planning items when
+    `PLANNING_COMBINED_VIEW_SINGLE_PASS` is enabled.
+
+    Example:
+    ::
+
+        $ python manage.py planning:populate_combined_id
+    """
+
+    def run(self):
+        logger.info('Starting to populate _combined_id')
+        self._populate('events', lambda item: item[config.ID_FIELD])
+        self._populate('planning', lambda item: item.get('event_item') or item[config.ID_FIELD])
+        logger.info('Completed populating _combined_id')
+
+    @staticmethod
+    def _populate(resource, get_combined_id):
+        service = get_resource_service(resource)
+        total = 0
+
+        for item in service.get_from_mongo(req=None, lookup={'_combined_id': None}):
+            service.system_update(item[config.ID_FIELD], {'_combined_id': get_combined_id(item)}, item)
+            total += 1
+
+        logger.info('Populated _combined_id for {} {} items'.format(total, resource))
+
+
+command('planning:populate_combined_id', PopulateCombinedId())
@@ -0,0 +1,34 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from .populate_combined_id import PopulateCombinedId
+from planning.tests import TestCase
+from superdesk import get_resource_service
+
+
+class PopulateCombinedIdTest(TestCase):
+    def test_populate_combined_id(self):
+        with self.app.app_context():
+            get_resource_service('events').create([{'_id': 'e1'}, {'_id': 'e2', '_combined_id': 'e2'}])
+            get_resource_service('planning').create([
+                {'_id': 'p1', 'event_item': 'e1'},
+                {'_id': 'p2'}
+            ])
+
+            PopulateCombinedId().run()
+
+            for resource, item_id, combined_id in [
+                ('events', 'e1', 'e1'),
+                ('events', 'e2', 'e2'),
+                ('planning', 'p1', 'e1'),
+                ('planning', 'p2', 'p2')
+            ]:
+                item = get_resource_service(resource).find_one(req=None, _id=item_id)
+                self.assertEqual(item['_combined_id'], combined_id)
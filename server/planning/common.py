@@ -12,18 +12,28 @@ import re
 from flask import current_app as app
 from datetime import datetime, timedelta
 from collections import namedtuple
+from itertools import islice
 from superdesk.resource import not_analyzed, build_custom_hateoas
 from superdesk import get_resource_service, logger
 from superdesk.metadata.item import ITEM_TYPE, CONTENT_STATE
-from superdesk.utc import utcnow
+from superdesk.utc import utcnow, utc
 from superdesk.celery_app import celery
 from apps.archive.common import get_user, get_auth
 from apps.publish.enqueue import get_enqueue_service
-from .item_lock import LOCK_SESSION, LOCK_ACTION, LOCK_TIME, LOCK_USER
+from .reference_cache import get_reference_item
 from eve.utils import config, ParsedRequest
+from eve.methods.common import resolve_document_etag
+from pymongo import UpdateOne
+from elasticsearch.helpers import bulk as es_bulk
+from bson import ObjectId
 from werkzeug.datastructures import MultiDict
 import json
 
+LOCK_USER = 'lock_user'
+LOCK_SESSION = 'lock_session'
+LOCK_ACTION = 'lock_action'
+LOCK_TIME = 'lock_time'
+
 ITEM_STATE = 'state'
 ITEM_EXPIRY = 'expiry'
 
@@ -106,6 +116,23 @@ def get_long_event_duration_threshold(current_app=None):
     return app.config.get('LONG_EVENT_DURATION_THRESHOLD', -1)
 
 
+def combined_view_single_pass(current_app=None):
+    """Get if the combined view should group Events and Planning using a single elastic query
+
+    This relies on the ``_combined_id`` field being populated for all Events and Planning items,
+    see ``planning:populate_combined_id``.
+    """
+    if current_app is not None:
+        return current_app.config.get('PLANNING_COMBINED_VIEW_SINGLE_PASS', False)
+    return app.config.get('PLANNING_COMBINED_VIEW_SINGLE_PASS', False)
+
+
+def set_combined_id(event):
+    """Set the key used to group an Event with its Planning items in the combined view"""
+    if event and event.get(config.ID_FIELD):
+        event['_combined_id'] = event[config.ID_FIELD]
+
+
 def remove_lock_information(item):
     item.update({
         LOCK_USER: None,
@@ -226,7 +253,7 @@ def get_coverage_type_name(qcode):
     :param qcode:
     :return: the name
     """
-    coverage_types = get_resource_service('vocabularies').find_one(req=None, _id='g2_content_type')
+    coverage_types = get_reference_item('vocabularies', 'g2_content_type')
 
     coverage_type = {}
     if coverage_types:
@@ -312,6 +339,162 @@ def set_original_creator(doc):
     doc['original_creator'] = user
 
 
+def iter_batches(items, batch_size):
+    """Lazily split the iterable into lists of at most batch_size items"""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def date_to_str_ms(value):
+    """Format the date for elastic queries with millisecond precision
+
+    ``date_to_str`` drops the fraction of the second, but the dates are stored with milliseconds,
+    so it can't be used to match an exact date. Naive dates are considered to be in UTC.
+    """
+    if value.tzinfo:
+        value = value.astimezone(utc)
+    return '{}.{:03d}+0000'.format(value.strftime('%Y-%m-%dT%H:%M:%S'), value.microsecond // 1000)
+
+
+def get_search_after_filter(field, value, item_id):
+    """Get the elastic filter for items sorted after the (field, guid) pair of the last item
+
+    Used to page through results sorted on ``field`` then ``guid`` instead of using ``from``,
+    as the next page doesn't shift when items of previous pages change or are removed.
+
+    :param str field: name of the sorted field
+    :param value: value of the field for the last item
+    :param str item_id: guid of the last item
+    :return dict: the filter
+    """
+    if isinstance(value, datetime):
+        value = date_to_str_ms(value)
+
+    return {
+        'bool': {
+            'should': [
+                {'range': {field: {'gt': value}}},
+                {
+                    'bool': {
+                        'must': [
+                            {'term': {field: value}},
+                            {'range': {'guid': {'gt': item_id}}}
+                        ]
+                    }
+                }
+            ]
+        }
+    }
+
+
+def get_mongo_collection(resource):
+    """Get the pymongo collection of the resource"""
+    source = app.config['DOMAIN'][resource]['datasource']['source']
+    return app.data.mongo.pymongo(resource=resource).db[source]
+
+
+def get_id_lookup(ids):
+    """Get the ids in both their string and ``ObjectId`` forms, as references are stored as either"""
+    ids = [item_id for item_id in ids if item_id]
+    return list(set(ids + [str(item_id) for item_id in ids] + [
+        ObjectId(item_id) for item_id in ids if isinstance(item_id, str) and ObjectId.is_valid(item_id)
+    ]))
+
+
+def get_items_by_id(resource, ids, projection=None):
+    """Load the items with a single ``$in`` query, indexed by the string of their id
+
+    :param str resource: name of the resource
+    :param ids: iterable of item ids, empty ids are ignored
+    :param dict projection: optional mongo projection
+    :return dict: the items by the string of their id
+    """
+    lookup = get_id_lookup(ids)
+    if not lookup:
+        return {}
+
+    return {
+        str(doc[config.ID_FIELD]): doc
+        for doc in get_mongo_collection(resource).find({config.ID_FIELD: {'$in': lookup}}, projection)
+    }
+
+
+def bulk_update(resource, ids, updates, lookup=None):
+    """Apply the same updates to a batch of items
+
+    Uses one unordered bulk write to mongo and one bulk index to elastic, instead of
+    a ``system_update`` per item. No service hooks are run for the updated items.
+
+    :param str resource: name of the resource
+    :param list ids: list of item ids to update
+    :param dict updates: updates to apply to every item
+    :param dict lookup: additional filter the items must match to be updated
+    :return list: the updated items
+    """
+    if not ids:
+        return []
+
+    collection = get_mongo_collection(resource)
+    now = utcnow()
+    docs = []
+    operations = []
+    query = dict(lookup or {})
+    query[config.ID_FIELD] = {'$in': list(ids)}
+
+    for doc in collection.find(query):
+        doc.update(updates)
+        doc[config.LAST_UPDATED] = now
+        resolve_document_etag(doc, resource)
+
+        item_updates = dict(updates)
+        item_updates[config.LAST_UPDATED] = now
+        item_updates[config.ETAG] = doc[config.ETAG]
+        item_lookup = dict(lookup or {})
+        item_lookup[config.ID_FIELD] = doc[config.ID_FIELD]
+        operations.append(UpdateOne(item_lookup, {'$set': item_updates}))
+        docs.append(doc)
+
+    if not operations:
+        return []
+
+    collection.bulk_write(operations, ordered=False)
+    app.data.elastic.bulk_insert(resource, docs)
+    return docs
+
+
+def bulk_delete(resource, ids):
+    """Delete a batch of items
+
+    Uses one bulk delete request to elastic and one ``delete_many`` to mongo, instead of
+    a ``delete_action`` per item. No service hooks are run for the deleted items.
+
+    eve_elastic has no bulk delete, so this relies on its private ``_es_args`` and
+    ``_refresh_resource_index`` methods, and must be checked when upgrading eve_elastic.
+
+    :param str resource: name of the resource, indexed in elastic
+    :param list ids: list of item ids to delete
+    :return int: number of items deleted from mongo
+    """
+    if not ids:
+        return 0
+
+    # Items missing from elastic are reported as errors, they are still deleted from mongo
+    elastic = app.data.elastic
+    es_bulk(
+        elastic.elastic(resource),
+        [{'_op_type': 'delete', '_id': str(item_id)} for item_id in ids],
+        raise_on_error=False,
+        **elastic._es_args(resource)
+    )
+    elastic._refresh_resource_index(resource)
+
+    return get_mongo_collection(resource).delete_many({config.ID_FIELD: {'$in': get_id_lookup(ids)}}).deleted_count
+
+
 def list_uniq_with_order(list):
     seen = set()
     seen_add = seen.add
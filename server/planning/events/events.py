@@ -19,9 +19,11 @@ import re
 from eve.defaults import resolve_default_values
 from eve.methods.common import resolve_document_etag
 from eve.utils import config, date_to_str
-from flask import current_app as app
+from flask import current_app as app, has_app_context
 from copy import deepcopy
-from dateutil.rrule import rrule, YEARLY, MONTHLY, WEEKLY, DAILY, MO, TU, WE, TH, FR, SA, SU
+from datetime import datetime
+from functools import lru_cache
+from dateutil.rrule import rrule, rruleset, YEARLY, MONTHLY, WEEKLY, DAILY, MO, TU, WE, TH, FR, SA, SU
 
 from superdesk import get_resource_service
 from superdesk.errors import SuperdeskApiError
@@ -36,7 +38,7 @@ from .events_base_service import EventsBaseService
 from planning.common import UPDATE_SINGLE, UPDATE_FUTURE, get_max_recurrent_events, \
     WORKFLOW_STATE, ITEM_STATE, remove_lock_information, format_address, update_post_item, \
     post_required, POST_STATE, get_event_max_multi_day_duration, set_original_creator, set_ingested_event_state, \
-    LOCK_ACTION
+    LOCK_ACTION, iter_batches, get_search_after_filter, set_combined_id
 from .events_schema import events_schema
 
 logger = logging.getLogger(__name__)
@@ -44,6 +46,12 @@ logger = logging.getLogger(__name__)
 FREQUENCIES = {'DAILY': DAILY, 'WEEKLY': WEEKLY, 'MONTHLY': MONTHLY, 'YEARLY': YEARLY}
 DAYS = {'MO': MO, 'TU': TU, 'WE': WE, 'TH': TH, 'FR': FR, 'SA': SA, 'SU': SU}
 
+# Number of occurrences membership is tested against outside of an app context (default of MAX_RECURRENT_EVENTS)
+DEFAULT_MEMBERSHIP_LIMIT = 200
+
+# Number of generated recurring events to create in a single bulk write
+RECURRING_EVENTS_BATCH_SIZE = 500
+
 organizer_roles = {
     'eorol:artAgent': 'Artistic agent',
     'eorol:general': 'General organiser',
@@ -510,8 +518,8 @@ class EventsService(superdesk.Service):
         # Generated new events will be "draft"
         merged[ITEM_STATE] = WORKFLOW_STATE.DRAFT
 
-        generated_events = generate_recurring_events(merged)
-        updated_event = generated_events.pop(0)
+        generated_events = iter_recurring_events(merged)
+        updated_event = next(generated_events)
 
         # Check to see if the first generated event is different from original
         # If yes, mark original as rescheduled with generated recurrence_id
@@ -534,10 +542,14 @@ class EventsService(superdesk.Service):
             set_planning_schedule(updates)
             remove_lock_information(item=updates)
 
-        # Create the new events and generate their history
-        self.create(generated_events)
-        app.on_inserted_events(generated_events)
-        return generated_events
+        # Create the new events in batches and generate their history
+        created_events = []
+        for events in iter_batches(generated_events, RECURRING_EVENTS_BATCH_SIZE):
+            self.create(events)
+            app.on_inserted_events(events)
+            created_events.extend(events)
+
+        return created_events
 
     def get_recurring_timeline(self, selected, spiked=False):
         events_base_service = EventsBaseService('events', backend=superdesk.get_backend())
@@ -556,7 +568,7 @@ class EventsService(superdesk.Service):
         event_id = event[config.ID_FIELD]
         planning_item = planning_service.find_one(req=None, _id=plan_id)
 
-        updates = {'event_item': event_id}
+        updates = {'event_item': event_id, '_combined_id': event_id}
 
         if 'recurrence_id' in event:
             updates['recurrence_id'] = event['recurrence_id']
@@ -570,47 +582,55 @@ class EventsService(superdesk.Service):
         )
         app.on_updated_planning(updates, {'_id': plan_id})
 
-    def get_expired_items(self, expiry_datetime, spiked_events_only=False):
+    def get_expired_items(self, expiry_datetime, spiked_events_only=False, checkpoint=None):
         """Get the expired items
 
-        Where end date is in the past
+        Where end date is in the past. Each page is requested after the last Event of the previous page
+        (sorted on ``dates.start`` and ``guid``), so items changed or removed by the callee don't shift the pages.
+
+        :param datetime expiry_datetime: items ending before this date are returned
+        :param bool spiked_events_only: only return spiked Events
+        :param str checkpoint: name of the checkpoint to store the position in once each page has been
+            processed by the callee. The scan resumes from there if it was interrupted, and the checkpoint
+            is cleared once all items have been returned
         """
         query = {
             'query': {'bool': {'must_not': [{'term': {'expired': True}}]}},
             'filter': {'range': {'dates.end': {'lte': date_to_str(expiry_datetime)}}},
-            'sort': [{'dates.start': 'asc'}],
+            'sort': [{'dates.start': 'asc'}, {'guid': 'asc'}],
             'size': get_max_recurrent_events()
         }
 
         if spiked_events_only:
             query['query'] = {'bool': {'must': [{'term': {'state': WORKFLOW_STATE.SPIKED}}]}}
 
-        total_received = 0
-        total_events = -1
+        checkpoints_service = get_resource_service('planning_checkpoints')
+        last_item = checkpoints_service.get_checkpoint(checkpoint) if checkpoint else None
 
         while True:
-            query["from"] = total_received
-
-            results = self.search(query)
-
-            # If the total_events has not been set, then this is the first query
-            # In which case we need to store the total hits from the search
-            if total_events < 0:
-                total_events = results.count()
+            page_query = deepcopy(query)
+            if last_item:
+                page_query['query']['bool'].setdefault('must', []).append(
+                    get_search_after_filter('dates.start', last_item['sort'], last_item['guid'])
+                )
 
-                # If the search doesn't contain any results, return here
-                if total_events < 1:
-                    break
+            results = self.search(page_query)
 
             # If the last query doesn't contain any results, return here
             if not len(results.docs):
                 break
 
-            total_received += len(results.docs)
-
             # Yield the results for iteration by the callee
             yield list(results.docs)
 
+            last_event = results.docs[-1]
+            last_item = {'sort': last_event['dates']['start'], 'guid': last_event['guid']}
+            if checkpoint:
+                checkpoints_service.set_checkpoint(checkpoint, last_item)
+
+        if checkpoint:
+            checkpoints_service.clear_checkpoint(checkpoint)
+
     def delete_event_files(self, updates, original):
         files = [f for f in original.get('files', []) if f not in (updates or {}).get('files', [])]
         files_service = get_resource_service('events_files')
@@ -639,16 +659,20 @@ class EventsResource(superdesk.Resource):
     public_methods = ['GET']
     mongo_indexes = {
         'recurrence_id_1': ([('recurrence_id', 1)], {'background': True}),
+        'recurrence_id_1_lock_session_1': ([('recurrence_id', 1), ('lock_session', 1)], {'background': True}),
+        'lock_session_1': ([('lock_session', 1)], {'background': True}),
         'state': ([('state', 1)], {'background': True}),
         'dates_start_1': ([('dates.start', 1)], {'background': True}),
         'dates_end_1': ([('dates.end', 1)], {'background': True}),
+        'original_source_1_dates_start_1': ([('original_source', 1), ('dates.start', 1)], {'background': True}),
     }
     privileges = {'POST': 'planning_event_management',
                   'PATCH': 'planning_event_management'}
 
 
 def generate_recurring_dates(start, frequency, interval=1, endRepeatMode='count',
-                             until=None, byday=None, count=5, tz=None, date_only=False):
+                             until=None, byday=None, count=5, tz=None, date_only=False,
+                             ex_date=None, ex_rule=None):
     """
 
     Returns list of dates related to recurring rules
@@ -659,67 +683,159 @@ def generate_recurring_dates(start, frequency, interval=1, endRepeatMode='count'
     :param until datetime: date after which the recurrence rule expires
     :param byday str or list: "MO TU"
     :param count int: number of occurrences of the rule
+    :param ex_date list: list of datetime to exclude from the occurrences
+    :param ex_rule dict: recurring rule of the occurrences to exclude
     :return list: list of datetime
 
     """
-    # if tz is given, respect the timzone by starting from the local time
-    # NOTE: rrule uses only naive datetime
-    if tz:
+    recurring_rule = get_recurring_rule(start, frequency, interval=interval, until=until, byday=byday,
+                                        count=count, tz=tz, ex_date=ex_date, ex_rule=ex_rule)
+    return recurring_rule.iter_dates(date_only=date_only)
+
+
+def get_recurring_rule(start, frequency, interval=1, endRepeatMode='count', until=None, byday=None,
+                       count=5, tz=None, ex_date=None, ex_rule=None, limit=None, **kwargs):
+    """Get the compiled recurring rule, using the cache if this rule has already been compiled
+
+    Accepts the same arguments as ``generate_recurring_dates``, and ``limit``, the number of occurrences
+    membership is tested against (defaults to ``MAX_RECURRENT_EVENTS``)
+    """
+    if limit is None:
+        limit = get_max_recurrent_events() if has_app_context() else DEFAULT_MEMBERSHIP_LIMIT
+
+    # The tzinfo of start is part of the key, as equal datetimes in different timezones
+    # generate different occurrences when no tz is provided
+    return _get_compiled_recurring_rule(
+        start, getattr(start, 'tzinfo', None), frequency, interval, until, byday, count, tz,
+        tuple(ex_date or []),
+        tuple(sorted((ex_rule or {}).items())),
+        limit
+    )
+
+
+@lru_cache(maxsize=256)
+def _get_compiled_recurring_rule(start, start_tzinfo, frequency, interval, until, byday, count, tz, ex_date, ex_rule,
+                                 limit):
+    return RecurringRule(start, frequency, interval=interval, until=until, byday=byday, count=count, tz=tz,
+                         ex_date=ex_date, ex_rule=dict(ex_rule), limit=limit)
+
+
+class RecurringRule(object):
+    """Compiled recurring rule of an Event series
+
+    The occurrences are generated lazily, and are returned in UTC (as naive datetimes) if a
+    timezone is provided. Membership of a date or datetime is tested in constant time against
+    the first ``limit`` occurrences, as no series has more Events than that::
+
+        rule = get_recurring_rule(start, 'DAILY', count=5)
+        datetime(2018, 1, 2, 9, 0) in rule
+        date(2018, 1, 2) in rule
+    """
+
+    def __init__(self, start, frequency, interval=1, until=None, byday=None, count=5, tz=None,
+                 ex_date=None, ex_rule=None, limit=DEFAULT_MEMBERSHIP_LIMIT):
+        self.tz = tz
+        self.limit = limit
+
+        # if tz is given, respect the timzone by starting from the local time
+        # NOTE: rrule uses only naive datetime
+        start = self._to_local(start)
+        self.ruleset = rruleset()
+        self.ruleset.rrule(self._get_rrule(start, frequency, interval, self._to_local(until), byday, count))
+
+        for date in ex_date or []:
+            self.ruleset.exdate(self._to_local(date))
+
+        if ex_rule and ex_rule.get('frequency'):
+            self.ruleset.exrule(self._get_rrule(
+                start,
+                ex_rule['frequency'],
+                int(ex_rule.get('interval') or 1),
+                self._to_local(ex_rule.get('until')),
+                ex_rule.get('byday'),
+                ex_rule.get('count')
+            ))
+
+        self._dates_set = None
+        self._dates_only_set = None
+
+    def _to_local(self, date):
+        if not date or not self.tz:
+            return date
+
         try:
-            # start can already be localized
-            start = pytz.UTC.localize(start)
+            # date can already be localized
+            date = pytz.UTC.localize(date)
         except ValueError:
             pass
-        start = start.astimezone(tz).replace(tzinfo=None)
-        if until:
-            until = until.astimezone(tz).replace(tzinfo=None)
-
-    if frequency == 'DAILY':
-        byday = None
-
-    # check format of the recurring_rule byday value
-    if byday and re.match(r'^-?[1-5]+.*', byday):
-        # byday uses monthly or yearly frequency rule with day of week and
-        # preceding day of month integer by day value
-        # examples:
-        # 1FR - first friday of the month
-        # -2MON - second to last monday of the month
-        if byday[:1] == '-':
-            day_of_month = int(byday[:2])
-            day_of_week = byday[2:]
-        else:
-            day_of_month = int(byday[:1])
-            day_of_week = byday[1:]
-
-        byweekday = DAYS.get(day_of_week)(day_of_month)
-    else:
-        # byday uses DAYS constants
-        byweekday = byday and [DAYS.get(d) for d in byday.split()] or None
-
-    # Convert count of repeats to count of events
-    if count:
-        count = count * (len(byday.split()) if byday else 1)
-
-    # TODO: use dateutil.rrule.rruleset to incude ex_date and ex_rule
-    dates = rrule(
-        FREQUENCIES.get(frequency),
-        dtstart=start,
-        until=until,
-        byweekday=byweekday,
-        count=count,
-        interval=interval,
-    )
-    # if a timezone has been applied, returns UTC
-    if tz:
-        if date_only:
-            return (tz.localize(dt).astimezone(pytz.UTC).replace(tzinfo=None).date() for dt in dates)
-        else:
-            return (tz.localize(dt).astimezone(pytz.UTC).replace(tzinfo=None) for dt in dates)
-    else:
-        if date_only:
-            return (date.date() for date in dates)
+        return date.astimezone(self.tz).replace(tzinfo=None)
+
+    @staticmethod
+    def _get_rrule(start, frequency, interval, until, byday, count):
+        if frequency == 'DAILY':
+            byday = None
+
+        # check format of the recurring_rule byday value
+        if byday and re.match(r'^-?[1-5]+.*', byday):
+            # byday uses monthly or yearly frequency rule with day of week and
+            # preceding day of month integer by day value
+            # examples:
+            # 1FR - first friday of the month
+            # -2MON - second to last monday of the month
+            if byday[:1] == '-':
+                day_of_month = int(byday[:2])
+                day_of_week = byday[2:]
+            else:
+                day_of_month = int(byday[:1])
+                day_of_week = byday[1:]
+
+            byweekday = DAYS.get(day_of_week)(day_of_month)
         else:
-            return (date for date in dates)
+            # byday uses DAYS constants
+            byweekday = byday and [DAYS.get(d) for d in byday.split()] or None
+
+        # Convert count of repeats to count of events
+        if count:
+            count = count * (len(byday.split()) if byday else 1)
+
+        return rrule(
+            FREQUENCIES.get(frequency),
+            dtstart=start,
+            until=until,
+            byweekday=byweekday,
+            count=count,
+            interval=interval,
+        )
+
+    def iter_dates(self, date_only=False):
+        """Lazily generate the occurrences of this rule
+
+        :param bool date_only: generate the dates (without the time) of the occurrences
+        """
+        for dt in self.ruleset:
+            # if a timezone has been applied, returns UTC
+            if self.tz:
+                dt = self.tz.localize(dt).astimezone(pytz.UTC).replace(tzinfo=None)
+            yield dt.date() if date_only else dt
+
+    def get_dates(self, limit, date_only=False):
+        """Get the first `limit` occurrences of this rule"""
+        return list(itertools.islice(self.iter_dates(date_only=date_only), limit))
+
+    def __contains__(self, value):
+        if isinstance(value, datetime):
+            if self._dates_set is None:
+                self._dates_set = frozenset(self.get_dates(self.limit))
+            return value in self._dates_set
+
+        if self._dates_only_set is None:
+            self._dates_only_set = frozenset(self.get_dates(self.limit, date_only=True))
+        return value in self._dates_only_set
+
+    def __len__(self):
+        if self._dates_set is None:
+            self._dates_set = frozenset(self.get_dates(self.limit))
+        return len(self._dates_set)
 
 
 def setRecurringMode(event):
@@ -736,47 +852,51 @@ def overwrite_event_expiry_date(event):
 
 
 def generate_recurring_events(event):
-    generated_events = []
+    """Generate the list of Events for the recurring series of the provided Event"""
+    return list(iter_recurring_events(event))
+
+
+def iter_recurring_events(event):
+    """Lazily generate the Events for the recurring series of the provided Event
+
+    The metadata of the Event is copied once into a base document that is shared by all
+    occurrences. Each occurrence is a shallow copy of this base with its own ``dates``, ``guid``,
+    ``_id``, ``expiry`` and ``_planning_schedule``. The nested values of the base (files, contacts,
+    subject etc) are shared between occurrences, so they must not be modified in place.
+    """
     setRecurringMode(event)
 
     # Get the recurrence_id, or generate one if it doesn't exist
     recurrence_id = event.get('recurrence_id', generate_guid(type=GUID_NEWSML))
 
+    # Remove fields not required by the new events
+    base = copy.deepcopy({
+        key: value for key, value in event.items()
+        if not key.startswith('_') and not key.startswith('lock_') and key not in {'pubstatus', 'reschedule_from'}
+    })
+    base['recurrence_id'] = recurrence_id
+
     # compute the difference between start and end in the original event
     time_delta = event['dates']['end'] - event['dates']['start']
     # for all the dates based on the recurring rules:
     for date in itertools.islice(generate_recurring_dates(
             start=event['dates']['start'],
             tz=event['dates'].get('tz') and pytz.timezone(event['dates']['tz'] or None),
+            ex_date=event['dates'].get('ex_date'),
+            ex_rule=event['dates'].get('ex_rule'),
             **event['dates']['recurring_rule']
     ), 0, get_max_recurrent_events()):  # set a limit to prevent too many events to be created
-        # create event with the new dates
-        new_event = copy.deepcopy(event)
-
-        # Remove fields not required by the new events
-        for key in list(new_event.keys()):
-            if key.startswith('_'):
-                new_event.pop(key)
-            elif key.startswith('lock_'):
-                new_event.pop(key)
-        new_event.pop('pubstatus', None)
-        new_event.pop('reschedule_from', None)
-
-        new_event['dates']['start'] = date
-        new_event['dates']['end'] = date + time_delta
-        # set a unique guid
+        # create event with the new dates and a unique guid
+        new_event = dict(base)
+        new_event['dates'] = dict(base['dates'], start=date, end=date + time_delta)
         new_event['guid'] = generate_guid(type=GUID_NEWSML)
         new_event['_id'] = new_event['guid']
-        # set the recurrence id
-        new_event['recurrence_id'] = recurrence_id
 
         # set expiry date
         overwrite_event_expiry_date(new_event)
         # the _planning_schedule
         set_planning_schedule(new_event)
-        generated_events.append(new_event)
-
-    return generated_events
+        yield new_event
 
 
 def set_planning_schedule(event):
@@ -784,3 +904,5 @@ def set_planning_schedule(event):
         event['_planning_schedule'] = [
             {'scheduled': event['dates']['start']}
         ]
+
+    set_combined_id(event)
@@ -21,7 +21,7 @@ from apps.auth import get_user_id
 from apps.archive.common import get_auth
 
 from planning.common import UPDATE_SINGLE, WORKFLOW_STATE, get_max_recurrent_events, update_post_item, \
-    set_ingested_event_state
+    set_ingested_event_state, set_combined_id
 from planning.item_lock import LOCK_USER, LOCK_SESSION, LOCK_ACTION
 
 
@@ -165,6 +165,8 @@ class EventsBaseService(BaseService):
                 {'scheduled': event['dates']['start']}
             ]
 
+        set_combined_id(event)
+
     @staticmethod
     def push_notification(name, updates, original):
         session = get_auth().get(config.ID_FIELD, '')
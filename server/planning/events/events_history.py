@@ -12,7 +12,6 @@ from superdesk import Resource
 from planning.history import HistoryService
 import logging
 from eve.utils import config
-from copy import deepcopy
 from planning.item_lock import LOCK_ACTION
 
 logger = logging.getLogger(__name__)
@@ -29,6 +28,11 @@ class EventsHistoryResource(Resource):
         'update': {'type': 'dict', 'nullable': True}
     }
 
+    mongo_indexes = {
+        'event_id_1__created_1': ([('event_id', 1), ('_created', 1)], {'background': True}),
+        '_created_1': ([('_created', 1)], {'background': True}),
+    }
+
 
 class EventsHistoryService(HistoryService):
 
@@ -37,7 +41,7 @@ class EventsHistoryService(HistoryService):
         self.delete(lookup=lookup)
 
     def on_item_updated(self, updates, original, operation=None):
-        item = deepcopy(original)
+        item = dict(original)
         if list(item.keys()) == ['_id']:
             diff = self._remove_unwanted_fields(updates)
         else:
@@ -65,7 +69,7 @@ class EventsHistoryService(HistoryService):
                 history['operation'] = 'unpost'
         elif operation == 'create' and 'ingested' == update.get('state', ''):
             history['operation'] = 'ingested'
-        self.post([history])
+        self._record_history(history)
 
     def on_update_repetitions(self, updates, event_id, operation):
         self.on_item_updated(updates, {'_id': event_id}, operation or 'update_repetitions')
@@ -15,11 +15,10 @@ from eve.utils import config
 from planning.common import UPDATE_FUTURE, WORKFLOW_STATE, ITEM_STATE, remove_lock_information, \
     set_original_creator, set_actioned_date_to_event
 from copy import deepcopy
-from .events import EventsResource, events_schema, generate_recurring_dates
+from .events import EventsResource, events_schema, get_recurring_rule
 from flask import current_app as app
 import pytz
 from datetime import datetime
-from itertools import islice
 from .events_base_service import EventsBaseService
 
 event_reschedule_schema = deepcopy(events_schema)
@@ -169,24 +168,29 @@ class EventsRescheduleService(EventsBaseService):
         time_delta = updates['dates']['end'] - updates['dates']['start']
 
         # Generate the dates for the new event series
-        new_dates = [date for date in islice(generate_recurring_dates(
+        new_dates = get_recurring_rule(
             start=new_start_date,
             tz=updates['dates'].get('tz') and pytz.timezone(updates['dates']['tz'] or None),
-            date_only=True,
+            ex_date=updates['dates'].get('ex_date'),
+            ex_rule=updates['dates'].get('ex_rule'),
             **updated_rule
-        ), 0, 200)]
+        ).get_dates(200, date_only=True)
 
         # Generate the dates for the original events
-        original_dates = [date for date in islice(generate_recurring_dates(
+        original_dates = frozenset(get_recurring_rule(
             start=original_start_date,
             tz=original['dates'].get('tz') and pytz.timezone(original['dates']['tz'] or None),
-            date_only=True,
+            ex_date=original['dates'].get('ex_date'),
+            ex_rule=original['dates'].get('ex_rule'),
             **original_rule
-        ), 0, 200)]
+        ).get_dates(200, date_only=True))
+
+        # Set of the new dates, for constant time lookups
+        new_dates_set = frozenset(new_dates)
 
         self.set_next_occurrence(updates)
 
-        dates_processed = []
+        dates_processed = set()
 
         # Iterate over the current events in the series and delete/spike
         # or update the event accordingly
@@ -198,7 +202,7 @@ class EventsRescheduleService(EventsBaseService):
                 event_date = event['dates']['start'].replace(tzinfo=None).date()
             # If the event does not occur in the new dates, then we need to either
             # delete or spike this event
-            if event_date not in new_dates:
+            if event_date not in new_dates_set:
                 # Add it to the list of events to delete or spike
                 # This is done later so that we can perform a single
                 # query against mongo, rather than one per deleted event
@@ -208,7 +212,7 @@ class EventsRescheduleService(EventsBaseService):
             # This occurs when the selected Event is being updated to an Event that already exists
             # in another Event in the series.
             # This stops multiple Events to occur on the same day
-            elif event_date in new_dates and event_date in dates_processed:
+            elif event_date in dates_processed:
                 deleted_events[event[config.ID_FIELD]] = event
 
             # Otherwise this Event does occur in the new dates
@@ -247,7 +251,7 @@ class EventsRescheduleService(EventsBaseService):
                     app.on_updated_events_reschedule(new_updates, {'_id': event[config.ID_FIELD]})
 
                 # Mark this date as being already processed
-                dates_processed.append(event_date)
+                dates_processed.add(event_date)
 
         # Create new events that do not fall on the original occurrence dates
         new_events = []
@@ -315,10 +319,12 @@ class EventsRescheduleService(EventsBaseService):
 
     @staticmethod
     def set_next_occurrence(updates):
-        new_dates = [date for date in islice(generate_recurring_dates(
+        new_dates = get_recurring_rule(
             start=updates['dates']['start'],
             tz=updates['dates'].get('tz') and pytz.timezone(updates['dates']['tz'] or None),
-            **updates['dates']['recurring_rule']), 0, 10)]
+            ex_date=updates['dates'].get('ex_date'),
+            ex_rule=updates['dates'].get('ex_rule'),
+            **updates['dates']['recurring_rule']).get_dates(1)
         time_delta = updates['dates']['end'] - updates['dates']['start']
         updates['dates']['start'] = new_dates[0]
         updates['dates']['end'] = new_dates[0] + time_delta
@@ -174,6 +174,12 @@ events_schema = {
             }
         }
     },
+    # This is a extra field so that we can group events and their planning items in the combined view.
+    # It will store the _id of the event.
+    '_combined_id': {
+        'type': 'string',
+        'mapping': not_analyzed
+    },
     'occur_status': {
         'nullable': True,
         'type': 'dict',
@@ -7,7 +7,7 @@ from superdesk.utc import utcnow
 from planning.tests import TestCase
 from planning.common import format_address
 from planning.item_lock import LockService
-from planning.events.events import generate_recurring_dates
+from planning.events.events import generate_recurring_dates, iter_recurring_events, get_recurring_rule
 
 
 class EventTestCase(TestCase):
@@ -83,6 +83,73 @@ class EventTestCase(TestCase):
             datetime(2016, 12, 1, 23, 00),  # it's friday in Berlin
         ])
 
+    def test_recurring_dates_exclusions(self):
+        # Every day for a week, excluding the 3rd and the first occurrence of the exclusion rule
+        self.assertEquals(list(generate_recurring_dates(
+            start=datetime(2016, 1, 1, 15, 0),
+            frequency='DAILY',
+            count=7,
+            ex_date=[datetime(2016, 1, 3, 15, 0)],
+            ex_rule={'frequency': 'DAILY', 'interval': '2', 'until': datetime(2016, 1, 1, 15, 0)}
+        )), [
+            datetime(2016, 1, 2, 15, 0),
+            datetime(2016, 1, 4, 15, 0),
+            datetime(2016, 1, 5, 15, 0),
+            datetime(2016, 1, 6, 15, 0),
+            datetime(2016, 1, 7, 15, 0),
+        ])
+
+    def test_recurring_rule_membership(self):
+        rule = get_recurring_rule(
+            start=datetime(2016, 11, 17, 23, 00),
+            frequency='WEEKLY',
+            byday='FR',
+            count=3,
+            endRepeatMode='count',
+            tz=pytz.timezone('Europe/Berlin')
+        )
+
+        self.assertEqual(len(rule), 3)
+        self.assertIn(datetime(2016, 11, 24, 23, 00), rule)
+        self.assertNotIn(datetime(2016, 11, 25, 23, 00), rule)
+        self.assertIn(datetime(2016, 11, 24, 23, 00).date(), rule)
+        self.assertNotIn(datetime(2016, 11, 25, 23, 00).date(), rule)
+
+        # The compiled rule is cached
+        self.assertIs(rule, get_recurring_rule(
+            start=datetime(2016, 11, 17, 23, 00),
+            frequency='WEEKLY',
+            byday='FR',
+            count=3,
+            endRepeatMode='count',
+            tz=pytz.timezone('Europe/Berlin')
+        ))
+
+    def test_recurring_rule_is_lazy(self):
+        # Daily for 10,000 years, only the needed occurrences are generated
+        rule = get_recurring_rule(
+            start=datetime(2016, 1, 1, 15, 0),
+            frequency='DAILY',
+            until=datetime(9999, 1, 1),
+            count=None,
+            endRepeatMode='until',
+            limit=10
+        )
+
+        self.assertEqual(rule.get_dates(2), [datetime(2016, 1, 1, 15, 0), datetime(2016, 1, 2, 15, 0)])
+        self.assertIn(datetime(2016, 1, 10, 15, 0), rule)
+        self.assertNotIn(datetime(2016, 1, 11, 15, 0), rule)
+        self.assertEqual(len(rule), 10)
+
+        dates = generate_recurring_dates(
+            start=datetime(2016, 1, 1, 15, 0),
+            frequency='DAILY',
+            until=datetime(9999, 1, 1),
+            count=None,
+            endRepeatMode='until'
+        )
+        self.assertEqual(next(dates), datetime(2016, 1, 1, 15, 0))
+
     def test_get_recurring_timeline(self):
         with self.app.app_context():
             generated_events = generate_recurring_events(10)
@@ -177,6 +244,48 @@ class EventLocationFormatAddress(TestCase):
         format_address(location)
         self.assertEqual(location['formatted_address'], '')
 
+    def test_iter_recurring_events(self):
+        with self.app.app_context():
+            event = {
+                'name': 'Friday Club',
+                'lock_user': 'user1',
+                'pubstatus': 'usable',
+                '_planning_item': 'plan1',
+                'files': ['file1', 'file2'],
+                'subject': [{'qcode': '01000000', 'name': 'arts, culture and entertainment'}],
+                'dates': {
+                    'start': datetime(2099, 11, 21, 12, 00, 00),
+                    'end': datetime(2099, 11, 21, 14, 00, 00),
+                    'recurring_rule': {
+                        'frequency': 'DAILY',
+                        'interval': 1,
+                        'count': 3,
+                        'endRepeatMode': 'count'
+                    }
+                }
+            }
+
+            generated_events = iter_recurring_events(event)
+            self.assertFalse(isinstance(generated_events, list))
+
+            generated_events = list(generated_events)
+            self.assertEqual(len(generated_events), 3)
+            self.assertEqual(len({e['_id'] for e in generated_events}), 3)
+
+            for day, generated in enumerate(generated_events):
+                start = datetime(2099, 11, 21 + day, 12, 00, 00)
+                self.assertEqual(generated['dates']['start'], start)
+                self.assertEqual(generated['dates']['end'], start + timedelta(hours=2))
+                self.assertEqual(generated['_planning_schedule'], [{'scheduled': start}])
+                self.assertEqual(generated['guid'], generated['_id'])
+                self.assertEqual(generated['recurrence_id'], generated_events[0]['recurrence_id'])
+                for field in ['lock_user', 'pubstatus', '_planning_item']:
+                    self.assertNotIn(field, generated)
+
+                # The metadata is shared between occurrences, not copied for each one
+                self.assertIs(generated['subject'], generated_events[0]['subject'])
+                self.assertIsNot(generated['subject'], event['subject'])
+
 
 class EventPlanningSchedule(TestCase):
 
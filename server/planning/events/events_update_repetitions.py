@@ -15,7 +15,7 @@ from superdesk.metadata.item import GUID_NEWSML
 from apps.auth import get_user_id
 from planning.common import remove_lock_information, WORKFLOW_STATE, POST_STATE, \
     get_max_recurrent_events, set_original_creator
-from .events import EventsResource, generate_recurring_dates
+from .events import EventsResource, get_recurring_rule
 from .events_base_service import EventsBaseService
 from planning.item_lock import LOCK_ACTION
 
@@ -62,17 +62,21 @@ class EventsUpdateRepetitionsService(EventsBaseService):
         existing_events = self._get_series(original)
 
         first_event = existing_events[0]
-        new_dates = [date for date in generate_recurring_dates(
+        new_dates = get_recurring_rule(
             start=first_event.get('dates', {}).get('start'),
             tz=updates['dates'].get('tz') and pytz.timezone(updates['dates']['tz'] or None),
+            ex_date=updates['dates'].get('ex_date'),
+            ex_rule=updates['dates'].get('ex_rule'),
             **updated_rule
-        )]
+        )
 
-        original_dates = [date for date in generate_recurring_dates(
+        original_dates = get_recurring_rule(
             start=first_event.get('dates', {}).get('start'),
             tz=original['dates'].get('tz') and pytz.timezone(original['dates']['tz'] or None),
+            ex_date=original['dates'].get('ex_date'),
+            ex_rule=original['dates'].get('ex_rule'),
             **original_rule
-        )]
+        )
 
         # Compute the difference between start and end in the updated event
         time_delta = original['dates']['end'] - original['dates']['start']
@@ -97,7 +101,7 @@ class EventsUpdateRepetitionsService(EventsBaseService):
                 self._update_event(updated_rule, event)
 
         # Create new events that do not fall on the original series
-        for date in new_dates:
+        for date in new_dates.get_dates(get_max_recurrent_events()):
             if date not in original_dates:
                 new_events.append(self._create_event(date, updates, original, time_delta))
 
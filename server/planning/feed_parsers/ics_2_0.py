@@ -20,8 +20,9 @@ from eve.utils import config
 from icalendar import vRecur, vCalAddress, vGeo
 from icalendar.parser import tzid_from_dt
 from superdesk import get_resource_service
+from planning.common import get_mongo_collection
 import pytz
-from icalendar import Calendar
+from icalendar import Calendar, Event
 
 utc = pytz.UTC
 logger = logging.getLogger(__name__)
@@ -38,141 +39,272 @@ class IcsTwoFeedParser(FileFeedParser):
 
     label = 'iCalendar v2.0'
 
+    # Maximum number of items yielded at once by `parse_stream`
+    batch_size = 100
+
     def can_parse(self, cal):
         return isinstance(cal, Calendar)
 
     def parse(self, cal, provider=None):
 
         try:
-            items = []
-
-            for component in cal.walk():
-                if component.name == "VEVENT":
-                    item = {
-                        ITEM_TYPE: CONTENT_TYPE.EVENT,
-                        GUID_FIELD: generate_guid(type=GUID_NEWSML),
-                        FORMAT: FORMATS.PRESERVED
-                    }
-                    item['name'] = component.get('summary')
-                    item['definition_short'] = component.get('summary')
-                    item['definition_long'] = component.get('description')
-                    item['original_source'] = component.get('uid')
-                    item['state'] = CONTENT_STATE.INGESTED
-                    item['pubstatus'] = None
-                    eocstat_map = get_resource_service('vocabularies').find_one(req=None, _id='eventoccurstatus')
-                    if eocstat_map:
-                        item['occur_status'] = [x for x in eocstat_map.get('items', []) if
-                                                x['qcode'] == 'eocstat:eos5' and x.get('is_active', True)][0]
-                        item['occur_status'].pop('is_active', None)
-
-                    # add dates
-                    # check if component .dt return date instead of datetime, if so, convert to datetime
-                    dtstart = component.get('dtstart').dt
-                    dates_start = dtstart if isinstance(dtstart, datetime.datetime) \
-                        else datetime.datetime.combine(dtstart, datetime.datetime.min.time())
-                    if not dates_start.tzinfo:
-                        dates_start = local_to_utc(config.DEFAULT_TIMEZONE, dates_start)
-                    try:
-                        dtend = component.get('dtend').dt
-                        if isinstance(dtend, datetime.datetime):
-                            dates_end = dtend
-                        else:  # Date only is non inclusive
-                            dates_end = \
-                                (datetime.datetime.combine(dtend, datetime.datetime.max.time()) -
-                                 datetime.timedelta(days=1)).replace(microsecond=0)
-                        if not dates_end.tzinfo:
-                            dates_end = local_to_utc(config.DEFAULT_TIMEZONE, dates_end)
-                    except AttributeError:
-                        dates_end = None
-                    item['dates'] = {
-                        'start': dates_start,
-                        'end': dates_end,
-                        'tz': ''
-                    }
-                    # parse ics RRULE to fit eventsML recurring_rule
-                    r_rule = component.get('rrule')
-                    if isinstance(r_rule, vRecur):
-                        r_rule_dict = vRecur.from_ical(r_rule)
-                        if 'FREQ' in r_rule_dict.keys():
-                            item['dates'].setdefault('recurring_rule', {})['frequency'] = ''.join(
-                                r_rule_dict.get('FREQ'))
-                        if 'INTERVAL' in r_rule_dict.keys():
-                            item['dates'].setdefault('recurring_rule', {})['interval'] = r_rule_dict.get('INTERVAL')[0]
-                        if 'UNTIL' in r_rule_dict.keys():
-                            item['dates'].setdefault('recurring_rule', {})['until'] = r_rule_dict.get('UNTIL')[0]
-                        if 'COUNT' in r_rule_dict.keys():
-                            item['dates'].setdefault('recurring_rule', {})['count'] = r_rule_dict.get('COUNT')
-                        if 'BYMONTH' in r_rule_dict.keys():
-                            item['dates'].setdefault('recurring_rule', {})['bymonth'] = ' '.join(
-                                r_rule_dict.get('BYMONTH'))
-                        if 'BYDAY' in r_rule_dict.keys():
-                            item['dates'].setdefault('recurring_rule', {})['byday'] = ' '.join(r_rule_dict.get('BYDAY'))
-                        if 'BYHOUR' in r_rule_dict.keys():
-                            item['dates'].setdefault('recurring_rule', {})['byhour'] = ' '.join(
-                                r_rule_dict.get('BYHOUR'))
-                        if 'BYMIN' in r_rule_dict.keys():
-                            item['dates'].setdefault('recurring_rule', {})['bymin'] = ' '.join(r_rule_dict.get('BYMIN'))
-
-                    # set timezone info if date is a datetime
-                    if isinstance(component.get('dtstart').dt, datetime.datetime):
-                        item['dates']['tz'] = tzid_from_dt(component.get('dtstart').dt)
-
-                    # add participants
-                    item['participant'] = []
-                    if component.get('attendee'):
-                        for attendee in component.get('attendee'):
-                            if isinstance(attendee, vCalAddress):
-                                item['participant'].append({
-                                    'name': vCalAddress.from_ical(attendee),
-                                    'qcode': ''
-                                })
-
-                    # add organizers
-                    item['organizer'] = [{
-                        'name': component.get('organizer', ''),
-                        'qcode': ''
-                    }]
-
-                    # add location
-                    item['location'] = [{
-                        'name': component.get('location', ''),
-                        'qcode': '',
-                        'geo': ''
-                    }]
-                    if component.get('geo'):
-                        item['location'][0]['geo'] = vGeo.from_ical(component.get('geo').to_ical())
-
-                    # IMPORTANT: firstcreated must be less than 2 days past
-                    # we must preserve the original event created and updated in some other fields
-                    if component.get('created'):
-                        item['event_created'] = component.get('created').dt
-                    if component.get('last-modified'):
-                        item['event_lastmodified'] = component.get('last-modified').dt
-                    item['firstcreated'] = utcnow()
-                    item['versioncreated'] = utcnow()
-                    items.append(item)
-            original_source_ids = [_['original_source'] for _ in items if _.get('original_source', None)]
-            existing_items = list(get_resource_service('events').get_from_mongo(req=None, lookup={
-                'original_source': {'$in': original_source_ids}
-            }))
-
-            def original_source_exists(item):
-                """Return true if the item exists in `existing_items`"""
-                for c in existing_items:
-                    if c['original_source'] == item['original_source']:
-                        if c['dates']['start'] == item['dates']['start']:
-                            return True
-                return False
-
-            def is_future(item):
-                """Return true if the item is reccuring or in the future"""
-                if not item['dates'].get('recurring_rule'):
-                    if item['dates']['start'] < utcnow() - datetime.timedelta(days=1):
-                        return False
-                return True
-
-            items = [_ for _ in items if is_future(_)]
-            items = [_ for _ in items if not original_source_exists(_)]
-            return items
+            occur_status = self._get_occur_status()
+            items = [
+                item for item in (
+                    self._parse_component(component, occur_status)
+                    for component in cal.walk() if component.name == "VEVENT"
+                ) if item is not None
+            ]
+            return self._filter_ingested(items)
         except Exception as ex:
             raise ParserError.parseMessageError(ex, provider)
+
+    def parse_stream(self, source, provider=None, batch_size=None):
+        """Parse the calendar lazily, one VEVENT at a time, yielding the new Events in batches
+
+        The calendar is split at the ``BEGIN:VEVENT``/``END:VEVENT`` boundaries, so neither the whole calendar
+        nor the full list of items is kept in memory.
+
+        :param source: the calendar as str, bytes or an iterable of lines (i.e. a file opened in text mode)
+        :param provider: ingest provider
+        :param int batch_size: maximum number of items per batch
+        :return: generator of lists of items
+        """
+        batch_size = batch_size or self.batch_size
+        try:
+            occur_status = self._get_occur_status()
+            batch = []
+            for component in iter_vevents(source):
+                item = self._parse_component(component, occur_status)
+                if item is None:
+                    continue
+
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    items = self._filter_ingested(batch)
+                    batch = []
+                    if items:
+                        yield items
+
+            items = self._filter_ingested(batch)
+            if items:
+                yield items
+        except Exception as ex:
+            raise ParserError.parseMessageError(ex, provider)
+
+    def _filter_ingested(self, items):
+        """Remove the items that were already ingested"""
+        existing_events = self._get_existing_events(items)
+        return [
+            item for item in items
+            if get_dedup_key(item['original_source'], item['dates']['start']) not in existing_events
+        ]
+
+    def _parse_component(self, component, occur_status):
+        """Convert the VEVENT to an Event
+
+        :return dict: the Event, or None if it is a past Event that is not recurring
+        """
+        # add dates
+        # check if component .dt return date instead of datetime, if so, convert to datetime
+        dtstart = component.get('dtstart').dt
+        dates_start = dtstart if isinstance(dtstart, datetime.datetime) \
+            else datetime.datetime.combine(dtstart, datetime.datetime.min.time())
+        if not dates_start.tzinfo:
+            dates_start = local_to_utc(config.DEFAULT_TIMEZONE, dates_start)
+
+        # skip past events before building the item, recurring events are kept
+        if not isinstance(component.get('rrule'), vRecur) and dates_start < utcnow() - datetime.timedelta(days=1):
+            return None
+
+        item = {
+            ITEM_TYPE: CONTENT_TYPE.EVENT,
+            GUID_FIELD: generate_guid(type=GUID_NEWSML),
+            FORMAT: FORMATS.PRESERVED
+        }
+        item['name'] = component.get('summary')
+        item['definition_short'] = component.get('summary')
+        item['definition_long'] = component.get('description')
+        item['original_source'] = component.get('uid')
+        item['state'] = CONTENT_STATE.INGESTED
+        item['pubstatus'] = None
+        if occur_status:
+            item['occur_status'] = dict(occur_status)
+
+        try:
+            dtend = component.get('dtend').dt
+            if isinstance(dtend, datetime.datetime):
+                dates_end = dtend
+            else:  # Date only is non inclusive
+                dates_end = \
+                    (datetime.datetime.combine(dtend, datetime.datetime.max.time()) -
+                     datetime.timedelta(days=1)).replace(microsecond=0)
+            if not dates_end.tzinfo:
+                dates_end = local_to_utc(config.DEFAULT_TIMEZONE, dates_end)
+        except AttributeError:
+            dates_end = None
+        item['dates'] = {
+            'start': dates_start,
+            'end': dates_end,
+            'tz': ''
+        }
+        # parse ics RRULE to fit eventsML recurring_rule
+        r_rule = component.get('rrule')
+        if isinstance(r_rule, vRecur):
+            r_rule_dict = vRecur.from_ical(r_rule)
+            if 'FREQ' in r_rule_dict.keys():
+                item['dates'].setdefault('recurring_rule', {})['frequency'] = ''.join(
+                    r_rule_dict.get('FREQ'))
+            if 'INTERVAL' in r_rule_dict.keys():
+                item['dates'].setdefault('recurring_rule', {})['interval'] = r_rule_dict.get('INTERVAL')[0]
+            if 'UNTIL' in r_rule_dict.keys():
+                item['dates'].setdefault('recurring_rule', {})['until'] = r_rule_dict.get('UNTIL')[0]
+            if 'COUNT' in r_rule_dict.keys():
+                item['dates'].setdefault('recurring_rule', {})['count'] = r_rule_dict.get('COUNT')
+            if 'BYMONTH' in r_rule_dict.keys():
+                item['dates'].setdefault('recurring_rule', {})['bymonth'] = ' '.join(
+                    r_rule_dict.get('BYMONTH'))
+            if 'BYDAY' in r_rule_dict.keys():
+                item['dates'].setdefault('recurring_rule', {})['byday'] = ' '.join(r_rule_dict.get('BYDAY'))
+            if 'BYHOUR' in r_rule_dict.keys():
+                item['dates'].setdefault('recurring_rule', {})['byhour'] = ' '.join(
+                    r_rule_dict.get('BYHOUR'))
+            if 'BYMIN' in r_rule_dict.keys():
+                item['dates'].setdefault('recurring_rule', {})['bymin'] = ' '.join(r_rule_dict.get('BYMIN'))
+
+        # set timezone info if date is a datetime
+        if isinstance(component.get('dtstart').dt, datetime.datetime):
+            item['dates']['tz'] = tzid_from_dt(component.get('dtstart').dt)
+
+        # add participants
+        item['participant'] = []
+        if component.get('attendee'):
+            for attendee in component.get('attendee'):
+                if isinstance(attendee, vCalAddress):
+                    item['participant'].append({
+                        'name': vCalAddress.from_ical(attendee),
+                        'qcode': ''
+                    })
+
+        # add organizers
+        item['organizer'] = [{
+            'name': component.get('organizer', ''),
+            'qcode': ''
+        }]
+
+        # add location
+        item['location'] = [{
+            'name': component.get('location', ''),
+            'qcode': '',
+            'geo': ''
+        }]
+        if component.get('geo'):
+            item['location'][0]['geo'] = vGeo.from_ical(component.get('geo').to_ical())
+
+        # IMPORTANT: firstcreated must be less than 2 days past
+        # we must preserve the original event created and updated in some other fields
+        if component.get('created'):
+            item['event_created'] = component.get('created').dt
+        if component.get('last-modified'):
+            item['event_lastmodified'] = component.get('last-modified').dt
+        item['firstcreated'] = utcnow()
+        item['versioncreated'] = utcnow()
+        return item
+
+    @staticmethod
+    def _get_occur_status():
+        """Get the 'eocstat:eos5' occur status, loaded once per parse"""
+        eocstat_map = get_resource_service('vocabularies').find_one(req=None, _id='eventoccurstatus')
+        if not eocstat_map:
+            return None
+
+        occur_status = [x for x in eocstat_map.get('items', []) if
+                        x['qcode'] == 'eocstat:eos5' and x.get('is_active', True)][0]
+        occur_status = dict(occur_status)
+        occur_status.pop('is_active', None)
+        return occur_status
+
+    @staticmethod
+    def _get_existing_events(items):
+        """Get the (original_source, dates.start) keys of the Events already ingested from the items' sources
+
+        Uses a projected query covered by the ``original_source_1_dates_start_1`` index
+
+        :param list items: parsed items
+        :return set: de-duplication keys, see `get_dedup_key`
+        """
+        original_source_ids = list({item['original_source'] for item in items if item.get('original_source')})
+        if not original_source_ids:
+            return set()
+
+        return {
+            get_dedup_key(event['original_source'], (event.get('dates') or {}).get('start'))
+            for event in get_mongo_collection('events').find(
+                {'original_source': {'$in': original_source_ids}},
+                {'_id': 0, 'original_source': 1, 'dates.start': 1}
+            )
+        }
+
+
+def _iter_lines(source):
+    if isinstance(source, bytes):
+        source = source.decode('utf-8')
+
+    if isinstance(source, str):
+        # Slice the lines one at a time, rather than splitting the whole text into a list
+        position = 0
+        while position < len(source):
+            end = source.find('\n', position)
+            if end == -1:
+                end = len(source)
+            yield source[position:end]
+            position = end + 1
+    else:
+        for line in source:
+            yield line.decode('utf-8') if isinstance(line, bytes) else line
+
+
+def iter_vevents(source):
+    """Lazily split the calendar into its VEVENT components
+
+    :param source: the calendar as str, bytes or an iterable of lines
+    :return: generator of icalendar Event components
+    """
+    lines = None
+    depth = 0
+    for line in _iter_lines(source):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t'):
+            # Folded continuation of the previous content line, never a BEGIN/END keyword
+            if lines is not None:
+                lines.append(line)
+            continue
+
+        keyword = line.rstrip().upper()
+        if lines is None:
+            if keyword == 'BEGIN:VEVENT':
+                lines = [line]
+                depth = 1
+            continue
+
+        lines.append(line)
+        if keyword.startswith('BEGIN:'):
+            depth += 1
+        elif keyword.startswith('END:'):
+            depth -= 1
+            if depth == 0:
+                yield Event.from_ical('\r\n'.join(lines) + '\r\n')
+                lines = None
+
+
+def get_dedup_key(original_source, start):
+    """Get the key identifying an Event by its source id and start date
+
+    The start date is normalised to naive UTC with millisecond precision, the way it is stored in mongo
+    """
+    if isinstance(start, datetime.datetime):
+        if start.tzinfo:
+            start = start.astimezone(utc).replace(tzinfo=None)
+        start = start.replace(microsecond=start.microsecond // 1000 * 1000)
+
+    return original_source, start
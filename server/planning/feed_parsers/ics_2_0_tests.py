@@ -1,10 +1,13 @@
-from planning.feed_parsers.ics_2_0 import IcsTwoFeedParser
+from planning.feed_parsers.ics_2_0 import IcsTwoFeedParser, iter_vevents
 import os
 from icalendar import Calendar
 from eve.utils import config
 from planning.tests import TestCase
+from superdesk import get_resource_service
 from datetime import datetime, timezone
 import mock
+import tempfile
+import tracemalloc
 from pytz import timezone as pytimezone
 
 
@@ -59,3 +62,79 @@ class IcsTwoFeedParserTestCase(TestCase):
             self.assertEqual(events[0].get('dates').get('start'), datetime(2018, 3, 1, 13, tzinfo=timezone.utc))
             self.assertEqual(events[0].get('dates').get('end'),
                              datetime(2018, 3, 2, 12, 59, 59, 0, tzinfo=timezone.utc))
+
+    @mock.patch('planning.feed_parsers.ics_2_0.utcnow', mock_utcnow)
+    def test_skips_ingested_events(self):
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        calendar = open(os.path.join(dir_path, 'parl_cal.ics'))
+        self.calendar = Calendar.from_ical(calendar.read())
+        with self.app.app_context():
+            events = IcsTwoFeedParser().parse(self.calendar)
+            self.app.data.insert('events', [dict(event) for event in events[:3]])
+
+            with mock.patch('planning.feed_parsers.ics_2_0.get_resource_service',
+                            wraps=get_resource_service) as get_service:
+                remaining = IcsTwoFeedParser().parse(self.calendar)
+                self.assertEqual(get_service.call_count, 1)
+
+            self.assertEqual(len(remaining), len(events) - 3)
+            self.assertNotIn(events[0]['original_source'], [event['original_source'] for event in remaining])
+
+    @mock.patch('planning.feed_parsers.ics_2_0.utcnow', mock_utcnow)
+    def test_parse_stream_matches_parse(self):
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        with open(os.path.join(dir_path, 'parl_cal.ics'), 'rb') as f:
+            content = f.read()
+
+        with self.app.app_context():
+            events = IcsTwoFeedParser().parse(Calendar.from_ical(content))
+            batches = list(IcsTwoFeedParser().parse_stream(content, batch_size=5))
+
+        self.assertTrue(all(len(batch) <= 5 for batch in batches))
+        self.assertEqual([event['original_source'] for event in events],
+                         [event['original_source'] for batch in batches for event in batch])
+
+    def test_iter_vevents_skips_folded_lines(self):
+        content = ('BEGIN:VCALENDAR\r\nVERSION:2.0\r\n'
+                   'BEGIN:VEVENT\r\nUID:event-1@superdesk\r\nSUMMARY:First\r\n'
+                   'DESCRIPTION:The agenda continues\r\n END:VEVENT and more\r\n\tBEGIN:VALARM as text\r\n'
+                   'END:VEVENT\r\n'
+                   'BEGIN:VEVENT\r\nUID:event-2@superdesk\r\nSUMMARY:Second\r\nEND:VEVENT\r\n'
+                   'END:VCALENDAR\r\n')
+
+        events = list(iter_vevents(content))
+        self.assertEqual([str(event['UID']) for event in events], ['event-1@superdesk', 'event-2@superdesk'])
+        self.assertEqual(str(events[0]['DESCRIPTION']), 'The agenda continuesEND:VEVENT and moreBEGIN:VALARM as text')
+
+    def test_parse_stream_memory_is_flat(self):
+        def write_calendar(count):
+            f = tempfile.NamedTemporaryFile('w', suffix='.ics', delete=False)
+            f.write('BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Superdesk//Test//EN\r\n')
+            for i in range(count):
+                f.write('BEGIN:VEVENT\r\nUID:event-{0}@superdesk\r\nSUMMARY:Event {0}\r\n'
+                        'DESCRIPTION:{1}\r\nDTSTART:20300101T{2:02d}0000Z\r\nDTEND:20300101T{2:02d}3000Z\r\n'
+                        'END:VEVENT\r\n'.format(i, 'Lorem ipsum ' * 20, i % 24))
+            f.write('END:VCALENDAR\r\n')
+            f.close()
+            self.addCleanup(os.remove, f.name)
+            return f.name
+
+        def get_peak(path):
+            parser = IcsTwoFeedParser()
+            tracemalloc.start()
+            try:
+                with open(path, 'rb') as f:
+                    for items in parser.parse_stream(f, batch_size=50):
+                        self.assertLessEqual(len(items), 50)
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        small = write_calendar(500)
+        large = write_calendar(5000)
+        with self.app.app_context():
+            get_peak(small)  # warm up the caches of the parser and the db
+            peak_small = get_peak(small)
+            peak_large = get_peak(large)
+
+        self.assertLess(peak_large, peak_small * 2)
@@ -20,7 +20,6 @@ from superdesk.media.media_operations import process_file_from_stream
 from planning.feed_parsers.ntb_event_xml import NTBEventXMLFeedParser
 from planning.feed_parsers.ics_2_0 import IcsTwoFeedParser
 from xml.etree import ElementTree
-from icalendar import Calendar
 
 
 logger = logging.getLogger(__name__)
@@ -128,9 +127,9 @@ class EventEmailFeedingService(FeedingService):
                                                     if content_type != 'text/calendar':
                                                         continue
                                                     content.seek(0)
-                                                    cal = Calendar.from_ical(content.read())
                                                     logger.info('Ingesting events with ics parser')
-                                                    new_items.append(parser.parse(cal, provider))
+                                                    new_items.extend(parser.parse_stream(content.read(),
+                                                                                         provider))
                                                 else:
                                                     logger.warn('Ingesting events with unknown parser')
                                                     new_items.append(parser.parse(data, provider))
@@ -10,6 +10,7 @@
 
 import logging
 import os
+import time
 from datetime import datetime
 
 from xml.etree import ElementTree
@@ -19,8 +20,18 @@ from planning.feed_parsers.ntb_event_xml import NTBEventXMLFeedParser
 from planning.feed_parsers.ics_2_0 import IcsTwoFeedParser
 from superdesk.notification import push_notification
 from superdesk.utc import utc
-from superdesk.utils import get_sorted_files, FileSortAttributes
-from icalendar import Calendar
+from superdesk import get_resource_service
+from eve.utils import config
+from flask import current_app as app
+from planning.feeding_services.file_scanner import scan_directory, stat_files, get_changed_files, get_file_state, \
+    get_directory_watcher, parse_xml_files
+
+# Size in bytes from which the xml files are parsed in the process pool
+DEFAULT_POOL_THRESHOLD = 10 * 1024 * 1024
+DEFAULT_POOL_SIZE = 4
+# Seconds before moving an ingested file out of the folder is retried, doubled after each failed attempt
+MOVE_RETRY_DELAY = 60
+MOVE_RETRY_MAX_DELAY = 3600
 
 logger = logging.getLogger(__name__)
 
@@ -64,44 +75,129 @@ class EventFileFeedingService(FileFeedingService):
             return []
 
         registered_parser = self.get_feed_parser(provider)
-        for filename in get_sorted_files(self.path, sort_by=FileSortAttributes.created):
-            try:
-                last_updated = None
-                file_path = os.path.join(self.path, filename)
-                if os.path.isfile(file_path):
-                    stat = os.lstat(file_path)
-                    last_updated = datetime.fromtimestamp(stat.st_mtime, tz=utc)
-
-                    if self.is_latest_content(last_updated, provider.get('last_updated')):
-                        if isinstance(registered_parser, NTBEventXMLFeedParser):
-                            logger.info('Ingesting xml events')
-                            with open(file_path, 'rb') as f:
-                                xml = ElementTree.parse(f)
-                                parser = self.get_feed_parser(provider, xml.getroot())
-                                item = parser.parse(xml.getroot(), provider)
-                        elif isinstance(registered_parser, IcsTwoFeedParser):
-                            logger.info('Ingesting ics events')
-                            with open(file_path, 'rb') as f:
-                                cal = Calendar.from_ical(f.read())
-                                parser = self.get_feed_parser(provider, cal)
-                                item = parser.parse(cal, provider)
-                        else:
-                            logger.info('Ingesting events with unknown parser')
-                            parser = self.get_feed_parser(provider, file_path)
-                            item = parser.parse(file_path, provider)
-
-                        self.after_extracting(item, provider)
-                        self.move_file(self.path, filename, provider=provider, success=True)
-
-                        if isinstance(item, list):
-                            yield item
-                        else:
-                            yield [item]
-                    else:
-                        self.move_file(self.path, filename, provider=provider, success=True)
-            except Exception as ex:
-                if last_updated and self.is_old_content(last_updated):
-                    self.move_file(self.path, filename, provider=provider, success=False)
-                raise ParserError.parseFileError('{}-{}'.format(provider['name'], self.NAME), filename, ex, provider)
+        manifest_service = get_resource_service('ingest_file_manifest')
+        provider_id = provider.get(config.ID_FIELD)
+        manifest = manifest_service.get_manifest(provider_id)
+
+        watcher = get_directory_watcher(self.path)
+        if watcher is not None and not watcher.has_changes():
+            # Nothing happened in the folder, only the files of the manifest are checked
+            files = stat_files(self.path, manifest)
+            changed, touched = [], []
+        else:
+            files = scan_directory(self.path)
+            changed, touched = get_changed_files(self.path, files, manifest)
+
+        states = {state.filename: state for state in touched}
+        removed = [filename for filename in manifest if filename not in files]
+        self._move_ingested_files(provider, files, manifest, changed, states, removed)
+
+        futures = {}
+        if isinstance(registered_parser, NTBEventXMLFeedParser):
+            threshold = app.config.get('PLANNING_FILE_INGEST_POOL_THRESHOLD', DEFAULT_POOL_THRESHOLD)
+            futures = parse_xml_files([scanned.path for scanned in changed if scanned.stat.st_size >= threshold],
+                                      app.config.get('PLANNING_FILE_INGEST_POOL_SIZE', DEFAULT_POOL_SIZE))
+
+        completed = False
+        try:
+            for scanned in changed:
+                try:
+                    yield from self._ingest_file(provider, registered_parser, scanned, futures.get(scanned.path))
+                except Exception:
+                    # Failed files are left out of the manifest, so the next poll retries them
+                    if scanned.filename in manifest:
+                        removed.append(scanned.filename)
+                    raise
+
+                # The file stays in the folder only when it couldn't be moved
+                if os.path.isfile(scanned.path):
+                    states[scanned.filename] = get_file_state(scanned)._replace(
+                        retry_move_at=time.time() + get_move_retry_delay(0)
+                    )
+                elif scanned.filename in manifest:
+                    removed.append(scanned.filename)
+            completed = True
+        finally:
+            manifest_service.save_states(provider_id, states.values())
+            manifest_service.remove_files(provider_id, removed)
+            if watcher is not None and not completed:
+                # Scan the folder on the next poll, to retry the files that were not ingested
+                watcher.reset()
 
         push_notification('ingest:update')
+
+    def _move_ingested_files(self, provider, files, manifest, changed, states, removed):
+        """Retry moving the files that were ingested, but couldn't be moved out of the folder
+
+        Each file is retried once its backoff delay elapsed, rather than on every poll
+        """
+        now = time.time()
+        changed_filenames = {scanned.filename for scanned in changed}
+        for filename in files:
+            state = states.get(filename) or manifest.get(filename)
+            if state is None or filename in changed_filenames or state.retry_move_at > now:
+                continue
+
+            self.move_file(self.path, filename, provider=provider, success=True)
+            if os.path.isfile(os.path.join(self.path, filename)):
+                states[filename] = state._replace(move_attempts=state.move_attempts + 1,
+                                                  retry_move_at=now + get_move_retry_delay(state.move_attempts + 1))
+            else:
+                states.pop(filename, None)
+                removed.append(filename)
+
+    def _ingest_file(self, provider, registered_parser, scanned, future=None):
+        """Parse the file, yielding its items
+
+        :param provider: ingest provider
+        :param registered_parser: feed parser of the provider
+        :param ScannedFile scanned: the file
+        :param future: future of the root Element, when the xml file was parsed in the process pool
+        """
+        filename = scanned.filename
+        file_path = scanned.path
+        last_updated = None
+        try:
+            last_updated = datetime.fromtimestamp(scanned.stat.st_mtime, tz=utc)
+
+            if self.is_latest_content(last_updated, provider.get('last_updated')):
+                if isinstance(registered_parser, NTBEventXMLFeedParser):
+                    logger.info('Ingesting xml events')
+                    if future is not None:
+                        root = future.result()
+                    else:
+                        with open(file_path, 'rb') as f:
+                            root = ElementTree.parse(f).getroot()
+                    parser = self.get_feed_parser(provider, root)
+                    item = parser.parse(root, provider)
+                elif isinstance(registered_parser, IcsTwoFeedParser):
+                    logger.info('Ingesting ics events')
+                    with open(file_path, 'rb') as f:
+                        for items in registered_parser.parse_stream(f, provider):
+                            self.after_extracting(items, provider)
+                            yield items
+                    self.move_file(self.path, filename, provider=provider, success=True)
+                    return
+                else:
+                    logger.info('Ingesting events with unknown parser')
+                    parser = self.get_feed_parser(provider, file_path)
+                    item = parser.parse(file_path, provider)
+
+                self.after_extracting(item, provider)
+                self.move_file(self.path, filename, provider=provider, success=True)
+
+                if isinstance(item, list):
+                    yield item
+                else:
+                    yield [item]
+            else:
+                self.move_file(self.path, filename, provider=provider, success=True)
+        except Exception as ex:
+            if last_updated and self.is_old_content(last_updated):
+                self.move_file(self.path, filename, provider=provider, success=False)
+            raise ParserError.parseFileError('{}-{}'.format(provider['name'], self.NAME), filename, ex, provider)
+
+
+def get_move_retry_delay(attempts):
+    """Get the seconds to wait before retrying to move an ingested file, after the failed attempts"""
+    return min(MOVE_RETRY_DELAY * 2 ** attempts, MOVE_RETRY_MAX_DELAY)
@@ -1,31 +1,150 @@
+import os
+import shutil
+import tempfile
+import time
 from mock import patch
-from planning.feeding_services.event_file_service import EventFileFeedingService
+from planning.feeding_services.event_file_service import EventFileFeedingService, get_move_retry_delay
+from planning.feed_parsers.ics_2_0 import IcsTwoFeedParser
 from planning.tests import TestCase
+from superdesk import get_resource_service
+from superdesk.errors import ParserError
 
-
-os = object()
-get_sorted_files = object()
+CALENDAR = """BEGIN:VCALENDAR\r
+VERSION:2.0\r
+PRODID:-//Superdesk//Test//EN\r
+BEGIN:VEVENT\r
+UID:{uid}@superdesk\r
+SUMMARY:Conference\r
+DTSTART:20300101T100000Z\r
+DTEND:20300101T120000Z\r
+END:VEVENT\r
+END:VCALENDAR\r
+"""
 
 
 class EventFileFeedingServiceTestCase(TestCase):
 
     def setUp(self):
         super().setUp()
+        self.app.data.insert('vocabularies', [{'_id': 'eventoccurstatus', 'items': [{
+            'is_active': True,
+            'qcode': 'eocstat:eos5',
+            'name': 'Planned, occurs certainly'
+        }]}])
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.provider = {
+            '_id': 'file_provider',
+            'name': 'file provider',
+            'feed_parser': 'ics20',
+            'config': {'path': self.path}
+        }
+
+    def _write(self, filename, uid):
+        with open(os.path.join(self.path, filename), 'w') as f:
+            f.write(CALENDAR.format(uid=uid))
+
+    def _update(self):
+        service = EventFileFeedingService()
+        return [event for items in service._update(self.provider, None) for event in items]
+
+    def test_update(self):
+        with self.app.app_context():
+            self._write('event.ics', 'event-1')
+            os.mkdir(os.path.join(self.path, 'subfolder'))
+
+            events = self._update()
+            self.assertEqual(len(events), 1)
+            self.assertFalse(os.path.exists(os.path.join(self.path, 'event.ics')))
+            self.assertEqual(get_resource_service('ingest_file_manifest').get_manifest('file_provider'), {})
+
+    @patch.object(EventFileFeedingService, 'move_file')
+    def test_parses_only_new_or_changed_files(self, move_file):
+        with self.app.app_context():
+            self._write('event1.ics', 'event-1')
+            self.assertEqual(len(self._update()), 1)
+
+            manifest = get_resource_service('ingest_file_manifest').get_manifest('file_provider')
+            self.assertEqual(list(manifest.keys()), ['event1.ics'])
+
+            with patch.object(IcsTwoFeedParser, 'parse_stream', wraps=IcsTwoFeedParser().parse_stream) as parse:
+                self._write('event2.ics', 'event-2')
+                self.assertEqual(len(self._update()), 1)
+                self.assertEqual(parse.call_count, 1)
+
+                # Touched, but the content is the same
+                touched = time.time() - 60
+                os.utime(os.path.join(self.path, 'event1.ics'), (touched, touched))
+                self.assertEqual(self._update(), [])
+                self.assertEqual(parse.call_count, 1)
+
+                self._write('event1.ics', 'event-3')
+                self.assertEqual(len(self._update()), 1)
+                self.assertEqual(parse.call_count, 2)
 
-    @patch('planning.feeding_services.event_file_service.os')
-    @patch('planning.feeding_services.event_file_service.get_sorted_files')
-    def test_update(self, mock_os, mock_get_sorted_files):
+            os.remove(os.path.join(self.path, 'event2.ics'))
+            self._update()
+            manifest = get_resource_service('ingest_file_manifest').get_manifest('file_provider')
+            self.assertEqual(list(manifest.keys()), ['event1.ics'])
+
+    def test_retries_failed_files(self):
+        with self.app.app_context():
+            self._write('event.ics', 'event-1')
+
+            with patch.object(IcsTwoFeedParser, 'parse_stream', side_effect=Exception('elastic is down')):
+                with self.assertRaises(ParserError):
+                    self._update()
+
+            # The file is left in the folder, and out of the manifest
+            self.assertTrue(os.path.exists(os.path.join(self.path, 'event.ics')))
+            self.assertEqual(get_resource_service('ingest_file_manifest').get_manifest('file_provider'), {})
+
+            # The next poll retries it
+            self.assertEqual(len(self._update()), 1)
+            self.assertFalse(os.path.exists(os.path.join(self.path, 'event.ics')))
+
+    @patch('planning.feeding_services.event_file_service.get_directory_watcher')
+    def test_retries_moving_ingested_files_without_activity(self, get_directory_watcher):
+        get_directory_watcher.return_value.has_changes.return_value = True
         with self.app.app_context():
+            self._write('event.ics', 'event-1')
+            with patch.object(EventFileFeedingService, 'move_file'):
+                self.assertEqual(len(self._update()), 1)
+            self.assertEqual(list(get_resource_service('ingest_file_manifest').get_manifest('file_provider')),
+                             ['event.ics'])
+
+            # The move is only retried once its delay elapsed
+            get_directory_watcher.return_value.has_changes.return_value = False
+            with patch.object(EventFileFeedingService, 'move_file') as move_file:
+                self.assertEqual(self._update(), [])
+            self.assertFalse(move_file.called)
+            self._expire_move_retries()
+
+            # Nothing happened in the folder, the move of the ingested file is still retried
+            self.assertEqual(self._update(), [])
+            self.assertFalse(os.path.exists(os.path.join(self.path, 'event.ics')))
+            self.assertEqual(get_resource_service('ingest_file_manifest').get_manifest('file_provider'), {})
+
+    @patch('planning.feeding_services.event_file_service.get_directory_watcher', return_value=None)
+    def test_backs_off_moving_ingested_files(self, get_directory_watcher):
+        with self.app.app_context():
+            self._write('event.ics', 'event-1')
+            with patch.object(EventFileFeedingService, 'move_file') as move_file:
+                self.assertEqual(len(self._update()), 1)
+                self.assertEqual(move_file.call_count, 1)
+
+                for attempts in (1, 2):
+                    self._expire_move_retries()
+                    self.assertEqual(self._update(), [])
+                    self.assertEqual(self._update(), [])
+                    self.assertEqual(move_file.call_count, 1 + attempts)
+
+                    state = get_resource_service('ingest_file_manifest').get_manifest('file_provider')['event.ics']
+                    self.assertEqual(state.move_attempts, attempts)
+                    self.assertGreater(state.retry_move_at, time.time() + get_move_retry_delay(attempts) - 10)
 
-            service = EventFileFeedingService()
-            provider = {
-                'feed_parser': 'ics20',
-                'config': {
-                    'path': '/test_file_drop'
-                }
-            }
-            mock_get_sorted_files.return_value = ['file1.txt', 'file2.txt', 'file3.txt']
-            mock_os.path.isfile.return_value = True
-
-            events = list(service._update(provider, None))
-            self.assertEqual(len(events), 0)
+    def _expire_move_retries(self):
+        service = get_resource_service('ingest_file_manifest')
+        service.save_states('file_provider', [
+            state._replace(retry_move_at=0) for state in service.get_manifest('file_provider').values()
+        ])
@@ -9,6 +9,8 @@
 # at https://www.sourcefabric.org/superdesk/license
 
 import datetime
+import hashlib
+import json
 import requests
 import traceback
 
@@ -20,7 +22,32 @@ from superdesk.utc import utcnow
 from planning.feed_parsers.ntb_event_xml import NTBEventXMLFeedParser
 from planning.feed_parsers.ics_2_0 import IcsTwoFeedParser
 from flask import current_app as app
-from icalendar import Calendar
+from requests.adapters import HTTPAdapter
+
+# Key of the provider config storing the validators and content hash of the last fetch
+HTTP_CACHE_FIELD = 'http_cache'
+
+# Shared by the feeds, so the connections to the same host are kept alive between polls
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_connections=10, pool_maxsize=10))
+session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=10))
+
+http_feed_stats = {}
+
+
+def get_provider_stats(provider):
+    """Get the fetch counters of the provider in the current process"""
+    return http_feed_stats.setdefault(str(provider.get('_id')), {
+        'fetches': 0,
+        'not_modified': 0,
+        'bytes_fetched': 0,
+        'parses': 0,
+        'parses_skipped': 0,
+    })
+
+
+def reset_http_feed_stats():
+    http_feed_stats.clear()
 
 
 class EventHTTPFeedingService(HTTPFeedingService):
@@ -66,15 +93,14 @@ class EventHTTPFeedingService(HTTPFeedingService):
 
         self.URL = provider_config.get('url')
         payload = {}
+        stats = get_provider_stats(provider)
+        cache = provider_config.get(HTTP_CACHE_FIELD) or {}
 
         parser = self.get_feed_parser(provider)
 
         try:
-            response = requests.get(self.URL, params=payload, timeout=15)
-            # TODO: check if file has been updated since provider last_updated
-            # although some ptovider do not include 'Last-Modified' in headers
-            # so unsure how to do this
-            logger.info('Http Headers: %s', response.headers)
+            response = session.get(self.URL, params=payload, headers=self._get_conditional_headers(cache), timeout=15)
+            logger.debug('Http Headers: %s', response.headers)
         except requests.exceptions.Timeout as ex:
             # Maybe set up for a retry, or continue in a retry loop
             raise IngestApiError.apiTimeoutError(ex, self.provider)
@@ -91,18 +117,74 @@ class EventHTTPFeedingService(HTTPFeedingService):
         if response.status_code == 404:
             raise LookupError('Not found %s' % payload)
 
-        logger.info('Ingesting: %s', str(response.content))
+        stats['fetches'] += 1
+        if response.status_code == 304:
+            stats['not_modified'] += 1
+            stats['parses_skipped'] += 1
+            logger.info('Feed {} not modified since the last fetch'.format(self.URL))
+            self._log_metrics(provider, 'not_modified', stats)
+            return
+
+        stats['bytes_fetched'] += len(response.content)
+        sha256 = hashlib.sha256(response.content).hexdigest()
+        if cache.get('sha256') == sha256:
+            # The server ignored the conditional headers, but the feed is the same
+            stats['parses_skipped'] += 1
+            logger.info('Feed {} content is unchanged since the last fetch'.format(self.URL))
+            self._set_cache(provider, update, response, sha256)
+            self._log_metrics(provider, 'unchanged', stats)
+            return
+
+        logger.info('Ingesting {} bytes from {}'.format(len(response.content), self.URL))
 
         if isinstance(parser, NTBEventXMLFeedParser):
             xml = ET.fromstring(response.content)
             items = parser.parse(xml, provider)
         elif isinstance(parser, IcsTwoFeedParser):
-            cal = Calendar.from_ical(response.content)
-            items = parser.parse(cal, provider)
+            for items in parser.parse_stream(response.content, provider):
+                yield items
+            items = None
         else:
             items = parser.parse(response.content)
 
         if isinstance(items, list):
             yield items
-        else:
+        elif items is not None:
             yield [items]
+
+        # Only remember the content once it was parsed, so a failed parse is retried on the next poll
+        stats['parses'] += 1
+        self._set_cache(provider, update, response, sha256)
+        self._log_metrics(provider, 'parsed', stats)
+
+    @staticmethod
+    def _log_metrics(provider, result, stats):
+        """Log the result of the poll, with the fetch counters of the provider in the current process"""
+        metrics = {
+            'task': 'event_http_feed',
+            'provider': str(provider.get('_id')),
+            'result': result,
+        }
+        metrics.update(stats)
+        logger.info('Metrics: {}'.format(json.dumps(metrics, sort_keys=True)))
+
+    @staticmethod
+    def _get_conditional_headers(cache):
+        headers = {}
+        if cache.get('etag'):
+            headers['If-None-Match'] = cache['etag']
+        if cache.get('last_modified'):
+            headers['If-Modified-Since'] = cache['last_modified']
+        return headers
+
+    @staticmethod
+    def _set_cache(provider, update, response, sha256):
+        """Store the validators and hash of the feed on the provider config"""
+        provider['config'][HTTP_CACHE_FIELD] = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'sha256': sha256,
+        }
+
+        if update is not None:
+            update['config'] = provider['config']
@@ -1,11 +1,140 @@
-from planning.feeding_services.event_http_service import EventHTTPFeedingService
+import json
+import mock
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from planning.feeding_services.event_http_service import EventHTTPFeedingService, get_provider_stats, \
+    reset_http_feed_stats
+from planning.feed_parsers.ics_2_0 import IcsTwoFeedParser
 from planning.tests import TestCase
 
+CALENDAR = """BEGIN:VCALENDAR\r
+VERSION:2.0\r
+PRODID:-//Superdesk//Test//EN\r
+BEGIN:VEVENT\r
+UID:{uid}@superdesk\r
+SUMMARY:Conference\r
+DTSTART:20300101T100000Z\r
+DTEND:20300101T120000Z\r
+END:VEVENT\r
+END:VCALENDAR\r
+"""
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """Serves the feed of the server, answering the conditional requests unless `ignore_conditional` is set"""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        etag = '"{}"'.format(server.version)
+        if not server.ignore_conditional and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = server.body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/calendar')
+        self.send_header('Content-Length', str(len(body)))
+        if not server.ignore_conditional:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
 
 class EventHTTPFeedingServiceTestCase(TestCase):
 
     def setUp(self):
         super().setUp()
+        self.app.data.insert('vocabularies', [{'_id': 'eventoccurstatus', 'items': [{
+            'is_active': True,
+            'qcode': 'eocstat:eos5',
+            'name': 'Planned, occurs certainly'
+        }]}])
+        reset_http_feed_stats()
+
+        self.server = HTTPServer(('127.0.0.1', 0), FeedHandler)
+        self.server.requests = []
+        self.server.version = 1
+        self.server.body = CALENDAR.format(uid='event-1')
+        self.server.ignore_conditional = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.provider = {
+            '_id': 'stub',
+            'feed_parser': 'ics20',
+            'config': {'url': 'http://127.0.0.1:{}/feed.ics'.format(self.server.server_port)}
+        }
+
+    def _fetch(self):
+        update = {}
+        events = [event for items in EventHTTPFeedingService()._update(self.provider, update) for event in items]
+        return events, update
+
+    def test_conditional_get(self):
+        with self.app.app_context():
+            events, update = self._fetch()
+            self.assertEqual(len(events), 1)
+            self.assertEqual(update['config']['http_cache']['etag'], '"1"')
+            self.assertNotIn('If-None-Match', self.server.requests[0])
+
+            events, update = self._fetch()
+            self.assertEqual(events, [])
+            self.assertEqual(self.server.requests[1].get('If-None-Match'), '"1"')
+
+            self.server.version = 2
+            self.server.body = CALENDAR.format(uid='event-2')
+            events, update = self._fetch()
+            self.assertEqual(len(events), 1)
+            self.assertEqual(update['config']['http_cache']['etag'], '"2"')
+
+        stats = get_provider_stats(self.provider)
+        self.assertEqual(stats['fetches'], 3)
+        self.assertEqual(stats['not_modified'], 1)
+        self.assertEqual(stats['parses'], 2)
+        self.assertEqual(stats['parses_skipped'], 1)
+        self.assertEqual(stats['bytes_fetched'], len(CALENDAR.format(uid='event-1')) * 2)
+
+    def test_metrics_logged_after_each_poll(self):
+        with self.app.app_context():
+            with mock.patch('planning.feeding_services.event_http_service.logger') as logger:
+                self._fetch()
+                self._fetch()
+
+        metrics = [
+            json.loads(call[0][0][len('Metrics: '):]) for call in logger.info.call_args_list
+            if call[0][0].startswith('Metrics: ')
+        ]
+        self.assertEqual([entry['result'] for entry in metrics], ['parsed', 'not_modified'])
+        self.assertEqual(metrics[1]['provider'], 'stub')
+        self.assertEqual(metrics[1]['fetches'], 2)
+        self.assertEqual(metrics[1]['not_modified'], 1)
+
+    def test_content_hash_when_conditional_headers_are_ignored(self):
+        self.server.ignore_conditional = True
+        with self.app.app_context():
+            events, update = self._fetch()
+            self.assertEqual(len(events), 1)
+            self.assertIsNone(update['config']['http_cache']['etag'])
+
+            with mock.patch.object(IcsTwoFeedParser, 'parse_stream') as parse_stream:
+                events, update = self._fetch()
+                self.assertEqual(events, [])
+                self.assertFalse(parse_stream.called)
+
+            self.server.body = CALENDAR.format(uid='event-2')
+            events, update = self._fetch()
+            self.assertEqual(len(events), 1)
+
+        stats = get_provider_stats(self.provider)
+        self.assertEqual(stats['fetches'], 3)
+        self.assertEqual(stats['parses'], 2)
+        self.assertEqual(stats['parses_skipped'], 1)
 
     def test_update(self):
         with self.app.app_context():
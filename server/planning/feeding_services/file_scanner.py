@@ -0,0 +1,184 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+"""Incremental scanning of the event file drop folders
+
+The folder is listed with ``os.scandir`` and compared against the manifest of the files seen on the previous polls,
+so only the new or modified files are parsed. When ``inotify_simple`` is installed the folder is watched, and isn't
+listed at all on the polls where nothing happened in it.
+"""
+
+import hashlib
+import logging
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+
+try:
+    from inotify_simple import INotify, flags
+    inotify_installed = True
+except ImportError:
+    inotify_installed = False
+
+logger = logging.getLogger(__name__)
+
+# move_attempts and retry_move_at track the files that were ingested, but couldn't be moved out of the folder
+FileState = namedtuple('FileState', ['filename', 'size', 'mtime', 'hash', 'move_attempts', 'retry_move_at'])
+FileState.__new__.__defaults__ = (0, 0)
+ScannedFile = namedtuple('ScannedFile', ['filename', 'path', 'stat'])
+
+
+def scan_directory(path):
+    """Get the regular files of the folder, with a single stat call per file
+
+    :param str path: path of the folder
+    :return dict: os.stat_result of the files, by filename
+    """
+    files = {}
+    entries = os.scandir(path)
+    try:
+        for entry in entries:
+            if entry.is_file():
+                files[entry.name] = entry.stat()
+    finally:
+        # The iterator is only a context manager from Python 3.6
+        close = getattr(entries, 'close', None)
+        if close is not None:
+            close()
+    return files
+
+
+def stat_files(path, filenames):
+    """Get the stat of the files of the folder that still exist, without listing the folder
+
+    :param str path: path of the folder
+    :param filenames: names of the files
+    :return dict: os.stat_result of the files, by filename
+    """
+    files = {}
+    for filename in filenames:
+        try:
+            stat = os.stat(os.path.join(path, filename))
+        except FileNotFoundError:
+            continue
+        files[filename] = stat
+    return files
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Get the SHA-256 hex digest of the file content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_changed_files(path, files, manifest):
+    """Compare the scanned files against the manifest
+
+    Files with the size and mtime of the manifest are unchanged without being read, the others are hashed
+    only if they are in the manifest, as a touched file with the same content is unchanged as well.
+
+    :param str path: path of the folder
+    :param dict files: os.stat_result of the files, by filename (see `scan_directory`)
+    :param dict manifest: FileState of the files seen on the previous polls, by filename
+    :return tuple: the new or modified ScannedFile list sorted by creation time,
+        and the FileState list of the touched but unchanged files
+    """
+    changed = []
+    touched = []
+    for filename, stat in files.items():
+        state = manifest.get(filename)
+        if state is not None:
+            if state.size == stat.st_size and state.mtime == stat.st_mtime:
+                continue
+
+            file_path = os.path.join(path, filename)
+            if state.size == stat.st_size and state.hash == hash_file(file_path):
+                touched.append(state._replace(mtime=stat.st_mtime))
+                continue
+
+        changed.append(ScannedFile(filename, os.path.join(path, filename), stat))
+
+    changed.sort(key=lambda scanned: (scanned.stat.st_ctime, scanned.filename))
+    return changed, touched
+
+
+def get_file_state(scanned):
+    """Get the FileState of the scanned file, to store in the manifest"""
+    return FileState(scanned.filename, scanned.stat.st_size, scanned.stat.st_mtime, hash_file(scanned.path))
+
+
+class DirectoryWatcher:
+    """Watch a folder with inotify, telling if anything happened in it since the last call"""
+
+    def __init__(self, path):
+        self.path = path
+        self.inotify = INotify()
+        self.inotify.add_watch(path, flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_TO |
+                               flags.MOVED_FROM | flags.DELETE | flags.ATTRIB)
+        # Nothing is known about the folder until it was scanned once
+        self.changed = True
+
+    def has_changes(self):
+        events = self.inotify.read(timeout=0)
+        changed = self.changed or bool(events)
+        self.changed = False
+        return changed
+
+    def reset(self):
+        """Report changes on the next call, i.e. when the scan didn't complete"""
+        self.changed = True
+
+
+_watchers = {}
+
+
+def get_directory_watcher(path):
+    """Get the watcher of the folder, or None when inotify isn't available"""
+    if not inotify_installed:
+        return None
+
+    if path not in _watchers:
+        try:
+            _watchers[path] = DirectoryWatcher(path)
+        except OSError as e:
+            logger.warning('Failed to watch {} with inotify: {}'.format(path, e))
+            _watchers[path] = None
+
+    return _watchers[path]
+
+
+def _parse_xml(path):
+    return ElementTree.parse(path).getroot()
+
+
+def parse_xml_files(paths, workers):
+    """Parse the xml files in a process pool
+
+    :param list paths: paths of the files
+    :param int workers: number of processes
+    :return dict: future of the root Element, by path. Empty if the pool can't be used in this process
+    """
+    if len(paths) < 2 or workers < 2:
+        return {}
+
+    try:
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(paths)))
+        futures = {path: executor.submit(_parse_xml, path) for path in paths}
+    except Exception as e:
+        # i.e. daemonic worker processes can't have children
+        logger.warning('Failed to parse the files in a process pool: {}'.format(e))
+        return {}
+
+    executor.shutdown(wait=False)
+    return futures
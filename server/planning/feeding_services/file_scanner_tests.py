@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+from xml.etree import ElementTree
+from planning.feeding_services.file_scanner import scan_directory, get_changed_files, get_file_state, \
+    parse_xml_files, ScannedFile
+
+
+class FileScannerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def _write(self, filename, content):
+        with open(os.path.join(self.path, filename), 'w') as f:
+            f.write(content)
+
+    def _get_manifest(self):
+        files = scan_directory(self.path)
+        return {
+            filename: get_file_state(ScannedFile(filename, os.path.join(self.path, filename), stat))
+            for filename, stat in files.items()
+        }
+
+    def test_scan_directory(self):
+        self._write('a.xml', 'a')
+        os.mkdir(os.path.join(self.path, '_PROCESSED'))
+        files = scan_directory(self.path)
+        self.assertEqual(list(files.keys()), ['a.xml'])
+        self.assertEqual(files['a.xml'].st_size, 1)
+
+    def test_get_changed_files(self):
+        self._write('a.xml', 'a')
+        self._write('b.xml', 'b')
+        manifest = self._get_manifest()
+
+        changed, touched = get_changed_files(self.path, scan_directory(self.path), manifest)
+        self.assertEqual(changed, [])
+        self.assertEqual(touched, [])
+
+        os.utime(os.path.join(self.path, 'a.xml'), (1, 1))
+        self._write('b.xml', 'bb')
+        self._write('c.xml', 'c')
+        changed, touched = get_changed_files(self.path, scan_directory(self.path), manifest)
+        self.assertEqual(sorted(scanned.filename for scanned in changed), ['b.xml', 'c.xml'])
+        self.assertEqual([state.filename for state in touched], ['a.xml'])
+        self.assertEqual(touched[0].mtime, 1)
+
+    def test_parse_xml_files(self):
+        paths = []
+        for name in ('a', 'b'):
+            self._write('{}.xml'.format(name), '<root><name>{}</name></root>'.format(name))
+            paths.append(os.path.join(self.path, '{}.xml'.format(name)))
+
+        futures = parse_xml_files(paths, 2)
+        self.assertEqual(set(futures.keys()), set(paths))
+        self.assertEqual(futures[paths[1]].result().find('name').text, 'b')
+        self.assertIsInstance(futures[paths[0]].result(), ElementTree.Element)
+
+        self.assertEqual(parse_xml_files(paths[:1], 2), {})
@@ -8,18 +8,57 @@
 
 """Superdesk Files"""
 
-from superdesk import Service
+import logging
+from superdesk import Service, get_resource_service
 from copy import deepcopy
-from flask import g
+from flask import g, current_app as app, has_request_context
 from eve.utils import config
 from bson import ObjectId
+from superdesk.utc import utcnow
 from .item_lock import LOCK_ACTION, LOCK_USER, LOCK_TIME, LOCK_SESSION
 from superdesk.metadata.item import ITEM_TYPE
 
 
 fields_to_remove = ['_id', '_etag', '_current_version', '_updated', '_created', '_links', 'version_creator', 'guid',
                     LOCK_ACTION, LOCK_USER, LOCK_TIME, LOCK_SESSION, 'planning_ids',
-                    '_planning_schedule', '_planning_date', '_reschedule_from_schedule', 'versioncreated']
+                    '_planning_schedule', '_combined_id', '_planning_date', '_reschedule_from_schedule',
+                    'versioncreated']
+
+logger = logging.getLogger(__name__)
+
+
+def _get_pending_history():
+    if 'planning_history' not in g:
+        g.planning_history = {}
+
+    return g.planning_history
+
+
+def flush_history():
+    """Save the history entries recorded during the request, with one insert per history resource"""
+    if 'planning_history' not in g:
+        return
+
+    pending = g.planning_history
+    g.planning_history = {}
+    for resource, docs in pending.items():
+        get_resource_service(resource).post(docs)
+
+
+def flush_history_on_teardown(exception=None):
+    """Request teardown handler saving the pending history entries
+
+    The entries are dropped if the request failed, and a failure to save them is logged
+    as the response was already sent
+    """
+    if exception is not None:
+        g.pop('planning_history', None)
+        return
+
+    try:
+        flush_history()
+    except Exception:
+        logger.exception('Failed to save the planning history entries')
 
 
 class HistoryService(Service):
@@ -30,10 +69,10 @@ class HistoryService(Service):
         for item in items:
             if not item.get('duplicate_from'):
                 self._save_history({config.ID_FIELD: ObjectId(item[config.ID_FIELD]) if ObjectId.is_valid(
-                    item[config.ID_FIELD]) else str(item[config.ID_FIELD])}, deepcopy(item), operation or 'create')
+                    item[config.ID_FIELD]) else str(item[config.ID_FIELD])}, item, operation or 'create')
 
     def on_item_updated(self, updates, original, operation=None):
-        item = deepcopy(original)
+        item = dict(original)
         if list(item.keys()) == ['_id']:
             diff = updates
         else:
@@ -57,10 +96,9 @@ class HistoryService(Service):
         self.on_item_updated(updates, original, 'reschedule')
 
     def on_reschedule_from(self, item):
-        new_item = deepcopy(item)
         self._save_history(
             {config.ID_FIELD: str(item[config.ID_FIELD])},
-            new_item,
+            item,
             'reschedule_from'
         )
 
@@ -91,11 +129,50 @@ class HistoryService(Service):
 
     def _remove_unwanted_fields(self, update):
         if update:
-            update_copy = deepcopy(update)
-            for field in fields_to_remove:
-                update_copy.pop(field, None)
+            return {key: value for key, value in update.items() if key not in fields_to_remove}
+
+    def _record_history(self, history):
+        """Queue the history entry to be saved at the end of the request
+
+        Only when ``PLANNING_HISTORY_WRITE_BEHIND`` is enabled, otherwise or outside of a request
+        (celery tasks, commands) the entry is saved straight away. With write behind, the entries
+        of a request are only readable once it ended or the history is queried in the same request,
+        so a client reading the history on a push notification may not see them yet.
+
+        Queued entries are copied, as the update may still be modified by the rest of the request,
+        and get their creation date when queued to keep their order.
+        """
+        if not has_request_context() or not app.config.get('PLANNING_HISTORY_WRITE_BEHIND', False):
+            self.post([history])
+            return
+
+        history = deepcopy(history)
+        history[config.DATE_CREATED] = utcnow()
+        _get_pending_history().setdefault(self.datasource, []).append(history)
+
+    def _flush_pending_history(self):
+        if has_request_context() and self.datasource in g.get('planning_history', {}):
+            self.post(g.planning_history.pop(self.datasource))
+
+    def get(self, req, lookup):
+        self._flush_pending_history()
+        return super().get(req, lookup)
+
+    def get_from_mongo(self, req, lookup, projection=None):
+        self._flush_pending_history()
+        return super().get_from_mongo(req, lookup, projection)
+
+    def find(self, where, **kwargs):
+        self._flush_pending_history()
+        return super().find(where, **kwargs)
+
+    def find_one(self, req, **lookup):
+        self._flush_pending_history()
+        return super().find_one(req, **lookup)
 
-            return update_copy
+    def delete(self, lookup):
+        self._flush_pending_history()
+        return super().delete(lookup)
 
     def _save_history(self, item, update, operation):
         raise NotImplementedError()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from unittest import mock
+from planning.tests import TestCase
+from superdesk import get_resource_service
+from planning.common import get_mongo_collection
+from .history import flush_history, flush_history_on_teardown
+
+
+class HistoryWriteBehindTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config['PLANNING_HISTORY_WRITE_BEHIND'] = True
+        self.addCleanup(self.app.config.pop, 'PLANNING_HISTORY_WRITE_BEHIND')
+
+    def test_entries_saved_at_end_of_request(self):
+        service = get_resource_service('events_history')
+        with self.app.test_request_context('/'):
+            for i in range(10):
+                original = {'_id': 'e1', 'name': 'Event', 'slugline': 'slug'}
+                service.on_item_updated({'name': 'Event {}'.format(i)}, original)
+
+            self.assertEqual(get_mongo_collection('events_history').count(), 0)
+            flush_history_on_teardown()
+            self.assertEqual(get_mongo_collection('events_history').count(), 10)
+
+            # The entries keep the order they were recorded in
+            history = list(get_mongo_collection('events_history').find({'event_id': 'e1'}).sort([
+                ('_created', 1), ('_id', 1)
+            ]))
+            self.assertEqual([entry['update']['name'] for entry in history],
+                             ['Event {}'.format(i) for i in range(10)])
+            self.assertEqual(history[0]['operation'], 'edited')
+
+    def test_entries_dropped_when_request_failed(self):
+        service = get_resource_service('events_history')
+        with self.app.test_request_context('/'):
+            service.on_item_updated({'name': 'Event'}, {'_id': 'e1', 'name': 'Old'})
+            flush_history_on_teardown(Exception('failed'))
+            flush_history()
+            self.assertEqual(get_mongo_collection('events_history').count(), 0)
+
+    def test_flush_raises_errors(self):
+        service = get_resource_service('events_history')
+        with self.app.test_request_context('/'):
+            service.on_item_updated({'name': 'Event'}, {'_id': 'e1', 'name': 'Old'})
+            with mock.patch.object(service, 'post', side_effect=RuntimeError('failed')):
+                with self.assertRaises(RuntimeError):
+                    flush_history()
+
+    def test_queued_entries_are_snapshots(self):
+        service = get_resource_service('events_history')
+        with self.app.test_request_context('/'):
+            updates = {'definition_short': 'before'}
+            service.on_item_updated(updates, {'_id': 'e1'})
+            updates['definition_short'] = 'after'
+
+            history = list(service.find({'event_id': 'e1'}))
+            self.assertEqual(len(history), 1)
+            self.assertEqual(history[0]['update'], {'definition_short': 'before'})
+
+    def test_saved_immediately_outside_of_request(self):
+        service = get_resource_service('events_history')
+        with self.app.app_context():
+            service.on_item_updated({'name': 'Event'}, {'_id': 'e1', 'name': 'Old'})
+            self.assertEqual(get_mongo_collection('events_history').count(), 1)
+
+    def test_write_behind_disabled_by_default(self):
+        service = get_resource_service('events_history')
+        self.app.config.pop('PLANNING_HISTORY_WRITE_BEHIND')
+        try:
+            with self.app.test_request_context('/'):
+                service.on_item_updated({'name': 'Event'}, {'_id': 'e1', 'name': 'Old'})
+                self.assertEqual(get_mongo_collection('events_history').count(), 1)
+        finally:
+            self.app.config['PLANNING_HISTORY_WRITE_BEHIND'] = True
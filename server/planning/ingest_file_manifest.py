@@ -0,0 +1,73 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from pymongo import UpdateOne
+from superdesk import Service, Resource
+from planning.common import get_mongo_collection, iter_batches
+from planning.feeding_services.file_scanner import FileState
+
+
+class IngestFileManifestService(Service):
+    """Stores the files left in the drop folder of the event file providers, with their size, mtime and hash"""
+
+    def get_manifest(self, provider_id):
+        """Get the FileState of the files of the provider, by filename"""
+        return {
+            entry['filename']: FileState(entry['filename'], entry['size'], entry['mtime'], entry['hash'],
+                                         entry.get('move_attempts') or 0, entry.get('retry_move_at') or 0)
+            for entry in get_mongo_collection('ingest_file_manifest').find(
+                {'provider': str(provider_id)},
+                {'filename': 1, 'size': 1, 'mtime': 1, 'hash': 1, 'move_attempts': 1, 'retry_move_at': 1}
+            )
+        }
+
+    def save_states(self, provider_id, states):
+        """Add or update the FileState list in the manifest of the provider"""
+        collection = get_mongo_collection('ingest_file_manifest')
+        for batch in iter_batches(states, 1000):
+            collection.bulk_write([
+                UpdateOne(
+                    {'provider': str(provider_id), 'filename': state.filename},
+                    {'$set': {'size': state.size, 'mtime': state.mtime, 'hash': state.hash,
+                              'move_attempts': state.move_attempts, 'retry_move_at': state.retry_move_at}},
+                    upsert=True
+                )
+                for state in batch
+            ], ordered=False)
+
+    def remove_files(self, provider_id, filenames):
+        """Remove the files from the manifest of the provider"""
+        collection = get_mongo_collection('ingest_file_manifest')
+        for batch in iter_batches(filenames, 1000):
+            collection.delete_many({'provider': str(provider_id), 'filename': {'$in': batch}})
+
+
+class IngestFileManifestResource(Resource):
+    """
+    Resource for the manifest of the event file drop folders
+    """
+
+    schema = {
+        'provider': {'type': 'string'},
+        'filename': {'type': 'string'},
+        'size': {'type': 'integer'},
+        'mtime': {'type': 'float'},
+        'hash': {'type': 'string'},
+        'move_attempts': {'type': 'integer'},
+        'retry_move_at': {'type': 'float'}
+    }
+
+    mongo_indexes = {
+        'provider_1_filename_1': ([('provider', 1), ('filename', 1)], {'unique': True}),
+    }
+
+    internal_resource = True
+    item_methods = []
+    resource_methods = []
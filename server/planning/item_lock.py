@@ -9,6 +9,8 @@
 # at https://www.sourcefabric.org/superdesk/license
 
 import logging
+import random
+import time
 import superdesk
 
 from superdesk.errors import SuperdeskApiError
@@ -19,12 +21,15 @@ from superdesk.lock import lock, unlock
 from eve.utils import config
 from superdesk import get_resource_service, get_resource_privileges
 from apps.common.components.base_component import BaseComponent
+from .common import LOCK_USER, LOCK_SESSION, LOCK_ACTION, LOCK_TIME, get_mongo_collection, bulk_update
+from .lock_metrics import record_lock_metrics
 
 
-LOCK_USER = 'lock_user'
-LOCK_SESSION = 'lock_session'
-LOCK_ACTION = 'lock_action'
-LOCK_TIME = 'lock_time'
+# Seconds to wait for the lock of an item when it is being locked concurrently,
+# fails straight away unless enabled with PLANNING_LOCK_MAX_WAIT
+DEFAULT_LOCK_MAX_WAIT = 0
+LOCK_RETRY_DELAY = 0.05
+LOCK_RETRY_MAX_DELAY = 0.4
 logger = logging.getLogger(__name__)
 
 
@@ -62,7 +67,11 @@ class LockService(BaseComponent):
         lock_id = "item_lock {}".format(item.get(lock_id_field))
 
         # get the lock it not raise forbidden exception
-        if not lock(lock_id, expire=5):
+        started = time.perf_counter()
+        acquired, retries = self._acquire_lock(lock_id, resource)
+        wait = time.perf_counter() - started
+        if not acquired:
+            record_lock_metrics(lock_id, resource, wait, retries=retries)
             raise SuperdeskApiError.forbiddenError(message="Item is locked by another user.")
 
         try:
@@ -97,6 +106,39 @@ class LockService(BaseComponent):
         finally:
             # unlock the lock :)
             unlock(lock_id, remove=True)
+            record_lock_metrics(lock_id, resource, wait, time.perf_counter() - started - wait, retries)
+
+    def get_lock_max_wait(self, resource):
+        """Get the max number of seconds to wait for the lock of an item of the resource
+
+        ``PLANNING_LOCK_MAX_WAIT`` is either the number of seconds for all resources,
+        or a dict of seconds by resource name with an optional ``default``
+        """
+        max_wait = self.app.config.get('PLANNING_LOCK_MAX_WAIT', DEFAULT_LOCK_MAX_WAIT)
+        if isinstance(max_wait, dict):
+            return max_wait.get(resource, max_wait.get('default', DEFAULT_LOCK_MAX_WAIT))
+
+        return max_wait
+
+    def _acquire_lock(self, lock_id, resource):
+        """Acquire the lock, retrying with a jittered exponential backoff until the max wait of the resource
+
+        :return tuple: (True if the lock was acquired, number of failed attempts)
+        """
+        deadline = time.perf_counter() + self.get_lock_max_wait(resource)
+        delay = LOCK_RETRY_DELAY
+        retries = 0
+
+        while not lock(lock_id, expire=5):
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False, retries
+
+            retries += 1
+            time.sleep(min(remaining, random.uniform(delay / 2, delay)))
+            delay = min(delay * 2, LOCK_RETRY_MAX_DELAY)
+
+        return True, retries
 
     def unlock(self, item, user_id, session_id, resource):
         if not item:
@@ -150,11 +192,43 @@ class LockService(BaseComponent):
             item_service.delete_action(lookup={})
 
     def unlock_session_for_resource(self, user_id, session_id, resource):
-        item_service = get_resource_service(resource)
-        items = item_service.find(where={'lock_session': session_id})
+        """Unlock all items of the resource that are locked by the session
+
+        The items are unlocked with one mongo bulk write and one elastic bulk index, and a single
+        ``<resource>:unlock`` notification is sent with the list of unlocked items
+        """
+        items = list(get_mongo_collection(resource).find({LOCK_SESSION: session_id}))
+        if not items:
+            return
 
         for item in items:
-            self.unlock(item, user_id, session_id, resource)
+            # following line executes handlers attached to function:
+            # on_unlock_'resource' - ex. on_unlock_planning, on_unlock_event
+            getattr(self.app, 'on_unlock_%s' % resource)(item, user_id)
+
+        items = bulk_update(
+            resource,
+            [item[config.ID_FIELD] for item in items],
+            {LOCK_USER: None, LOCK_SESSION: None, LOCK_TIME: None, LOCK_ACTION: None},
+            lookup={LOCK_SESSION: session_id}
+        )
+
+        for item in items:
+            # following line executes handlers attached to function:
+            # on_unlocked_'resource' - ex. on_unlocked_planning, on_unlocked_event
+            getattr(self.app, 'on_unlocked_%s' % resource)(item, user_id)
+
+        push_notification(
+            resource + ':unlock',
+            items=[{
+                'item': str(item.get(config.ID_FIELD)),
+                'etag': item.get(config.ETAG),
+                'event_item': item.get('event_item') or None,
+                'recurrence_id': item.get('recurrence_id') or None
+            } for item in items],
+            user=str(user_id),
+            lock_session=str(session_id)
+        )
 
     def can_lock(self, item, user_id, session_id, resource):
         """
@@ -197,31 +271,63 @@ class LockService(BaseComponent):
         if not item:
             raise SuperdeskApiError.notFoundError()
 
-        all_items = get_resource_service(resource_name).get_all_items_in_relationship(item)
-        for related_item in all_items:
-            if related_item[config.ID_FIELD] != item[config.ID_FIELD]:
-                if related_item.get(LOCK_USER) and related_item.get(LOCK_SESSION):
-                    # Frame appropriate error message string
-
-                    same_resource_conflict = False
-                    item_name = 'planning item'
-                    associated_name = 'event'
-                    series_str = ''
-                    if resource_name == 'events':
-                        item_name = 'event'
-                        associated_name = 'planning item'
-                        if related_item.get('type') == 'event':
-                            same_resource_conflict = True
-                    else:
-                        if related_item.get('type') != 'event':
-                            same_resource_conflict = True
-
-                    if item.get('recurrence_id'):
-                        series_str = 'in this recurring series '
-
-                    if same_resource_conflict:
-                        message = 'Another {} {}is already locked.'.format(item_name, series_str)
-                    else:
-                        message = 'An associated {} {}is already locked.'.format(associated_name, series_str)
-
-                    raise SuperdeskApiError.forbiddenError(message=message)
+        locked_resource = self._get_locked_related_resource(item, resource_name)
+        if not locked_resource:
+            return
+
+        # Frame appropriate error message string
+        same_resource_conflict = locked_resource == resource_name
+        item_name = 'event' if resource_name == 'events' else 'planning item'
+        associated_name = 'planning item' if resource_name == 'events' else 'event'
+        series_str = 'in this recurring series ' if item.get('recurrence_id') else ''
+
+        if same_resource_conflict:
+            message = 'Another {} {}is already locked.'.format(item_name, series_str)
+        else:
+            message = 'An associated {} {}is already locked.'.format(associated_name, series_str)
+
+        raise SuperdeskApiError.forbiddenError(message=message)
+
+    def _get_locked_related_resource(self, item, resource_name):
+        """Get the name of the resource of a locked item that is related to this item
+
+        Uses an indexed query per resource that only checks for the existence of a locked item,
+        instead of loading all the items in the relationship (i.e. a recurring series)
+
+        :param dict item: the item to be locked
+        :param str resource_name: the resource of the item, `events` or `planning`
+        :return str: `events` or `planning` if a related item is locked, otherwise None
+        """
+        for resource, lookup in self._get_relationship_lookups(item, resource_name):
+            locked_item = get_mongo_collection(resource).find_one({
+                '$and': [lookup, {config.ID_FIELD: {'$ne': item.get(config.ID_FIELD)}}],
+                LOCK_USER: {'$ne': None},
+                LOCK_SESSION: {'$ne': None}
+            }, {config.ID_FIELD: 1})
+
+            if locked_item:
+                return resource
+
+        return None
+
+    @staticmethod
+    def _get_relationship_lookups(item, resource_name):
+        """Get the lookup of each resource for the items in a relationship with this item
+
+        :return list: list of (resource, lookup) tuples
+        """
+        if item.get('recurrence_id') and (resource_name == 'events' or item.get('event_item')):
+            # All Events and Planning items in the recurring series
+            lookup = {'recurrence_id': item['recurrence_id']}
+            return [('events', lookup), ('planning', lookup)]
+        elif resource_name == 'events':
+            # The Planning items of the Event
+            return [('planning', {'event_item': item.get(config.ID_FIELD)})]
+        elif item.get('event_item'):
+            # The associated Event, and its other Planning items
+            return [
+                ('events', {config.ID_FIELD: item['event_item']}),
+                ('planning', {'event_item': item['event_item']})
+            ]
+
+        return []
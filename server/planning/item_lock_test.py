@@ -0,0 +1,167 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from unittest import mock
+from bson import ObjectId
+from pymongo.collection import Collection
+from superdesk import get_resource_service
+from superdesk.errors import SuperdeskApiError
+from superdesk.utc import utcnow
+from planning.tests import TestCase
+from apps.common.components.utils import get_component
+from .item_lock import LockService
+from .lock_metrics import record_lock_metrics
+
+
+class LockServiceTestCase(TestCase):
+    def test_unlock_session_in_bulk(self):
+        user_id = ObjectId()
+        session_id = ObjectId()
+        other_session_id = ObjectId()
+        now = utcnow()
+
+        with self.app.app_context():
+            self.app.data.insert('planning', [{
+                '_id': 'plan{}'.format(i),
+                'guid': 'plan{}'.format(i),
+                'slugline': 'Planning {}'.format(i),
+                'planning_date': now,
+                'lock_user': user_id,
+                'lock_session': other_session_id if i == 0 else session_id,
+                'lock_action': 'edit',
+                'lock_time': now
+            } for i in range(1001)])
+
+            planning_service = get_resource_service('planning')
+            original_etag = planning_service.find_one(req=None, _id='plan1').get('_etag')
+
+            with mock.patch('planning.item_lock.push_notification') as push_notification, \
+                    mock.patch('pymongo.collection.Collection.bulk_write', autospec=True,
+                               side_effect=Collection.bulk_write) as bulk_write, \
+                    mock.patch.object(self.app.data.elastic, 'bulk_insert',
+                                      wraps=self.app.data.elastic.bulk_insert) as bulk_insert:
+                get_component(LockService).unlock_session_for_resource(user_id, session_id, 'planning')
+
+            # One mongo bulk write, one elastic bulk index and one notification for the whole session
+            self.assertEqual(bulk_write.call_count, 1)
+            self.assertEqual(bulk_insert.call_count, 1)
+            push_notification.assert_called_once()
+            self.assertEqual(push_notification.call_args[0][0], 'planning:unlock')
+            self.assertEqual(len(push_notification.call_args[1]['items']), 1000)
+
+            unlocked = planning_service.find_one(req=None, _id='plan1')
+            self.assertIsNone(unlocked.get('lock_user'))
+            self.assertNotEqual(unlocked.get('_etag'), original_etag)
+            self.assertIn(unlocked.get('_etag'), [item['etag'] for item in push_notification.call_args[1]['items']])
+            self.assertIsNone(planning_service.find_one(req=None, _id='plan1000').get('lock_session'))
+            self.assertEqual(planning_service.find_one(req=None, _id='plan0').get('lock_session'), other_session_id)
+
+            # Elastic was reindexed with the unlocked items
+            self.app.data.elastic.es.indices.refresh()
+            locked = planning_service.search({'query': {'bool': {'must': [{'exists': {'field': 'lock_session'}}]}}})
+            self.assertEqual(locked.count(), 1)
+
+    def test_validate_relationship_locks(self):
+        user_id = ObjectId()
+        session_id = ObjectId()
+        now = utcnow()
+
+        with self.app.app_context():
+            self.app.data.insert('events', [{
+                '_id': 'event{}'.format(i),
+                'guid': 'event{}'.format(i),
+                'type': 'event',
+                'recurrence_id': 'series1',
+                'dates': {'start': now, 'end': now}
+            } for i in range(500)])
+            self.app.data.insert('planning', [{
+                '_id': 'plan1',
+                'guid': 'plan1',
+                'type': 'planning',
+                'event_item': 'event1',
+                'recurrence_id': 'series1',
+                'planning_date': now
+            }, {
+                '_id': 'plan2',
+                'guid': 'plan2',
+                'type': 'planning',
+                'event_item': 'event2',
+                'planning_date': now
+            }])
+
+            lock_service = get_component(LockService)
+            event = get_resource_service('events').find_one(req=None, _id='event0')
+
+            lock_service.validate_relationship_locks(event, 'events')
+
+            # The item being locked is not a conflict with itself
+            lock = {'lock_user': user_id, 'lock_session': session_id}
+            self.app.data.update('events', 'event0', lock, event)
+            lock_service.validate_relationship_locks(event, 'events')
+
+            with self.assertRaises(SuperdeskApiError) as error:
+                lock_service.validate_relationship_locks({'_id': 'event3', 'recurrence_id': 'series1'}, 'events')
+            self.assertEqual(error.exception.message, 'Another event in this recurring series is already locked.')
+
+            with self.assertRaises(SuperdeskApiError) as error:
+                lock_service.validate_relationship_locks(
+                    {'_id': 'plan1', 'event_item': 'event1', 'recurrence_id': 'series1'},
+                    'planning'
+                )
+            self.assertEqual(error.exception.message, 'An associated event in this recurring series is already locked.')
+
+            # Planning item of a non recurring Event
+            lock_service.validate_relationship_locks({'_id': 'event2'}, 'events')
+            plan = get_resource_service('planning').find_one(req=None, _id='plan2')
+            self.app.data.update('planning', 'plan2', lock, plan)
+            with self.assertRaises(SuperdeskApiError) as error:
+                lock_service.validate_relationship_locks({'_id': 'event2'}, 'events')
+            self.assertEqual(error.exception.message, 'An associated planning item is already locked.')
+
+    def test_lock_retries_until_max_wait(self):
+        with self.app.app_context():
+            lock_service = get_component(LockService)
+
+            # Fails fast by default
+            self.assertEqual(lock_service.get_lock_max_wait('events'), 0)
+            with mock.patch('planning.item_lock.lock', return_value=False), \
+                    mock.patch('planning.item_lock.time.sleep') as sleep:
+                self.assertEqual(lock_service._acquire_lock('item_lock e1', 'events'), (False, 0))
+            sleep.assert_not_called()
+
+            self.app.config['PLANNING_LOCK_MAX_WAIT'] = {'default': 0, 'events': 5}
+            self.assertEqual(lock_service.get_lock_max_wait('planning'), 0)
+            self.assertEqual(lock_service.get_lock_max_wait('events'), 5)
+
+            with mock.patch('planning.item_lock.lock', side_effect=[False, False, True]), \
+                    mock.patch('planning.item_lock.time.sleep'):
+                self.assertEqual(lock_service._acquire_lock('item_lock e1', 'events'), (True, 2))
+
+            with mock.patch('planning.item_lock.lock', return_value=False):
+                self.assertEqual(lock_service._acquire_lock('item_lock p1', 'planning'), (False, 0))
+
+    def test_lock_metrics(self):
+        with self.app.app_context():
+            self.app.config['PLANNING_LOCK_METRICS_ENABLED'] = True
+            record_lock_metrics('item_lock e1', 'events', 0.005, 0.02, retries=0)
+            record_lock_metrics('item_lock e1', 'events', 0.3, 0.01, retries=3)
+            record_lock_metrics('item_lock e1', 'events', 1.0, retries=8)
+            record_lock_metrics('item_lock p1', 'planning', 0.001, 0.01)
+
+            hottest = get_resource_service('planning_lock_metrics').get_hottest(limit=1)
+            self.assertEqual(len(hottest), 1)
+            self.assertEqual(hottest[0]['_id'], 'item_lock e1')
+            self.assertEqual(hottest[0]['attempts'], 3)
+            self.assertEqual(hottest[0]['acquired'], 2)
+            self.assertEqual(hottest[0]['failed'], 1)
+            self.assertEqual(hottest[0]['contended'], 2)
+            self.assertEqual(hottest[0]['retries'], 11)
+            self.assertEqual(hottest[0]['wait_histogram'], {'le_10': 1, 'le_500': 1, 'le_1000': 1})
+            self.assertEqual(hottest[0]['hold_histogram'], {'le_10': 1, 'le_50': 1})
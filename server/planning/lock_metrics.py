@@ -0,0 +1,125 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+"""Contention metrics of the item locks
+
+When ``PLANNING_LOCK_METRICS_ENABLED`` is set, every attempt to lock an item records the time spent waiting
+for the lock mutex, the time it was held and the number of retries, aggregated per lock id.
+"""
+
+import logging
+from flask import current_app as app
+from eve.utils import config
+from superdesk import Service, Resource
+from superdesk.utc import utcnow
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (in milliseconds) of the histogram buckets
+HISTOGRAM_BUCKETS = (10, 50, 100, 500, 1000, 5000)
+
+
+def get_histogram_bucket(duration_ms):
+    """Get the name of the histogram bucket for the duration"""
+    for bound in HISTOGRAM_BUCKETS:
+        if duration_ms <= bound:
+            return 'le_{}'.format(bound)
+
+    return 'gt_{}'.format(HISTOGRAM_BUCKETS[-1])
+
+
+def record_lock_metrics(lock_id, resource, wait, hold=None, retries=0):
+    """Record an attempt to acquire the lock
+
+    Failures to record are logged and ignored, so they never affect locking
+
+    :param str lock_id: id of the lock
+    :param str resource: resource of the locked item
+    :param float wait: seconds spent waiting for the lock
+    :param float hold: seconds the lock was held, None if the lock was not acquired
+    :param int retries: number of failed attempts before the lock was acquired or given up on
+    """
+    if not app.config.get('PLANNING_LOCK_METRICS_ENABLED', False):
+        return
+
+    wait_ms = wait * 1000
+    increments = {
+        'attempts': 1,
+        'retries': retries,
+        'contended': 1 if retries else 0,
+        'wait_ms': wait_ms,
+        'wait_histogram.' + get_histogram_bucket(wait_ms): 1
+    }
+
+    if hold is None:
+        increments['failed'] = 1
+    else:
+        hold_ms = hold * 1000
+        increments['acquired'] = 1
+        increments['hold_ms'] = hold_ms
+        increments['hold_histogram.' + get_histogram_bucket(hold_ms)] = 1
+
+    try:
+        from planning.common import get_mongo_collection
+
+        get_mongo_collection('planning_lock_metrics').update_one(
+            {config.ID_FIELD: lock_id},
+            {'$inc': increments, '$set': {'resource': resource, config.LAST_UPDATED: utcnow()}},
+            upsert=True
+        )
+    except Exception:
+        logger.exception('Failed to record the metrics of lock {}'.format(lock_id))
+
+
+class PlanningLockMetricsService(Service):
+    def get_hottest(self, limit=20):
+        """Get the metrics of the most contended locks
+
+        :param int limit: max number of locks to return
+        :return list: metrics sorted by the number of contended attempts then the total wait time
+        """
+        from planning.common import get_mongo_collection
+
+        return list(get_mongo_collection('planning_lock_metrics').find().sort([
+            ('contended', -1),
+            ('wait_ms', -1)
+        ]).limit(limit))
+
+    def reset(self):
+        """Remove all recorded metrics"""
+        self.delete_action(lookup={})
+
+
+class PlanningLockMetricsResource(Resource):
+    """
+    Resource for storing the contention metrics of the item locks
+    """
+
+    schema = {
+        # Id of the lock, i.e. `item_lock <item id>`
+        config.ID_FIELD: {'type': 'string'},
+        'resource': {'type': 'string'},
+        'attempts': {'type': 'integer'},
+        'acquired': {'type': 'integer'},
+        'failed': {'type': 'integer'},
+        # Number of attempts that had to wait for the lock
+        'contended': {'type': 'integer'},
+        'retries': {'type': 'integer'},
+        # Total time waiting for, and holding, the lock
+        'wait_ms': {'type': 'float'},
+        'hold_ms': {'type': 'float'},
+        # Count of attempts per duration bucket, i.e. {'le_10': 3, 'gt_5000': 1}
+        'wait_histogram': {'type': 'dict'},
+        'hold_histogram': {'type': 'dict'}
+    }
+
+    internal_resource = True
+    item_methods = []
+    resource_methods = []
@@ -0,0 +1,76 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+"""Registry of the compiled notification templates
+
+The assignment message templates and their meta templates are compiled once, and compiled again only when
+the template file changes, instead of for every notification.
+"""
+
+import os
+from collections import namedtuple
+from flask import current_app
+from jinja2 import Template
+
+NotificationTemplate = namedtuple('NotificationTemplate', ['name', 'source', 'template', 'mtime'])
+
+TEMPLATES_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'templates')
+META_TEMPLATES = ('assignment_details_email.txt', 'assignment_details_email.html')
+
+
+def _get_registry(app):
+    return app.extensions.setdefault('planning_notification_templates', {})
+
+
+def get_notification_template(name, meta=False, app=None):
+    """Get the compiled template, compiling it on first use or when the file was modified
+
+    Message templates are compiled standalone, as they always were. Meta templates are compiled by the app's
+    jinja environment, so they are autoescaped the same way as with ``render_template``.
+
+    :param str name: file name of the template
+    :param bool meta: if the template is a meta template
+    :param app: the app, defaults to the current app
+    :return NotificationTemplate: the compiled template
+    :raises TemplateNotFound: if the template doesn't exist
+    """
+    app = app or current_app._get_current_object()
+    registry = _get_registry(app)
+
+    entry = registry.get(name)
+    if entry is not None:
+        template, uptodate = entry
+        if uptodate is None or uptodate():
+            return template
+
+    source, filename, uptodate = app.jinja_loader.get_source(environment=app.jinja_env, template=name)
+    template = NotificationTemplate(
+        name=name,
+        source=source,
+        template=app.jinja_env.get_template(name) if meta else Template(source),
+        mtime=os.path.getmtime(filename) if filename and os.path.exists(filename) else None
+    )
+    registry[name] = (template, uptodate)
+    return template
+
+
+def render_meta_template(name, data):
+    """Render the meta template with the data, the way ``render_template`` would"""
+    return get_notification_template(name, meta=True).template.render(**data)
+
+
+def preload_notification_templates(app):
+    """Compile the assignment message templates and their meta templates"""
+    for name in sorted(os.listdir(TEMPLATES_PATH)):
+        if name.startswith('assignment_') and name.endswith('_msg.txt'):
+            get_notification_template(name, app=app)
+
+    for name in META_TEMPLATES:
+        get_notification_template(name, meta=True, app=app)
@@ -11,11 +11,10 @@
 import json
 import superdesk
 
-from copy import deepcopy
 from flask import current_app as app
 from superdesk.publish.formatters import Formatter
 from superdesk.utils import json_serialize_datetime_objectId
-from superdesk import get_resource_service
+from planning.common import get_items_by_id
 
 
 class JsonEventFormatter(Formatter):
@@ -24,7 +23,7 @@ class JsonEventFormatter(Formatter):
     """
 
     remove_fields = {'lock_time', 'lock_action', 'lock_session', 'lock_user', '_etag', '_planning_schedule',
-                     'expiry', 'original_creator', '_reschedule_from_schedule'}
+                     '_combined_id', 'expiry', 'original_creator', '_reschedule_from_schedule'}
 
     def __init__(self):
         """
@@ -39,13 +38,34 @@ class JsonEventFormatter(Formatter):
 
     def format(self, item, subscriber, codes=None):
         pub_seq_num = superdesk.get_resource_service('subscribers').generate_sequence_number(subscriber)
-        output_item = self._format_item(item)
-        return [(pub_seq_num, json.dumps(output_item, default=json_serialize_datetime_objectId))]
+        return [(pub_seq_num, self.format_batch([item])[0])]
+
+    def format_batch(self, items):
+        """Format the items to json
+
+        The contacts referenced by all the items are loaded upfront with one query
+
+        :param list items: list of events
+        :return list: the json string of each item
+        """
+        encoder = json.JSONEncoder(default=json_serialize_datetime_objectId)
+        return [encoder.encode(output_item) for output_item in self._format_items(items)]
 
     def _format_item(self, item):
         """Format the item to json event"""
-        output_item = deepcopy(item)
-        output_item['event_contact_info'] = self._expand_contact_info(item)
+        return self._format_items([item])[0]
+
+    def _format_items(self, items):
+        contacts = get_items_by_id(
+            'contacts',
+            (contact for item in items for contact in (item.get('event_contact_info') or []))
+        )
+        return [self._build_output_item(item, contacts) for item in items]
+
+    def _build_output_item(self, item, contacts):
+        """Build the output item from the fields to publish, without copying the rest of the item"""
+        output_item = {key: value for key, value in item.items() if key not in self.remove_fields}
+        output_item['event_contact_info'] = self._expand_contact_info(item, contacts)
         if item.get('files'):
             try:
                 output_item['files'] = self._publish_files(item)
@@ -53,8 +73,6 @@ class JsonEventFormatter(Formatter):
                 #  Current http_push transmitters only support media publish
                 pass
 
-        for f in self.remove_fields:
-            output_item.pop(f, None)
         return output_item
 
     def _publish_files(self, item):
@@ -71,24 +89,24 @@ class JsonEventFormatter(Formatter):
 
         return [publish_file(file_id) for file_id in item['files']]
 
-    def _expand_contact_info(self, item):
+    def _expand_contact_info(self, item, contacts):
         """
         Given an item it will scan any event contacts, look them up and return the expanded values
 
         :param item:
+        :param dict contacts: the contacts by their id
         :return: Array of expanded contacts
         """
         remove_contact_fields = {'_etag', '_type'}
         expanded = []
         for contact in item.get('event_contact_info', []):
-            contact_details = get_resource_service('contacts').find_one(req=None, _id=contact)
-            if contact_details:
-                for f in remove_contact_fields:
-                    contact_details.pop(f, None)
+            contact_details = contacts.get(str(contact))
+            if contact_details and contact_details.get('public', False) and contact_details.get('is_active', False):
+                contact_details = {key: value for key, value in contact_details.items()
+                                   if key not in remove_contact_fields}
                 # Remove any none public contact details
                 contact_details['contact_phone'] = [p for p in contact_details.get('contact_phone', []) if
                                                     p.get('public')]
                 contact_details['mobile'] = [p for p in contact_details.get('mobile', []) if p.get('public')]
-                if contact_details.get('public', False) and contact_details.get('is_active', False):
-                    expanded.append(contact_details)
+                expanded.append(contact_details)
         return expanded
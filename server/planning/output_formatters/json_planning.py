@@ -13,11 +13,11 @@ from superdesk.publish.formatters import Formatter
 import superdesk
 import json
 from superdesk.utils import json_serialize_datetime_objectId
-from copy import deepcopy
 from superdesk import get_resource_service
 from bson.objectid import ObjectId
-from planning.common import ASSIGNMENT_WORKFLOW_STATE, WORKFLOW_STATE
+from planning.common import ASSIGNMENT_WORKFLOW_STATE, WORKFLOW_STATE, get_items_by_id
 from superdesk.metadata.item import CONTENT_STATE
+from eve.utils import config
 
 
 class JsonPlanningFormatter(Formatter):
@@ -35,7 +35,8 @@ class JsonPlanningFormatter(Formatter):
 
     # fields to be removed from the planning item
     remove_fields = ('lock_time', 'lock_action', 'lock_session', 'lock_user', '_etag',
-                     'original_creator', 'version_creator', '_planning_schedule', 'files')
+                     'original_creator', 'version_creator', '_planning_schedule', '_combined_id',
+                     'files')
 
     # fields to be removed from coverage
     remove_coverage_fields = ('original_creator', 'version_creator', 'assigned_to', 'flags')
@@ -47,30 +48,68 @@ class JsonPlanningFormatter(Formatter):
 
     def format(self, item, subscriber, codes=None):
         pub_seq_num = superdesk.get_resource_service('subscribers').generate_sequence_number(subscriber)
-        output_item = self._format_item(item)
-        return [(pub_seq_num, json.dumps(output_item, default=json_serialize_datetime_objectId))]
+        return [(pub_seq_num, self.format_batch([item])[0])]
+
+    def format_batch(self, items):
+        """Format the items to json
+
+        The assignments, deliveries and agendas referenced by all the items are loaded upfront,
+        with one query per resource
+
+        :param list items: list of planning items
+        :return list: the json string of each item
+        """
+        encoder = json.JSONEncoder(default=json_serialize_datetime_objectId)
+        return [encoder.encode(output_item) for output_item in self._format_items(items)]
 
     def _format_item(self, item):
         """Format the item to json event"""
-        output_item = deepcopy(item)
-        for f in self.remove_fields:
-            output_item.pop(f, None)
-        for coverage in output_item.get('coverages', []):
-            assigned_to = coverage.pop('assigned_to', None) or {}
-            coverage['coverage_provider'] = assigned_to.get('coverage_provider')
-            deliveries, workflow_state = self._expand_delivery(assigned_to.get('assignment_id'))
+        return self._format_items([item])[0]
+
+    def _format_items(self, items):
+        assignments = get_items_by_id('assignments', (
+            (coverage.get('assigned_to') or {}).get('assignment_id')
+            for item in items
+            for coverage in (item.get('coverages') or [])
+        ), {'assigned_to': 1})
+        deliveries = self._get_deliveries(assignments)
+        agendas = get_items_by_id('agenda', (agenda for item in items for agenda in (item.get('agendas') or [])))
+
+        return [self._build_output_item(item, assignments, deliveries, agendas) for item in items]
+
+    def _build_output_item(self, item, assignments, deliveries, agendas):
+        """Build the output item from the fields to publish, without copying the rest of the item"""
+        output_item = {key: value for key, value in item.items() if key not in self.remove_fields}
+        output_item['coverages'] = [
+            self._build_output_coverage(coverage, assignments, deliveries)
+            for coverage in (item.get('coverages') or [])
+        ]
+        output_item['agendas'] = self._expand_agendas(item, agendas)
+        return output_item
+
+    def _build_output_coverage(self, coverage, assignments, deliveries):
+        output_coverage = {key: value for key, value in coverage.items() if key not in self.remove_coverage_fields}
+        assigned_to = coverage.get('assigned_to') or {}
+        output_coverage['coverage_provider'] = assigned_to.get('coverage_provider')
+
+        assignment_id = str(assigned_to.get('assignment_id'))
+        assignment = assignments.get(assignment_id) if assigned_to.get('assignment_id') else None
+        output_coverage['deliveries'] = []
+        if assignment:
+            workflow_state = assignment.get('assigned_to').get('state')
             if workflow_state:
-                coverage['workflow_status'] = self._get_coverage_workflow_state(workflow_state)
+                output_coverage['workflow_status'] = self._get_coverage_workflow_state(workflow_state)
 
-            coverage['deliveries'] = deliveries
-            for f in self.remove_coverage_fields:
-                coverage.pop(f, None)
+            if workflow_state in [ASSIGNMENT_WORKFLOW_STATE.COMPLETED, ASSIGNMENT_WORKFLOW_STATE.IN_PROGRESS]:
+                output_coverage['deliveries'] = deliveries.get(assignment_id) or []
 
-            # Remove contacts field in coverage
-            coverage.get('planning').pop('contact_info', None)
+        # Remove contacts field in coverage
+        if coverage.get('planning'):
+            output_coverage['planning'] = {
+                key: value for key, value in coverage['planning'].items() if key != 'contact_info'
+            }
 
-        output_item['agendas'] = self._expand_agendas(item)
-        return output_item
+        return output_coverage
 
     def _get_coverage_workflow_state(self, assignment_state):
         if assignment_state in {ASSIGNMENT_WORKFLOW_STATE.SUBMITTED, ASSIGNMENT_WORKFLOW_STATE.IN_PROGRESS}:
@@ -78,53 +117,52 @@ class JsonPlanningFormatter(Formatter):
         else:
             return assignment_state
 
-    def _expand_agendas(self, item):
+    def _expand_agendas(self, item, agendas):
         """
         Given an item it will scan any agendas, look them up and return the expanded values, if enabled
 
         :param item:
+        :param dict agendas: the agendas by their id
         :return: Array of expanded agendas
         """
         remove_agenda_fields = {'_etag', '_type', 'original_creator', '_updated', '_created', 'is_enabled'}
         expanded = []
         for agenda in item.get('agendas', []):
-            agenda_details = get_resource_service('agenda').find_one(req=None, _id=agenda)
+            agenda_details = agendas.get(str(agenda))
             if agenda_details and agenda_details.get('is_enabled'):
-                for f in remove_agenda_fields:
-                    agenda_details.pop(f, None)
-                expanded.append(agenda_details)
+                expanded.append({key: value for key, value in agenda_details.items()
+                                 if key not in remove_agenda_fields})
         return expanded
 
-    def _expand_delivery(self, assignment_id):
-        """Find any deliveries associated with the assignment
+    def _get_deliveries(self, assignments):
+        """Find the deliveries of the completed or in progress assignments
 
-        :param assignment_id:
-        :return:
-        """
-        if not assignment_id:
-            return [], None
-
-        assignment = superdesk.get_resource_service('assignments').find_one(req=None, _id=assignment_id)
-        if not assignment:
-            return [], None
+        Deliveries are only returned for the assignments where the item has been published at least once
 
-        if assignment.get('assigned_to').get('state') not in [ASSIGNMENT_WORKFLOW_STATE.COMPLETED,
-                                                              ASSIGNMENT_WORKFLOW_STATE.IN_PROGRESS]:
-            return [], assignment.get('assigned_to').get('state')
+        :param dict assignments: the assignments by their id
+        :return dict: list of deliveries by assignment id
+        """
+        assignment_ids = [
+            assignment[config.ID_FIELD] for assignment in assignments.values()
+            if assignment.get('assigned_to', {}).get('state') in [ASSIGNMENT_WORKFLOW_STATE.COMPLETED,
+                                                                  ASSIGNMENT_WORKFLOW_STATE.IN_PROGRESS]
+        ]
+        if not assignment_ids:
+            return {}
 
-        delivery_service = get_resource_service('delivery')
         remove_fields = ('coverage_id', 'planning_id', '_created', '_updated', 'assignment_id', '_etag')
-        deliveries = list(delivery_service.get(req=None, lookup={'assignment_id': ObjectId(assignment_id)}))
-
-        # Check to see if in this delivery chain, whether the item has been published at least once
-        item_never_published = True
-        for delivery in deliveries:
+        deliveries = {}
+        for delivery in get_resource_service('delivery').get_from_mongo(
+            req=None,
+            lookup={'assignment_id': {'$in': [ObjectId(assignment_id) for assignment_id in assignment_ids]}}
+        ):
+            assignment_id = str(delivery.get('assignment_id'))
             for f in remove_fields:
                 delivery.pop(f, None)
-            if delivery.get('item_state') == CONTENT_STATE.PUBLISHED:
-                item_never_published = False
-
-        if item_never_published:
-            deliveries = []
+            deliveries.setdefault(assignment_id, []).append(delivery)
 
-        return deliveries, assignment.get('assigned_to').get('state')
+        # Check to see if in this delivery chain, whether the item has been published at least once
+        return {
+            assignment_id: items for assignment_id, items in deliveries.items()
+            if any(delivery.get('item_state') == CONTENT_STATE.PUBLISHED for delivery in items)
+        }
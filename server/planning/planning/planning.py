@@ -13,6 +13,7 @@ from bson import ObjectId
 
 import superdesk
 import logging
+import time
 from flask import json, current_app as app
 from superdesk.errors import SuperdeskApiError
 from superdesk.metadata.utils import generate_guid, item_url
@@ -26,7 +27,8 @@ from copy import deepcopy
 from eve.utils import config, ParsedRequest, date_to_str
 from planning.common import WORKFLOW_STATE_SCHEMA, POST_STATE_SCHEMA, get_coverage_cancellation_state,\
     remove_lock_information, WORKFLOW_STATE, ASSIGNMENT_WORKFLOW_STATE, update_post_item, get_coverage_type_name,\
-    set_original_creator, list_uniq_with_order, TEMP_ID_PREFIX, DEFAULT_ASSIGNMENT_PRIORITY
+    set_original_creator, list_uniq_with_order, TEMP_ID_PREFIX, DEFAULT_ASSIGNMENT_PRIORITY, get_search_after_filter, \
+    get_mongo_collection, get_items_by_id, bulk_update
 from superdesk.utc import utcnow
 from itertools import chain
 from planning.planning_notifications import PlanningNotifications
@@ -37,10 +39,34 @@ from superdesk import Resource
 
 logger = logging.getLogger(__name__)
 
+# Fields of the Assignment's ``assigned_to`` that are copied to the Coverage
+ASSIGNED_TO_FIELDS = (
+    'desk',
+    'user',
+    'state',
+    'assignor_user',
+    'assignor_desk',
+    'assigned_date_desk',
+    'assigned_date_user',
+    'coverage_provider',
+)
+
 
 class PlanningService(superdesk.Service):
     """Service class for the planning model."""
 
+    @staticmethod
+    def _get_assignments_by_id(coverage_ids):
+        """Get the Assignments of the Coverages, indexed by the string of their ``_id``
+
+        Only the fields copied to the Coverages are loaded from mongo
+        """
+        assignments = get_mongo_collection('assignments').find(
+            {'coverage_item': {'$in': coverage_ids}},
+            {'assigned_to': 1, 'priority': 1}
+        )
+        return {str(assignment[config.ID_FIELD]): assignment for assignment in assignments}
+
     def __generate_related_assignments(self, docs):
         coverages = {}
         for doc in docs:
@@ -55,36 +81,22 @@ class PlanningService(superdesk.Service):
         if not coverages:
             return
 
-        ids = list(coverages.keys())
-
-        assignments = list(get_resource_service('assignments').get_from_mongo(req=None,
-                                                                              lookup={
-                                                                                  'coverage_item': {'$in': ids}
-                                                                              }))
+        assignments = self._get_assignments_by_id(list(coverages.keys()))
 
         for coverage_id, coverage in coverages.items():
             if not coverage.get('assigned_to'):
                 coverage['assigned_to'] = {}
-            else:
-                try:
-                    assignment = [a for a in assignments if str(a.get('_id')) ==
-                                  str(coverage['assigned_to'].get('assignment_id'))][0]
-                except IndexError:
-                    continue
+                continue
+
+            assignment = assignments.get(str(coverage['assigned_to'].get('assignment_id')))
+            if not assignment:
+                continue
 
-                coverage['assigned_to']['assignment_id'] = assignment.get(config.ID_FIELD)
-                coverage['assigned_to']['desk'] = assignment.get('assigned_to', {}).get('desk')
-                coverage['assigned_to']['user'] = assignment.get('assigned_to', {}).get('user')
-                coverage['assigned_to']['state'] = assignment.get('assigned_to', {}).get('state')
-                coverage['assigned_to']['assignor_user'] = assignment.get('assigned_to', {}).get('assignor_user')
-                coverage['assigned_to']['assignor_desk'] = assignment.get('assigned_to', {}).get('assignor_desk')
-                coverage['assigned_to']['assigned_date_desk'] = \
-                    assignment.get('assigned_to', {}).get('assigned_date_desk')
-                coverage['assigned_to']['assigned_date_user'] = \
-                    assignment.get('assigned_to', {}).get('assigned_date_user')
-                coverage['assigned_to']['coverage_provider'] = \
-                    assignment.get('assigned_to', {}).get('coverage_provider')
-                coverage['assigned_to']['priority'] = assignment.get('priority')
+            assigned_to = assignment.get('assigned_to') or {}
+            coverage['assigned_to']['assignment_id'] = assignment.get(config.ID_FIELD)
+            for field in ASSIGNED_TO_FIELDS:
+                coverage['assigned_to'][field] = assigned_to.get(field)
+            coverage['assigned_to']['priority'] = assignment.get('priority')
 
     def on_fetched(self, docs):
         self.__generate_related_assignments(docs.get(config.ITEMS))
@@ -457,6 +469,8 @@ class PlanningService(superdesk.Service):
             })
 
         updates['_planning_schedule'] = schedule
+        updates['_combined_id'] = updates.get('event_item') or (original or {}).get('event_item') or \
+            updates.get(config.ID_FIELD) or (original or {}).get(config.ID_FIELD)
 
     def _create_update_assignment(self, planning_original, planning_updates, updates, original=None):
         """Create or update the assignment.
@@ -716,32 +730,42 @@ class PlanningService(superdesk.Service):
         return False
 
     def delete_assignments_for_coverages(self, coverages, notify=True):
+        start = time.perf_counter()
         failed_assignments = []
         deleted_assignments = []
         assignment_service = get_resource_service('assignments')
-        for coverage in coverages:
-            assign_id = coverage['assigned_to']['assignment_id']
-            assign_planning = coverage.get('planning')
-            try:
-                assignment_service.delete_action(lookup={'_id': assign_id})
-                deleted_assignments.append({
-                    'id': assign_id,
-                    'slugline': assign_planning.get('slugline'),
-                    'type': assign_planning.get('g2_content_type')
-                })
-            except SuperdeskApiError:
-                logger.error('Failed to delete assignment {}'.format(assign_id))
-                failed_assignments.append({
-                    'slugline': assign_planning.get('slugline'),
-                    'type': assign_planning.get('g2_content_type')
-                })
-
-                # Mark the assignment to be deleted.
-                original_assigment = assignment_service.find_one(req=None,
-                                                                 _id=assign_id)
-                if original_assigment:
-                    assignment_service.system_update(ObjectId(assign_id), {'_to_delete': True},
-                                                     original_assigment)
+        coverages_by_assignment = {str(coverage['assigned_to']['assignment_id']): coverage for coverage in coverages}
+        assignments = get_items_by_id('assignments', coverages_by_assignment.keys())
+
+        deleted, failed = assignment_service.delete_assignments(list(assignments.values()))
+        # Assignments that no longer exist are reported as deleted
+        deleted_ids = [str(assignment[config.ID_FIELD]) for assignment in deleted] + \
+            [assign_id for assign_id in coverages_by_assignment.keys() if assign_id not in assignments]
+        for assign_id in deleted_ids:
+            assign_planning = coverages_by_assignment[assign_id].get('planning')
+            deleted_assignments.append({
+                'id': assign_id,
+                'slugline': assign_planning.get('slugline'),
+                'type': assign_planning.get('g2_content_type')
+            })
+
+        for assign_id in failed:
+            logger.error('Failed to delete assignment {}'.format(assign_id))
+            assign_planning = coverages_by_assignment[str(assign_id)].get('planning')
+            failed_assignments.append({
+                'slugline': assign_planning.get('slugline'),
+                'type': assign_planning.get('g2_content_type')
+            })
+
+        # Mark the failed assignments to be deleted by the background job
+        bulk_update('assignments', failed, {'_to_delete': True})
+
+        logger.info('Metrics: {}'.format(json.dumps({
+            'task': 'delete_assignments_for_coverages',
+            'deleted': len(deleted_assignments),
+            'failed': len(failed_assignments),
+            'duration_ms': round((time.perf_counter() - start) * 1000, 1)
+        })))
 
         session_id = get_auth().get('_id')
         user_id = get_user().get(config.ID_FIELD)
@@ -761,10 +785,17 @@ class PlanningService(superdesk.Service):
                 user=user_id
             )
 
-    def get_expired_items(self, expiry_datetime, spiked_planning_only=False):
+    def get_expired_items(self, expiry_datetime, spiked_planning_only=False, checkpoint=None):
         """Get the expired items
 
-        Where planning_date is in the past
+        Where planning_date is in the past. Each page is requested after the last item of the previous page
+        (sorted on ``planning_date`` and ``guid``), so items changed or removed by the callee don't shift the pages.
+
+        :param datetime expiry_datetime: items scheduled before this date are returned
+        :param bool spiked_planning_only: only return spiked Planning items
+        :param str checkpoint: name of the checkpoint to store the position in once each page has been
+            processed by the callee. The scan resumes from there if it was interrupted, and the checkpoint
+            is cleared once all items have been returned
         """
         nested_filter = {
             'nested': {
@@ -823,35 +854,36 @@ class PlanningService(superdesk.Service):
                 }
             }
 
-        query['sort'] = [{'planning_date': 'asc'}]
+        query['sort'] = [{'planning_date': 'asc'}, {'guid': 'asc'}]
         query['size'] = 200
 
-        total_received = 0
-        total_items = -1
+        checkpoints_service = get_resource_service('planning_checkpoints')
+        last_item = checkpoints_service.get_checkpoint(checkpoint) if checkpoint else None
 
         while True:
-            query["from"] = total_received
-
-            results = self.search(query)
-
-            # If the total_items has not been set, then this is the first query
-            # In which case we need to store the total hits from the search
-            if total_items < 0:
-                total_items = results.count()
+            page_query = deepcopy(query)
+            if last_item:
+                page_query['query']['bool'].setdefault('must', []).append(
+                    get_search_after_filter('planning_date', last_item['sort'], last_item['guid'])
+                )
 
-                # If the search doesn't contain any results, return here
-                if total_items < 1:
-                    break
+            results = self.search(page_query)
 
             # If the last query doesn't contain any results, return here
             if not len(results.docs):
                 break
 
-            total_received += len(results.docs)
-
             # Yield the results for iteration by the callee
             yield list(results.docs)
 
+            last_plan = results.docs[-1]
+            last_item = {'sort': last_plan['planning_date'], 'guid': last_plan['guid']}
+            if checkpoint:
+                checkpoints_service.set_checkpoint(checkpoint, last_item)
+
+        if checkpoint:
+            checkpoints_service.clear_checkpoint(checkpoint)
+
     def on_event_converted_to_recurring(self, updates, original):
         items = self.find(where={
             'event_item': original[config.ID_FIELD]
@@ -1117,6 +1149,12 @@ planning_schema = {
             }
         }
     },
+    # field to group planning items with their associated event
+    # to be used for the single pass combined view
+    '_combined_id': {
+        'type': 'string',
+        'mapping': not_analyzed
+    },
 
     'planning_date': {
         'type': 'datetime',
@@ -1195,6 +1233,11 @@ class PlanningResource(superdesk.Resource):
     privileges = {'POST': 'planning_planning_management',
                   'PATCH': 'planning_planning_management',
                   'DELETE': 'planning'}
-    etag_ignore_fields = ['_planning_schedule']
+    etag_ignore_fields = ['_planning_schedule', '_combined_id']
 
-    mongo_indexes = {'event_item': ([('event_item', 1)], {'background': True})}
+    mongo_indexes = {
+        'event_item': ([('event_item', 1)], {'background': True}),
+        'event_item_1_lock_session_1': ([('event_item', 1), ('lock_session', 1)], {'background': True}),
+        'recurrence_id_1_lock_session_1': ([('recurrence_id', 1), ('lock_session', 1)], {'background': True}),
+        'lock_session_1': ([('lock_session', 1)], {'background': True}),
+    }
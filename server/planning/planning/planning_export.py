@@ -6,6 +6,7 @@ from flask import render_template_string, current_app
 from apps.auth import get_user_id
 from apps.templates.content_templates import get_item_from_template
 from apps.archive.common import insert_into_versions
+from planning.reference_cache import get_reference_item
 
 
 TEMPLATE = '''
@@ -51,7 +52,7 @@ def get_item(_id):
 def generate_body(ids):
     items = [get_item(_id) for _id in ids]
     template = current_app.config.get('PLANNING_EXPORT_BODY_TEMPLATE', TEMPLATE)
-    cv = superdesk.get_resource_service('vocabularies').find_one(req=None, _id='g2_content_type')
+    cv = get_reference_item('vocabularies', 'g2_content_type')
     if cv:
         labels = {_type['qcode']: _type['name'] for _type in cv['items']}
     else:
@@ -79,7 +80,7 @@ class PlanningExportService(superdesk.Service):
         production = superdesk.get_resource_service('archive')
         for doc in docs:
             planning_items = doc.pop('items', [])
-            desk = superdesk.get_resource_service('desks').find_one(req=None, _id=doc.pop('desk'))
+            desk = get_reference_item('desks', doc.pop('desk'))
             template = get_desk_template(desk)
             item = get_item_from_template(template)
             item[current_app.config['VERSION']] = 1
@@ -13,7 +13,6 @@ from superdesk import Resource, get_resource_service
 from planning.history import HistoryService
 import logging
 from eve.utils import config
-from copy import deepcopy
 from planning.common import WORKFLOW_STATE, ITEM_ACTIONS, ASSIGNMENT_WORKFLOW_STATE
 from planning.item_lock import LOCK_ACTION
 
@@ -35,6 +34,11 @@ class PlanningHistoryResource(Resource):
         'update': {'type': 'dict', 'nullable': True}
     }
 
+    mongo_indexes = {
+        'planning_id_1__created_1': ([('planning_id', 1), ('_created', 1)], {'background': True}),
+        '_created_1': ([('_created', 1)], {'background': True}),
+    }
+
 
 class PlanningHistoryService(HistoryService):
     """Service for keeping track of the history of a planning entries
@@ -51,10 +55,10 @@ class PlanningHistoryService(HistoryService):
             'operation': operation,
             'update': update
         }
-        self.post([history])
+        self._record_history(history)
 
     def on_item_updated(self, updates, original, operation=None):
-        item = deepcopy(original)
+        item = dict(original)
         if list(item.keys()) == ['_id']:
             diff = self._remove_unwanted_fields(updates)
         else:
@@ -94,7 +98,7 @@ class PlanningHistoryService(HistoryService):
 
     def _save_coverage_history(self, updates, original):
         """Save the coverage history for the planning item"""
-        item = deepcopy(original)
+        item = dict(original)
         original_coverages = {c.get('coverage_id'): c for c in (original or {}).get('coverages') or []}
         updates_coverages = {c.get('coverage_id'): c for c in (updates or {}).get('coverages') or []}
         added, deleted, updated = [], [], []
@@ -177,7 +181,7 @@ class PlanningHistoryService(HistoryService):
         )
 
     def on_duplicate_from(self, item, duplicate_id):
-        new_plan = deepcopy(item)
+        new_plan = dict(item)
         new_plan['duplicate_id'] = duplicate_id
         self._save_history(
             {config.ID_FIELD: str(item[config.ID_FIELD])},
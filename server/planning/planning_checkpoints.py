@@ -0,0 +1,66 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from eve.utils import config
+from superdesk import Service, Resource
+
+
+class PlanningCheckpointsService(Service):
+    """Stores the position reached by long running tasks, so they can resume after being interrupted"""
+
+    def get_checkpoint(self, name):
+        """Get the value stored for the checkpoint
+
+        :param str name: name of the checkpoint
+        :return dict: the stored value, or None if the checkpoint is not set
+        """
+        checkpoint = self.find_one(req=None, _id=name)
+        return (checkpoint or {}).get('value')
+
+    def set_checkpoint(self, name, value):
+        """Store the value for the checkpoint, replacing any previous value
+
+        :param str name: name of the checkpoint
+        :param dict value: value to store
+        """
+        original = self.find_one(req=None, _id=name)
+        if original:
+            self.system_update(name, {'value': value}, original)
+        else:
+            self.post([{config.ID_FIELD: name, 'value': value}])
+
+    def clear_checkpoint(self, name):
+        """Remove the checkpoint
+
+        :param str name: name of the checkpoint
+        """
+        self.delete_action(lookup={config.ID_FIELD: name})
+
+
+class PlanningCheckpointsResource(Resource):
+    """
+    Resource for storing checkpoints of background tasks
+    """
+
+    schema = {
+        # Name of the checkpoint
+        config.ID_FIELD: {
+            'type': 'string',
+            'unique': True
+        },
+        # The position stored by the task
+        'value': {
+            'type': 'dict'
+        }
+    }
+
+    internal_resource = True
+    item_methods = []
+    resource_methods = []
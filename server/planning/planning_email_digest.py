@@ -0,0 +1,68 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from superdesk import Service, Resource
+from planning.common import get_mongo_collection
+
+
+class PlanningEmailDigestService(Service):
+    """Stores the assignment emails of users receiving them as a digest, until the digest is sent"""
+
+    def queue_email(self, user_id, text_message, html_message, files=None):
+        """Add the email to the next digest of the user
+
+        :param user_id: id of the user
+        :param str text_message: text body of the email
+        :param str html_message: html body of the email
+        :param list files: ids of the events_files to attach
+        """
+        self.post([{
+            'user_id': user_id,
+            'text_message': text_message,
+            'html_message': html_message,
+            'files': [str(file_id) for file_id in files or []]
+        }])
+
+    def get_due_users(self, due_before):
+        """Get the ids of the users whose oldest queued email was added before `due_before`"""
+        return [
+            group['_id'] for group in get_mongo_collection('planning_email_digest').aggregate([
+                {'$group': {'_id': '$user_id', 'oldest': {'$min': '$_created'}}},
+                {'$match': {'oldest': {'$lte': due_before}}}
+            ])
+        ]
+
+    def get_user_emails(self, user_id):
+        """Get the queued emails of the user, oldest first"""
+        return list(get_mongo_collection('planning_email_digest').find({'user_id': user_id}).sort('_created', 1))
+
+    def remove_emails(self, ids):
+        get_mongo_collection('planning_email_digest').delete_many({'_id': {'$in': ids}})
+
+
+class PlanningEmailDigestResource(Resource):
+    """
+    Resource for the assignment emails waiting to be sent as a digest
+    """
+
+    schema = {
+        'user_id': Resource.rel('users'),
+        'text_message': {'type': 'string'},
+        'html_message': {'type': 'string'},
+        'files': {'type': 'list'}
+    }
+
+    mongo_indexes = {
+        'user_id_1__created_1': ([('user_id', 1), ('_created', 1)], {'background': True}),
+    }
+
+    internal_resource = True
+    item_methods = []
+    resource_methods = []
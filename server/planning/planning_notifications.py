@@ -17,8 +17,16 @@ from apps.archive.common import get_user
 from superdesk.errors import SuperdeskApiError
 from superdesk.celery_app import celery
 from planning.common import WORKFLOW_STATE
+from planning.reference_cache import get_reference_item
+from planning.slack import slack_directory, slack_delivery
+from planning.notification_templates import NotificationTemplate, get_notification_template, render_meta_template
+from planning.attachment_cache import attachment_cache, email_stats
+from superdesk.utc import utcnow
+from superdesk.celery_task_utils import get_lock_id
+from superdesk.lock import lock, unlock
+from datetime import timedelta
 from superdesk.emails import send_email
-from flask import current_app as app, render_template
+from flask import current_app as app
 from flask_mail import Attachment
 
 try:
@@ -55,8 +63,8 @@ class PlanningNotifications():
 
         # Attempt to load the template file, if that fails, just use the message
         try:
-            (source, filename, uptodate) = app.jinja_loader.get_source(environment=app.jinja_env,
-                                                                       template=message + '.txt')
+            template = get_notification_template(message + '.txt')
+            source = template.source
         except TemplateNotFound:
             logger.warn('Failed to load the planning notification template {}.txt'.format(message))
             return
@@ -65,31 +73,27 @@ class PlanningNotifications():
             add_activity(ACTIVITY_UPDATE, can_push_notification=True, resource='assignments', msg=source,
                          notify=[target_user], **data)
         elif target_desk is not None:
-            desk = superdesk.get_resource_service('desks').find_one(req=None, _id=target_desk)
-            if not desk:
+            members = get_desk_member_ids(target_desk, target_desk2)
+            if members is None:
                 logger.warn('Unable to find desk {} for notification'.format(target_desk))
                 return
-            members = desk.get('members', [])
-            if target_desk2 is not None:
-                desk = superdesk.get_resource_service('desks').find_one(req=None, _id=target_desk2)
-                members = members + [x for x in desk.get('members', []) if x not in members]
-
-            for member in members:
-                if target_user is not None and str(member.get('user', '')) == target_user:
-                    continue
+
+            # A single activity notifies all the members of the desk(s), rather than one activity per member
+            notify = [member for member in members if target_user is None or member != str(target_user)]
+            if notify:
                 add_activity(ACTIVITY_UPDATE, can_push_notification=True, resource='assignments', msg=source,
-                             notify=[member.get('user')], **data)
+                             notify=notify, **data)
 
         # determine if a Slack Bot has been configured
         if slack_client_installed and app.config.get('SLACK_BOT_TOKEN'):
             args = {'token': app.config.get('SLACK_BOT_TOKEN'), 'target_user': target_user, 'target_desk': target_desk,
-                    'target_desk2': target_desk2, 'message': _get_slack_message_string(source, data)}
+                    'target_desk2': target_desk2, 'message': _get_slack_message_string(template, data)}
             self._notify_slack.apply_async(kwargs=args)
 
         # send email notification to user
         if target_user:
-            args = {'target_user': target_user, 'text_message': _get_email_message_string(source, meta_message, data),
-                    'html_message': _get_email_message_html(source, meta_message, data), 'data': data}
+            args = {'target_user': target_user, 'text_message': _get_email_message_string(template, meta_message, data),
+                    'html_message': _get_email_message_html(template, meta_message, data), 'data': data}
             self._notify_email.apply_async(kwargs=args)
 
     def user_update(self, updates, original):
@@ -108,16 +112,13 @@ class PlanningNotifications():
             if 'slack_username' in updates and updates.get('slack_username', '') != original.get('slack_username', '') \
                     and 'slack_user_id' not in updates:
                 if updates.get('slack_username', None):
-                    sc = SlackClient(token=app.config['SLACK_BOT_TOKEN'])
-                    slack_users = sc.api_call('users.list')
-                    if slack_users.get('ok', False):
-                        slack_user = next((u for u in slack_users.get('members') if
-                                           u.get('name') == updates.get('slack_username', '')), False)
-                        if slack_user:
-                            updates['slack_user_id'] = slack_user.get('id')
-                            updates['slack_username'] = slack_user.get('name')
-                        else:
-                            raise SuperdeskApiError.badRequestError(message='Unable to find matching Slack user')
+                    sc = _get_slack_client(app.config['SLACK_BOT_TOKEN'])
+                    slack_user = slack_directory.get_by_name(sc, updates.get('slack_username', ''))
+                    if slack_user:
+                        updates['slack_user_id'] = slack_user.get('id')
+                        updates['slack_username'] = slack_user.get('name')
+                    else:
+                        raise SuperdeskApiError.badRequestError(message='Unable to find matching Slack user')
                 else:
                     updates['slack_user_id'] = None
                     updates['slack_username'] = None
@@ -137,6 +138,37 @@ class PlanningNotifications():
         _send_user_email(target_user, text_message, html_message, data)
 
 
+def get_desk_member_ids(target_desk, target_desk2=None):
+    """Get the ids of the members of the desk, or the union of the members of both desks
+
+    The desks are loaded through the reference cache, so notifying the same desk(s) again during the request
+    doesn't load them again.
+
+    :param target_desk: id of the desk
+    :param target_desk2: optional id of the second desk
+    :return list: ids of the members as strings, or None if target_desk doesn't exist
+    """
+    members = []
+    seen = set()
+    for desk_id in (target_desk, target_desk2):
+        if desk_id is None:
+            continue
+
+        desk = get_reference_item('desks', desk_id)
+        if not desk:
+            if desk_id == target_desk:
+                return None
+            continue
+
+        for member in desk.get('members') or []:
+            user_id = str(member.get('user', ''))
+            if user_id and user_id not in seen:
+                seen.add(user_id)
+                members.append(user_id)
+
+    return members
+
+
 def _get_slack_client(token):
     return SlackClient(token=token)
 
@@ -151,14 +183,23 @@ def _send_to_slack_desk_channel(sc, desk_id, message):
     :param data:
     :return:
     """
-    desk = superdesk.get_resource_service('desks').find_one(req=None, _id=desk_id)
+    desk = get_reference_item('desks', desk_id)
     channel_id = desk.get('slack_channel_name')
     if channel_id:
-        response = sc.api_call('chat.postMessage', as_user=True, channel=channel_id,
-                               text=message)
-        if not response.get('ok', False):
-            logger.warn('Failure response from slack post message call {}'.format(response))
-            raise Exception('Failure response from slack post message call {}'.format(response))
+        slack_delivery.send(sc, channel_id, message, as_user=True)
+
+
+def _render_message(message, data):
+    """
+    Render the message template, using the compiled template when one is passed instead of the template source
+
+    :param message: NotificationTemplate or template source
+    :param data:
+    :return: The message with the data applied
+    """
+    if isinstance(message, NotificationTemplate):
+        return message.template.render(data)
+    return Template(message).render(data)
 
 
 def _get_slack_message_string(message, data):
@@ -170,10 +211,9 @@ def _get_slack_message_string(message, data):
     :return: The message with the data applied
     """
     user = get_user()
-    template = Template(message)
     if data.get('omit_user', False):
-        return template.render(data)
-    return template.render(data) + ' by ' + user.get('display_name', 'Unknown')
+        return _render_message(message, data)
+    return _render_message(message, data) + ' by ' + user.get('display_name', 'Unknown')
 
 
 def _get_email_message_string(message, meta_message, data):
@@ -185,8 +225,8 @@ def _get_email_message_string(message, meta_message, data):
     :param data:
     :return: The message with the data applied
     """
-    template_string = Template(message).render(data)
-    template_meta_string = render_template(meta_message + '.txt', **data) if meta_message else ''
+    template_string = _render_message(message, data)
+    template_meta_string = render_meta_template(meta_message + '.txt', data) if meta_message else ''
 
     if template_meta_string:
         return template_string + '\n\n' + template_meta_string
@@ -203,8 +243,8 @@ def _get_email_message_html(message, meta_message, data):
     :param data:
     :return: The message with the data applied
     """
-    template_string = Template(message).render(data)
-    template_meta_string = render_template(meta_message + '.html', **data) if meta_message else ''
+    template_string = _render_message(message, data)
+    template_meta_string = render_meta_template(meta_message + '.html', data) if meta_message else ''
 
     if template_meta_string:
         return template_string + '<br><br>' + template_meta_string
@@ -221,7 +261,7 @@ def _send_user_email(user_id, text_message, html_message, data):
     :param html_message:
     :return:
     """
-    user = superdesk.get_resource_service('users').find_one(req=None, _id=user_id)
+    user = get_reference_item('users', user_id)
     if not user:
         return
 
@@ -236,23 +276,74 @@ def _send_user_email(user_id, text_message, html_message, data):
     if not user_email:
         return
 
-    admins = app.config['ADMINS']
+    files = (data.get('event') or {}).get('files') or []
+    if app.config.get('PLANNING_EMAIL_DIGEST_MINUTES', 0) and \
+            preferences.get('planning:email_digest', {}).get('enabled', False):
+        superdesk.get_resource_service('planning_email_digest').queue_email(user.get('_id'), text_message,
+                                                                            html_message, files)
+        email_stats['digest_entries_queued'] += 1
+        return
+
+    _send_email(user_email, 'Superdesk assignment', text_message, html_message, files)
 
-    # Determine if there are any files attached to the event and send them as attachments
+
+def _send_email(user_email, subject, text_message, html_message, files):
+    """
+    Send the email, attaching the event files
+
+    :param user_email:
+    :param subject:
+    :param text_message:
+    :param html_message:
+    :param files: ids of the events_files to attach
+    :return:
+    """
     attachments = []
-    if data.get('event') and data.get('event', {}).get('files'):
-        for file_id in data.get('event', {}).get('files'):
-            event_file = superdesk.get_resource_service('events_files').find_one(req=None, _id=file_id)
-            media = app.media.get(event_file['media'], resource='events_files')
-            fp = media.read()
-            attachments.append(Attachment(filename=media.name, content_type=media.content_type, data=fp))
-
-    send_email(subject='Superdesk assignment',
-               sender=admins[0],
+    for file_id in files:
+        attachment = attachment_cache.get(file_id)
+        if attachment:
+            filename, content_type, fp = attachment
+            attachments.append(Attachment(filename=filename, content_type=content_type, data=fp))
+
+    send_email(subject=subject,
+               sender=app.config['ADMINS'][0],
                recipients=[user_email],
                text_body=text_message,
                html_body=html_message,
                attachments=attachments)
+    email_stats['emails_sent'] += 1
+
+
+def send_email_digests():
+    """
+    Send the digest of the users whose oldest queued email is older than PLANNING_EMAIL_DIGEST_MINUTES
+
+    :return:
+    """
+    window = app.config.get('PLANNING_EMAIL_DIGEST_MINUTES', 0)
+    lock_name = get_lock_id('planning', 'send_email_digests')
+    if not lock(lock_name, expire=300):
+        return
+
+    try:
+        service = superdesk.get_resource_service('planning_email_digest')
+        for user_id in service.get_due_users(utcnow() - timedelta(minutes=window)):
+            emails = service.get_user_emails(user_id)
+            user = get_reference_item('users', user_id)
+            if user and user.get('email'):
+                files = []
+                for email in emails:
+                    files.extend(file_id for file_id in email.get('files') or [] if file_id not in files)
+
+                _send_email(user['email'],
+                            'Superdesk assignments ({})'.format(len(emails)),
+                            '\n\n----\n\n'.join(email.get('text_message') or '' for email in emails),
+                            '<hr>'.join(email.get('html_message') or '' for email in emails),
+                            files)
+
+            service.remove_emails([email['_id'] for email in emails])
+    finally:
+        unlock(lock_name)
 
 
 def _send_to_slack_user(sc, user_id, message):
@@ -264,7 +355,7 @@ def _send_to_slack_user(sc, user_id, message):
     :param message:
     :return:
     """
-    user = superdesk.get_resource_service('users').find_one(req=None, _id=user_id)
+    user = get_reference_item('users', user_id)
     if not user:
         return
     # Check if the user has enabled Slack notifications
@@ -277,11 +368,7 @@ def _send_to_slack_user(sc, user_id, message):
     # Need to open a direct IM channel to the target user
     im = sc.api_call('im.open', user=user_token, return_im=True)
     if im.get('ok', False):
-        sent = sc.api_call('chat.postMessage', as_user=False, channel=im.get('channel', {}).get('id'),
-                           text=message)
-        if not sent.get('ok', False):
-            logger.warn('Failure response from slack post message call {}'.format(sent))
-            raise Exception('Failure response from slack post message call {}'.format(sent))
+        slack_delivery.send(sc, im.get('channel', {}).get('id'), message, as_user=False)
     else:
         logger.warn('Failed to open IM channel to username: {}'.format(user.get('username', '')))
         raise Exception('Failed to open IM channel to username: {}'.format(user.get('username', '')))
@@ -301,30 +388,15 @@ def _get_slack_user_id(sc, user):
     if user_token:
         return user_token
 
-    # Get a list all the Slack users available in the workspace
-    slack_users = sc.api_call('users.list')
-    if slack_users.get('ok', False):
-        # If there is a Slack username defined for the superdesk user look for that user in slack
-        slack_user = next((u for u in slack_users.get('members') if u.get('name') == user.get('slack_username')),
-                          False)
-        if slack_user:
-            # Set the slack user id for this user
-            _update_user_slack_details(user, slack_user)
-            return slack_user.get('id')
-
-        # Look for a slack user with the same name as the superdesk username
-        slack_user = next((u for u in slack_users.get('members') if u.get('name') == user.get('username')), False)
-        if slack_user:
-            _update_user_slack_details(user, slack_user)
-            return slack_user.get('id')
-
-        # Look for a slack user with the same email address
-        slack_user = next(
-            (u for u in slack_users.get('members') if u.get('profile', {}).get('email') == user.get('email')),
-            False)
-        if slack_user:
-            _update_user_slack_details(user, slack_user)
-            return slack_user.get('id')
+    # Match the user by Slack username, then superdesk username, then email, using the cached Slack directory
+    slack_user = slack_directory.get_by_name(sc, user.get('slack_username')) or \
+        slack_directory.get_by_name(sc, user.get('username')) or \
+        slack_directory.get_by_email(sc, user.get('email'))
+    if slack_user:
+        # Set the slack user id for this user
+        _update_user_slack_details(user, slack_user)
+        return slack_user.get('id')
+
     logger.warn(msg='Unable to match a slack user for : {}'.format(user.get('username')))
     return None
 
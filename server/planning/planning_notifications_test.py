@@ -9,7 +9,12 @@
 # at https://www.sourcefabric.org/superdesk/license
 
 from planning.tests import TestCase
-from .planning_notifications import PlanningNotifications
+from .planning_notifications import PlanningNotifications, _send_user_email, send_email_digests
+from .attachment_cache import AttachmentCache, attachment_cache, get_email_stats, reset_email_stats
+from planning.common import get_mongo_collection
+from superdesk.utc import utcnow
+from datetime import timedelta
+from io import BytesIO
 from unittest import mock
 
 
@@ -60,3 +65,106 @@ class NotificationTests(TestCase):
                                                   target_desk2=None, message='hello user from world by Unknown')
         except Exception:
             self.assertTrue(False)
+
+    @mock.patch('planning.planning_notifications._get_slack_client', return_value=MockSlack())
+    def test_failed_slack_post_fails_the_task(self, sc):
+        with self.assertRaises(Exception):
+            PlanningNotifications()._notify_slack('hdskjgdsjg', target_user=None, target_desk=self.desk_ids[0],
+                                                  target_desk2=None, message='unexpected message')
+
+    @mock.patch('superdesk.activity.push_notification')
+    def test_desk_fan_out_single_activity(self, push_notification):
+        with self.app.app_context():
+            user_ids = self.app.data.insert('users', [
+                {'username': 'user{}'.format(i), 'display_name': 'User {}'.format(i)} for i in range(200)
+            ])
+            desk_ids = self.app.data.insert('desks', [
+                {'name': 'news', 'members': [{'user': user_id} for user_id in user_ids[:150]]},
+                {'name': 'photo', 'members': [{'user': user_id} for user_id in user_ids[100:]]},
+            ])
+
+            PlanningNotifications().notify_assignment(target_desk=desk_ids[0], target_desk2=desk_ids[1],
+                                                      target_user=str(user_ids[0]),
+                                                      message='assignment_to_desk_msg',
+                                                      coverage_type='Text', slugline='test', assign_type='assigned',
+                                                      desk='news', assignor='foo')
+
+            activities = list(self.app.data.find_all('activity'))
+            self.assertEqual(len(activities), 1)
+            self.assertEqual(len(activities[0]['recipients']), 199)
+            self.assertNotIn(user_ids[0], [recipient['user_id'] for recipient in activities[0]['recipients']])
+            self.assertEqual(push_notification.call_count, 1)
+
+
+class EmailNotificationTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        reset_email_stats()
+        attachment_cache.clear()
+
+        with self.app.app_context():
+            media_id = self.app.media.put(BytesIO(b'x' * 1024), filename='agenda.pdf', content_type='application/pdf',
+                                          resource='events_files')
+            self.file_ids = self.app.data.insert('events_files', [{'media': media_id}])
+            self.user_ids = self.app.data.insert('users', [{
+                'username': 'foo', 'display_name': 'Foo Bar', 'email': 'foo@example.com',
+                'user_preferences': {'email:notification': {'enabled': True}}
+            }, {
+                'username': 'bar', 'display_name': 'Bar Foo', 'email': 'bar@example.com',
+                'user_preferences': {'email:notification': {'enabled': True},
+                                     'planning:email_digest': {'enabled': True}}
+            }])
+
+    @mock.patch('planning.planning_notifications.send_email')
+    def test_attachments_read_once(self, send_email):
+        with self.app.app_context():
+            for _ in range(3):
+                _send_user_email(self.user_ids[0], 'text', '<p>html</p>', {'event': {'files': self.file_ids}})
+
+            self.assertEqual(send_email.call_count, 3)
+            self.assertEqual(send_email.call_args[1]['attachments'][0].data, b'x' * 1024)
+
+            stats = get_email_stats()
+            self.assertEqual(stats['emails_sent'], 3)
+            self.assertEqual(stats['media_bytes_read'], 1024)
+            self.assertEqual(stats['attachment_cache_hits'], 2)
+
+    def test_attachment_cache_evicts_least_recently_used(self):
+        cache = AttachmentCache(max_size=10)
+        cache._add('a', ('a', 'text/plain', b'aaaa'))
+        cache._add('b', ('b', 'text/plain', b'bbbb'))
+        cache.items.move_to_end('a')
+        cache._add('c', ('c', 'text/plain', b'cccc'))
+
+        self.assertEqual(list(cache.items.keys()), ['a', 'c'])
+        self.assertEqual(cache.size, 8)
+
+        cache._add('d', ('d', 'text/plain', b'd' * 11))
+        self.assertNotIn('d', cache.items)
+
+    @mock.patch('planning.planning_notifications.send_email')
+    def test_digest(self, send_email):
+        self.app.config['PLANNING_EMAIL_DIGEST_MINUTES'] = 10
+        with self.app.app_context():
+            for i in range(3):
+                _send_user_email(self.user_ids[1], 'text {}'.format(i), 'html {}'.format(i),
+                                 {'event': {'files': self.file_ids}})
+
+            self.assertEqual(send_email.call_count, 0)
+            self.assertEqual(get_email_stats()['digest_entries_queued'], 3)
+
+            # Not due yet
+            send_email_digests()
+            self.assertEqual(send_email.call_count, 0)
+
+            get_mongo_collection('planning_email_digest').update_many(
+                {}, {'$set': {'_created': utcnow() - timedelta(minutes=11)}})
+            send_email_digests()
+
+            self.assertEqual(send_email.call_count, 1)
+            kwargs = send_email.call_args[1]
+            self.assertEqual(kwargs['recipients'], ['bar@example.com'])
+            self.assertEqual(kwargs['text_body'], 'text 0\n\n----\n\ntext 1\n\n----\n\ntext 2')
+            self.assertEqual(len(kwargs['attachments']), 1)
+            self.assertEqual(get_mongo_collection('planning_email_digest').count(), 0)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+"""Cache of reference documents (desks, users, vocabularies, agendas and contacts)
+
+Items are cached on ``flask.g``, so the cache lives as long as the current request or task app context.
+Formatting a batch of items or sending notifications to many users only loads each reference document once.
+"""
+
+from copy import deepcopy
+from flask import g, has_app_context
+from eve.utils import config
+from superdesk import get_resource_service
+
+CACHED_RESOURCES = ('desks', 'users', 'vocabularies', 'agenda', 'contacts')
+
+
+def _get_cache():
+    if not has_app_context():
+        return None
+
+    if 'planning_reference_cache' not in g:
+        g.planning_reference_cache = {'items': {}, 'hits': 0, 'misses': 0}
+
+    return g.planning_reference_cache
+
+
+def get_reference_item(resource, item_id):
+    """Get the item from the cache, loading it on the first access
+
+    A copy is returned, so callers are free to modify it
+
+    :param str resource: name of the resource
+    :param item_id: id of the item
+    :return dict: the item, or None if it doesn't exist
+    """
+    cache = _get_cache()
+    if cache is None or item_id is None:
+        return get_resource_service(resource).find_one(req=None, _id=item_id)
+
+    key = (resource, str(item_id))
+    if key in cache['items']:
+        cache['hits'] += 1
+    else:
+        cache['misses'] += 1
+        cache['items'][key] = get_resource_service(resource).find_one(req=None, _id=item_id)
+
+    return deepcopy(cache['items'][key])
+
+
+def invalidate_reference_item(resource, item_id=None):
+    """Remove the item from the cache, or all items of the resource if no item_id is provided"""
+    cache = _get_cache()
+    if cache is None:
+        return
+
+    if item_id is not None:
+        cache['items'].pop((resource, str(item_id)), None)
+        return
+
+    for key in [key for key in cache['items'] if key[0] == resource]:
+        cache['items'].pop(key)
+
+
+def get_reference_cache_stats():
+    """Get the hit and miss counters of the cache for the current context"""
+    cache = _get_cache() or {'items': {}, 'hits': 0, 'misses': 0}
+    return {'hits': cache['hits'], 'misses': cache['misses'], 'size': len(cache['items'])}
+
+
+def on_updated(resource, updates, original):
+    if resource in CACHED_RESOURCES:
+        invalidate_reference_item(resource, original.get(config.ID_FIELD))
+
+
+def on_deleted_item(resource, doc):
+    if resource in CACHED_RESOURCES:
+        invalidate_reference_item(resource, doc.get(config.ID_FIELD))
+
+
+def init_app(app):
+    app.on_updated += on_updated
+    app.on_replaced += on_updated
+    app.on_deleted_item += on_deleted_item
@@ -0,0 +1,56 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from planning.tests import TestCase
+from superdesk import get_resource_service
+from .reference_cache import get_reference_item, get_reference_cache_stats
+
+
+class ReferenceCacheTestCase(TestCase):
+    def test_loads_each_item_once(self):
+        with self.app.app_context():
+            self.app.data.insert('agenda', [
+                {'_id': 'a1', 'name': 'Sports', 'is_enabled': True},
+                {'_id': 'a2', 'name': 'Finance', 'is_enabled': True}
+            ])
+
+            for _ in range(3):
+                self.assertEqual(get_reference_item('agenda', 'a1')['name'], 'Sports')
+                self.assertEqual(get_reference_item('agenda', 'a2')['name'], 'Finance')
+            self.assertIsNone(get_reference_item('agenda', 'a3'))
+            self.assertIsNone(get_reference_item('agenda', 'a3'))
+
+            self.assertEqual(get_reference_cache_stats(), {'hits': 5, 'misses': 3, 'size': 3})
+
+    def test_returns_copies(self):
+        with self.app.app_context():
+            self.app.data.insert('agenda', [{'_id': 'a1', 'name': 'Sports', 'is_enabled': True}])
+
+            get_reference_item('agenda', 'a1').pop('name')
+            self.assertEqual(get_reference_item('agenda', 'a1')['name'], 'Sports')
+
+    def test_invalidated_on_update_and_delete(self):
+        with self.app.app_context():
+            self.app.data.insert('agenda', [{'_id': 'a1', 'name': 'Sports', 'is_enabled': True}])
+            self.assertEqual(get_reference_item('agenda', 'a1')['name'], 'Sports')
+
+            service = get_resource_service('agenda')
+            original = service.find_one(req=None, _id='a1')
+            service.system_update('a1', {'name': 'Finance'}, original)
+            self.app.on_updated('agenda', {'name': 'Finance'}, original)
+            self.assertEqual(get_reference_item('agenda', 'a1')['name'], 'Finance')
+
+            service.delete_action(lookup={'_id': 'a1'})
+            self.app.on_deleted_item('agenda', original)
+            self.assertIsNone(get_reference_item('agenda', 'a1'))
+            self.assertEqual(get_reference_cache_stats()['misses'], 3)
+
+        with self.app.app_context():
+            self.assertEqual(get_reference_cache_stats(), {'hits': 0, 'misses': 0, 'size': 0})
@@ -19,13 +19,18 @@ from werkzeug.datastructures import MultiDict
 from eve.utils import ParsedRequest, config, str_to_date
 from superdesk.errors import SuperdeskApiError
 from superdesk.utc import get_timezone_offset, utcnow
-from planning.common import SPIKED_STATE, WORKFLOW_STATE, sanitize_query_text, get_start_of_next_week
+from planning.common import SPIKED_STATE, WORKFLOW_STATE, sanitize_query_text, get_start_of_next_week, \
+    combined_view_single_pass
 from superdesk import get_resource_service
 
 
 logger = logging.getLogger(__name__)
 
 
+# Number of groups each shard returns for every group requested by the combined view
+COMBINED_SHARD_SIZE_FACTOR = 5
+
+
 class EventsPlanningService(superdesk.Service):
 
     allowed_params = {
@@ -54,9 +59,104 @@ class EventsPlanningService(superdesk.Service):
         :rtype: `pymongo.cursor.Cursor`
         """
         self._check_for_unknown_params(req, whitelist=self.allowed_params)
+        if combined_view_single_pass():
+            return self._get_combined_view_single_pass(req)
+
         items = self._get_events_and_planning(req)
         return self._get_combined_view_data(items, req)
 
+    def _get_combined_view_single_pass(self, request):
+        """Get list of event and planning for the combined view using a single elastic query
+
+        Events and their related Planning items share the same ``_combined_id``. The matching documents
+        are grouped on this field, ordered by the earliest scheduled date of the group, and the top hit
+        of each group is used (the Event if it matched the search criteria).
+
+        :param request: object representing the HTTP request
+        """
+        filters, must, must_not = self._get_query(request)
+        page = request.page or 1
+        page_size = self._get_page_size(request)
+        search_service = get_resource_service('planning_search')
+
+        # The filters have to be part of the query (not a post filter) so that they apply to the aggregations
+        hits = search_service.search_hits({
+            'query': {'bool': {'must': must, 'must_not': must_not, 'filter': filters}},
+            'size': 0,
+            'aggs': self._get_combined_aggregations(page * page_size)
+        })
+
+        aggregations = hits.pop('aggregations', None) or {}
+        buckets = (aggregations.get('combined') or {}).get('buckets') or []
+        top_hits = [bucket['item']['hits']['hits'][0] for bucket in buckets[(page - 1) * page_size:]]
+        hits['hits'] = {
+            'total': (aggregations.get('total') or {}).get('value') or 0,
+            'hits': self._get_events_for_planning_hits(top_hits)
+        }
+
+        docs = search_service._parse_hits(hits)
+        search_service.on_fetched_docs(request, search_service.repos, docs)
+        return docs
+
+    def _get_combined_aggregations(self, size):
+        """Get the aggregations grouping the Events with their Planning items
+
+        The groups are ordered by the earliest ``_planning_schedule`` of all the matching documents of the
+        group, so a Planning item scheduled before its Event moves the group earlier. The two pass view
+        orders on the schedule of the Event only. Ties are ordered on the group key, ``_term`` being the key
+        of the bucket in Elasticsearch 2.x (``_key`` from 6.0).
+
+        Ordering terms on a sub-aggregation is only accurate if each shard returns all of its candidate
+        groups, hence the explicit ``shard_size``, a multiple of the requested groups.
+
+        :param int size: number of groups to return
+        """
+        return {
+            'total': {'cardinality': {'field': '_combined_id'}},
+            'combined': {
+                'terms': {
+                    'field': '_combined_id',
+                    'size': size,
+                    'shard_size': size * COMBINED_SHARD_SIZE_FACTOR,
+                    'order': [{'schedule>scheduled': 'asc'}, {'_term': 'asc'}]
+                },
+                'aggs': {
+                    'schedule': {
+                        'nested': {'path': '_planning_schedule'},
+                        'aggs': {
+                            'scheduled': {'min': {'field': '_planning_schedule.scheduled'}}
+                        }
+                    },
+                    # 'event' sorts before 'planning', so the Event is the top hit if it matched
+                    'item': {'top_hits': {'size': 1, 'sort': [{'type': 'asc'}]}}
+                }
+            }
+        }
+
+    def _get_events_for_planning_hits(self, hits):
+        """Replace Planning hits with their associated Event
+
+        Only required for groups where the Planning item matched the search criteria but the Event did not,
+        so this query is bound by the page size.
+
+        :param list hits: list of elastic hits
+        """
+        event_ids = [hit['_source']['event_item'] for hit in hits
+                     if hit.get('_type') == 'planning' and hit.get('_source', {}).get('event_item')]
+        if not event_ids:
+            return hits
+
+        events = get_resource_service('planning_search').search_hits({
+            'query': {'terms': {'_id': event_ids}},
+            'size': len(event_ids)
+        }, types=['events'])
+        events = {event['_id']: event for event in events.get('hits', {}).get('hits', [])}
+
+        return [
+            events.get(hit['_source'].get('event_item'), hit) if hit.get('_type') == 'planning' else hit
+            for hit in hits
+        ]
+
     def _get_combined_view_data(self, items, request):
         """Get list of event and planning for the combined view
 
@@ -48,19 +48,33 @@ class PlanningSearchService(superdesk.Service):
         """Run the query against events and planning indexes"""
         query = self._get_query(req)
         types = self._get_types(req)
-        fields = self._get_projected_fields(req)
+        hits = self.search_hits(query, types, self._get_projected_fields(req))
+        docs = self._parse_hits(hits)
+        self.on_fetched_docs(req, types, docs)
+        return docs
+
+    def search_hits(self, query, types=None, fields=None):
+        """Run the raw elastic query against events and planning indexes
+
+        :param dict query: elastic query body
+        :param list types: list of repos to search, defaults to events and planning
+        :param list fields: fields to project
+        :return dict: raw elastic response
+        """
+        if types is None:
+            types = self.repos.copy()
 
         params = {}
         if fields:
             params['_source'] = fields
 
-        hits = self.elastic.es.search(body=query,
+        return self.elastic.es.search(body=query,
                                       index=self._get_index(types),
                                       doc_type=types,
                                       params=params)
 
-        docs = self._parse_hits(hits)
-
+    def on_fetched_docs(self, req, types, docs):
+        """Call the on_fetched_resource callbacks for the parsed documents"""
         # to avoid call on_fetched_resource callback from some internal resource
         on_fetched_resource = True
         try:
@@ -74,8 +88,6 @@ class PlanningSearchService(superdesk.Service):
                 getattr(app, 'on_fetched_resource')(resource, response)
                 getattr(app, 'on_fetched_resource_%s' % resource)(response)
 
-        return docs
-
     def _get_resource_schema(self, resource):
         datasource = self.elastic.get_datasource(resource)
         schema = {}
@@ -0,0 +1,207 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+"""Slack workspace directory cache and rate limited message delivery
+
+The directory caches the members of the Slack workspace indexed by username and email, so matching a Superdesk
+user doesn't fetch the whole member list every time. Messages are sent through a token bucket shared by the tasks
+of the worker process.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIRECTORY_TTL = 3600
+# A lookup miss only forces a refresh if the directory is older than this
+DIRECTORY_MISS_REFRESH = 60
+DEFAULT_RATE = 1.0
+DEFAULT_BURST = 5
+MAX_RATE_LIMITED_RETRIES = 3
+
+
+class SlackDirectory:
+    """Members of the Slack workspace, indexed by username and email
+
+    Once the directory is older than the ttl it keeps being used while it is refreshed in a background thread.
+    """
+
+    def __init__(self, ttl=DEFAULT_DIRECTORY_TTL):
+        self.ttl = ttl
+        self.by_name = {}
+        self.by_email = {}
+        self.loaded_at = None
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get_by_name(self, sc, name):
+        return self._get(sc, 'by_name', name)
+
+    def get_by_email(self, sc, email):
+        return self._get(sc, 'by_email', email)
+
+    def _get(self, sc, index, key):
+        if not key:
+            return None
+
+        age = self._get_age()
+        if age is None:
+            self.refresh(sc)
+        elif age > self.ttl:
+            self._refresh_in_background(sc)
+
+        member = getattr(self, index).get(key)
+        age = self._get_age()
+        if member is None and age is not None and age > DIRECTORY_MISS_REFRESH:
+            # The member may have joined the workspace since the last refresh
+            self.refresh(sc)
+            member = getattr(self, index).get(key)
+
+        return member
+
+    def _get_age(self):
+        return None if self.loaded_at is None else time.monotonic() - self.loaded_at
+
+    def refresh(self, sc):
+        """Load all the members of the workspace, following the pagination cursor"""
+        by_name = {}
+        by_email = {}
+        cursor = None
+        while True:
+            params = {'limit': 1000}
+            if cursor:
+                params['cursor'] = cursor
+            response = sc.api_call('users.list', **params)
+            if not response.get('ok', False):
+                logger.warn('Failure response from slack users list call {}'.format(response))
+                return False
+
+            for member in response.get('members') or []:
+                if member.get('name'):
+                    by_name[member['name']] = member
+                email = (member.get('profile') or {}).get('email')
+                if email:
+                    by_email[email] = member
+
+            cursor = (response.get('response_metadata') or {}).get('next_cursor')
+            if not cursor:
+                break
+
+        with self._lock:
+            self.by_name = by_name
+            self.by_email = by_email
+            self.loaded_at = time.monotonic()
+            self.refreshes += 1
+
+        return True
+
+    def _refresh_in_background(self, sc):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self.refresh(sc)
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self.by_name = {}
+            self.by_email = {}
+            self.loaded_at = None
+
+
+class TokenBucket:
+    """Allow `rate` operations per second on average, with bursts of up to `capacity` operations"""
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=DEFAULT_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self):
+        """Take a token, waiting until one is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for `seconds`, used when Slack reports the rate limit was exceeded"""
+        with self._lock:
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class SlackDelivery:
+    """Rate limited delivery of Slack messages, shared by the tasks of the worker process
+
+    Messages are posted straight away once the token bucket allows it, so a failed post still fails the task.
+    """
+
+    def __init__(self, bucket=None):
+        self.bucket = bucket or TokenBucket()
+        self.stats = {'sent': 0, 'failed': 0}
+        self._lock = threading.Lock()
+
+    def send(self, sc, channel, text, as_user=True):
+        """Post the message to the channel, retrying when Slack reports the rate limit was exceeded
+
+        :return: the response of the post message call
+        :raises Exception: when the message couldn't be posted
+        """
+        for _attempt in range(MAX_RATE_LIMITED_RETRIES):
+            self.bucket.consume()
+            response = sc.api_call('chat.postMessage', as_user=as_user, channel=channel, text=text)
+            if response.get('ok', False):
+                self._count('sent')
+                return response
+
+            if response.get('error') != 'ratelimited':
+                break
+
+            retry_after = float((response.get('headers') or {}).get('Retry-After') or 1)
+            self.bucket.pause(retry_after)
+
+        self._count('failed')
+        logger.warn('Failure response from slack post message call {}'.format(response))
+        raise Exception('Failure response from slack post message call {}'.format(response))
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+
+slack_directory = SlackDirectory()
+slack_delivery = SlackDelivery()
+
+
+def configure(config):
+    """Apply the ``PLANNING_SLACK_*`` settings to the directory and message delivery"""
+    slack_directory.ttl = config.get('PLANNING_SLACK_DIRECTORY_TTL', DEFAULT_DIRECTORY_TTL)
+    slack_delivery.bucket = TokenBucket(config.get('PLANNING_SLACK_RATE', DEFAULT_RATE),
+                                        config.get('PLANNING_SLACK_BURST', DEFAULT_BURST))
@@ -0,0 +1,119 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+import threading
+import time
+from unittest import TestCase
+from .slack import SlackDirectory, SlackDelivery, TokenBucket
+
+
+class FakeSlack():
+    """Fake of the Slack Web API, serving the workspace members in pages of two"""
+
+    def __init__(self, members, rate_limited=0):
+        self.members = members
+        self.rate_limited = rate_limited
+        self.calls = []
+
+    def api_call(self, method, **params):
+        self.calls.append((method, params))
+        if method == 'users.list':
+            start = int(params.get('cursor') or 0)
+            next_cursor = str(start + 2) if start + 2 < len(self.members) else ''
+            return {'ok': True, 'members': self.members[start:start + 2],
+                    'response_metadata': {'next_cursor': next_cursor}}
+        elif method == 'chat.postMessage':
+            if self.rate_limited:
+                self.rate_limited -= 1
+                return {'ok': False, 'error': 'ratelimited', 'headers': {'Retry-After': '0.01'}}
+            return {'ok': True}
+
+    def count(self, method):
+        return len([call for call in self.calls if call[0] == method])
+
+
+class SlackDirectoryTestCase(TestCase):
+    members = [
+        {'id': 'U1', 'name': 'foo', 'profile': {'email': 'foo@example.com'}},
+        {'id': 'U2', 'name': 'bar', 'profile': {'email': 'bar@example.com'}},
+        {'id': 'U3', 'name': 'baz', 'profile': {}},
+    ]
+
+    def test_lookups_use_the_cached_directory(self):
+        sc = FakeSlack(self.members)
+        directory = SlackDirectory()
+
+        self.assertEqual(directory.get_by_name(sc, 'baz')['id'], 'U3')
+        self.assertEqual(directory.get_by_email(sc, 'bar@example.com')['id'], 'U2')
+        self.assertIsNone(directory.get_by_name(sc, 'unknown'))
+
+        # Two pages, loaded once
+        self.assertEqual(sc.count('users.list'), 2)
+        self.assertEqual(directory.refreshes, 1)
+
+    def test_refreshes_in_background_when_expired(self):
+        sc = FakeSlack(self.members)
+        directory = SlackDirectory(ttl=0)
+        directory.get_by_name(sc, 'foo')
+
+        sc.members = sc.members + [{'id': 'U4', 'name': 'new', 'profile': {}}]
+        directory.loaded_at -= 1
+        # The expired directory is still used, while the refresh runs in the background
+        directory.get_by_name(sc, 'foo')
+
+        for _ in range(100):
+            if directory.refreshes == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(directory.get_by_name(sc, 'new')['id'], 'U4')
+
+
+class SlackDeliveryTestCase(TestCase):
+    def test_sends_straight_away(self):
+        sc = FakeSlack([])
+        delivery = SlackDelivery(TokenBucket(rate=100, capacity=1))
+
+        delivery.send(sc, 'news', 'first')
+        delivery.send(sc, 'sports', 'second')
+        self.assertEqual([params['text'] for method, params in sc.calls], ['first', 'second'])
+        self.assertEqual(delivery.stats, {'sent': 2, 'failed': 0})
+
+    def test_raises_failures(self):
+        sc = FakeSlack([], rate_limited=10)
+        delivery = SlackDelivery(TokenBucket(rate=1000, capacity=1))
+
+        with self.assertRaises(Exception):
+            delivery.send(sc, 'news', 'first')
+        self.assertEqual(delivery.stats, {'sent': 0, 'failed': 1})
+
+    def test_retries_when_rate_limited(self):
+        sc = FakeSlack([], rate_limited=1)
+        delivery = SlackDelivery(TokenBucket(rate=100, capacity=1))
+
+        self.assertEqual(delivery.send(sc, 'news', 'hello'), {'ok': True})
+        self.assertEqual(sc.count('chat.postMessage'), 2)
+
+    def test_stats_are_thread_safe(self):
+        sc = FakeSlack([])
+        delivery = SlackDelivery(TokenBucket(rate=100000, capacity=100000))
+        threads = [threading.Thread(target=lambda: [delivery.send(sc, 'news', 'hello') for _ in range(200)])
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(delivery.stats['sent'], 1000)
+
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.consume()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
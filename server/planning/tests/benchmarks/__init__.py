@@ -0,0 +1,55 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+"""Benchmarks for the Planning component
+
+The benchmark modules are not collected by the default test run, run them explicitly with::
+
+    $ nosetests -s planning/tests/benchmarks/combined_view_benchmark.py
+"""
+
+import time
+import tracemalloc
+
+
+def measure(callback, *args, **kwargs):
+    """Run the callback once, returning its result, the wall time in ms and the peak memory in KiB"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = callback(*args, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000
+        peak = tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+    return result, elapsed, peak
+
+
+def timed(callback, *args, repeat=3, **kwargs):
+    """Run the callback `repeat` times, returning the fastest wall time in ms"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        callback(*args, **kwargs)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return min(timings)
+
+
+def report(title, headers, rows):
+    """Print the benchmark results as a table"""
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    line = '  '.join('{{:>{}}}'.format(width) for width in widths)
+
+    print('\n{}'.format(title))
+    print(line.format(*headers))
+    for row in rows:
+        print(line.format(*row))
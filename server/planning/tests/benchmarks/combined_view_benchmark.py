@@ -0,0 +1,101 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from datetime import timedelta
+from eve.utils import ParsedRequest
+from werkzeug.datastructures import MultiDict
+from superdesk import get_resource_service
+from superdesk.utc import utcnow
+from planning.tests import TestCase
+from planning.tests.benchmarks import timed, report
+
+PAGE_SIZE = 25
+PAGES = (1, 10, 50)
+
+
+class CombinedViewBenchmark(TestCase):
+    """Compare the two step combined view query against the single pass query"""
+
+    def setUp(self):
+        super().setUp()
+        with self.app.app_context():
+            self._create_items(PAGE_SIZE * max(PAGES) + PAGE_SIZE)
+            self.app.data.elastic.es.indices.refresh()
+
+    def _create_items(self, count):
+        events, plans = [], []
+        start = utcnow() + timedelta(days=1)
+
+        for i in range(count):
+            scheduled = start + timedelta(minutes=i)
+            event_id = 'event{}'.format(i)
+            events.append({
+                '_id': event_id,
+                'guid': event_id,
+                'type': 'event',
+                'name': 'Event {}'.format(i),
+                'state': 'draft',
+                'dates': {'start': scheduled, 'end': scheduled + timedelta(hours=1)},
+                '_planning_schedule': [{'scheduled': scheduled}],
+                '_combined_id': event_id
+            })
+
+            # Every other Event has a related Planning item, every third Planning item is ad-hoc
+            if i % 2 == 0 or i % 3 == 0:
+                plan_id = 'plan{}'.format(i)
+                plan = {
+                    '_id': plan_id,
+                    'guid': plan_id,
+                    'type': 'planning',
+                    'slugline': 'Planning {}'.format(i),
+                    'state': 'draft',
+                    'planning_date': scheduled,
+                    'coverages': [],
+                    '_planning_schedule': [{'coverage_id': None, 'scheduled': scheduled}],
+                    '_combined_id': event_id if i % 2 == 0 else plan_id
+                }
+                if i % 2 == 0:
+                    plan['event_item'] = event_id
+                plans.append(plan)
+
+        get_resource_service('events').create(events)
+        get_resource_service('planning').create(plans)
+
+    @staticmethod
+    def _get_request(page):
+        req = ParsedRequest()
+        req.args = MultiDict()
+        req.page = page
+        req.max_results = PAGE_SIZE
+        return req
+
+    def test_combined_view_latency(self):
+        service = get_resource_service('events_planning_search')
+
+        def two_step(page):
+            req = self._get_request(page)
+            return list(service._get_combined_view_data(service._get_events_and_planning(req), req))
+
+        def single_pass(page):
+            return list(service._get_combined_view_single_pass(self._get_request(page)))
+
+        rows = []
+        with self.app.app_context():
+            for page in PAGES:
+                self.assertEqual(len(two_step(page)), len(single_pass(page)))
+                rows.append((
+                    page,
+                    '{:.1f}'.format(timed(two_step, page)),
+                    '{:.1f}'.format(timed(single_pass, page))
+                ))
+
+        report('Combined view latency (ms, page size {})'.format(PAGE_SIZE),
+               ('page', 'two step', 'single pass'),
+               rows)
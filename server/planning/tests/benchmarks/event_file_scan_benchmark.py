@@ -0,0 +1,81 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+import os
+import shutil
+import tempfile
+import time
+import mock
+from superdesk import get_resource_service
+from superdesk.utils import get_sorted_files, FileSortAttributes
+from planning.tests import TestCase
+from planning.tests.benchmarks import timed, report
+from planning.feeding_services.event_file_service import EventFileFeedingService
+from planning.feeding_services.file_scanner import scan_directory, get_changed_files, get_file_state, ScannedFile
+
+FILE_COUNT = 50000
+
+
+class EventFileScanBenchmark(TestCase):
+    """Compare listing the whole drop folder on each poll against the incremental scan"""
+
+    def setUp(self):
+        super().setUp()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        for i in range(FILE_COUNT):
+            with open(os.path.join(self.path, 'event{:05d}.xml'.format(i)), 'w') as f:
+                f.write('<event id="{}"/>'.format(i))
+
+    @mock.patch('planning.feeding_services.event_file_service.get_directory_watcher', return_value=None)
+    def test_scan(self, get_directory_watcher):
+        files = scan_directory(self.path)
+        # Files that were ingested, but couldn't be moved, waiting for their move to be retried
+        manifest = {
+            filename: get_file_state(ScannedFile(filename, os.path.join(self.path, filename), stat))._replace(
+                move_attempts=1, retry_move_at=time.time() + 3600
+            )
+            for filename, stat in files.items()
+        }
+        provider = {'_id': 'benchmark', 'name': 'benchmark', 'feed_parser': 'ntb_event_xml',
+                    'config': {'path': self.path}}
+
+        def full_listing():
+            for filename in get_sorted_files(self.path, sort_by=FileSortAttributes.created):
+                file_path = os.path.join(self.path, filename)
+                if os.path.isfile(file_path):
+                    os.lstat(file_path)
+
+        def incremental_scan():
+            return get_changed_files(self.path, scan_directory(self.path), manifest)
+
+        with self.app.app_context():
+            get_resource_service('ingest_file_manifest').save_states('benchmark', manifest.values())
+            self.assertEqual(incremental_scan(), ([], []))
+
+            def unchanged_poll():
+                return list(EventFileFeedingService()._update(provider, None))
+
+            # Nothing is moved out of the folder, so each poll sees the same files
+            with mock.patch.object(EventFileFeedingService, 'move_file') as move_file:
+                self.assertEqual(unchanged_poll(), [])
+                self.assertFalse(move_file.called)
+                self.assertEqual(len(os.listdir(self.path)), FILE_COUNT)
+
+                report(
+                    'Event file drop folder scan ({} files, unchanged, ms)'.format(FILE_COUNT),
+                    ('full listing', 'incremental scan', 'poll incl. manifest'),
+                    [(
+                        '{:.1f}'.format(timed(full_listing)),
+                        '{:.1f}'.format(timed(incremental_scan)),
+                        '{:.1f}'.format(timed(unchanged_poll))
+                    )]
+                )
+                self.assertFalse(move_file.called)
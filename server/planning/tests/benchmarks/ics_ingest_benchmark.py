@@ -0,0 +1,89 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+import os
+import re
+import mock
+from datetime import datetime
+from icalendar import Calendar
+from pytz import timezone as pytimezone
+from eve.utils import config
+from superdesk import get_resource_service
+from planning.tests import TestCase
+from planning.tests.benchmarks import timed, report
+from planning.feed_parsers.ics_2_0 import IcsTwoFeedParser, get_dedup_key
+
+SCALE = 100
+
+
+def mock_utcnow():
+    return pytimezone(config.DEFAULT_TIMEZONE).localize(datetime(2018, 2, 20, 10, 10))
+
+
+def get_scaled_calendar(scale):
+    """Repeat the VEVENTs of parl_cal.ics `scale` times, each copy with its own UIDs"""
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))),
+                        'feed_parsers', 'parl_cal.ics')
+    with open(path) as f:
+        content = f.read().replace('\r\n', '\n')
+
+    header, rest = content.split('BEGIN:VEVENT', 1)
+    events = 'BEGIN:VEVENT' + rest[:rest.rindex('END:VCALENDAR')]
+    copies = [re.sub(r'^UID:', 'UID:copy{}-'.format(i), events, flags=re.MULTILINE) for i in range(scale)]
+    return Calendar.from_ical(header + ''.join(copies) + 'END:VCALENDAR\n')
+
+
+class IcsIngestBenchmark(TestCase):
+    """Compare de-duplicating ingested ICS Events by scanning the existing Events against the hashed index"""
+
+    def setUp(self):
+        super().setUp()
+        self.app.data.insert('vocabularies', [{'_id': 'eventoccurstatus', 'items': [{
+            'is_active': True,
+            'qcode': 'eocstat:eos5',
+            'name': 'Planned, occurs certainly'
+        }]}])
+        self.calendar = get_scaled_calendar(SCALE)
+
+    @mock.patch('planning.feed_parsers.ics_2_0.utcnow', mock_utcnow)
+    def test_dedup(self):
+        parser = IcsTwoFeedParser()
+
+        with self.app.app_context():
+            items = parser.parse(self.calendar)
+            # Half of the Events were already ingested
+            self.app.data.insert('events', [dict(item) for item in items[::2]])
+
+            def linear_scan():
+                existing = list(get_resource_service('events').get_from_mongo(req=None, lookup={
+                    'original_source': {'$in': [item['original_source'] for item in items]}
+                }))
+                return [item for item in items if not any(
+                    event['original_source'] == item['original_source'] and
+                    event['dates']['start'] == item['dates']['start']
+                    for event in existing
+                )]
+
+            def hashed_index():
+                existing = parser._get_existing_events(items)
+                return [item for item in items
+                        if get_dedup_key(item['original_source'], item['dates']['start']) not in existing]
+
+            self.assertEqual(len(parser.parse(self.calendar)), len(items) - len(items[::2]))
+
+            report(
+                'ICS ingest de-duplication ({} VEVENTs, {} existing, ms)'.format(len(items), len(items[::2])),
+                ('linear scan', 'hashed index', 'full parse'),
+                [(
+                    '{:.1f}'.format(timed(linear_scan, repeat=1)),
+                    '{:.1f}'.format(timed(hashed_index)),
+                    '{:.1f}'.format(timed(parser.parse, self.calendar, repeat=1))
+                )]
+            )
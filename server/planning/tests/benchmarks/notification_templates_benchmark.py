@@ -0,0 +1,70 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from flask import render_template
+from jinja2 import Template
+from planning.tests import TestCase
+from planning.tests.benchmarks import timed, report
+from planning.notification_templates import get_notification_template, render_meta_template
+
+NOTIFICATIONS = 1000
+DATA = {
+    'coverage_type': 'Text',
+    'slugline': 'Budget',
+    'assign_type': 'assigned',
+    'desk': 'Politic Desk',
+    'assignor': 'John',
+    'assignment_id': 'assignment1',
+    'client_url': 'http://localhost:9000',
+    'omit_user': True,
+}
+
+
+class NotificationTemplatesBenchmark(TestCase):
+    """Compare rendering notifications by compiling the templates each time against the compiled registry"""
+
+    def test_render_notification(self):
+        def compile_each_time():
+            source = self.app.jinja_loader.get_source(environment=self.app.jinja_env,
+                                                      template='assignment_to_desk_msg.txt')[0]
+            Template(source).render(DATA)
+            Template(source).render(DATA)
+            render_template('assignment_details_email.txt', **DATA)
+            Template(source).render(DATA)
+            render_template('assignment_details_email.html', **DATA)
+
+        def compiled_registry():
+            template = get_notification_template('assignment_to_desk_msg.txt')
+            template.template.render(DATA)
+            template.template.render(DATA)
+            render_meta_template('assignment_details_email.txt', DATA)
+            template.template.render(DATA)
+            render_meta_template('assignment_details_email.html', DATA)
+
+        with self.app.test_request_context('/'):
+            self.assertEqual(
+                get_notification_template('assignment_to_desk_msg.txt').template.render(DATA),
+                Template(self.app.jinja_loader.get_source(self.app.jinja_env, 'assignment_to_desk_msg.txt')[0])
+                .render(DATA)
+            )
+            self.assertEqual(render_meta_template('assignment_details_email.html', DATA),
+                             render_template('assignment_details_email.html', **DATA))
+
+            def run(callback):
+                for _ in range(NOTIFICATIONS):
+                    callback()
+
+            before = timed(run, compile_each_time)
+            after = timed(run, compiled_registry)
+            report(
+                'Notification render cost ({} notifications, ms per notification)'.format(NOTIFICATIONS),
+                ('compile each time', 'compiled registry'),
+                [('{:.3f}'.format(before / NOTIFICATIONS), '{:.3f}'.format(after / NOTIFICATIONS))]
+            )
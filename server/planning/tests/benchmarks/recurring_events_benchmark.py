@@ -0,0 +1,102 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+import copy
+import itertools
+from datetime import datetime, timedelta
+from superdesk.metadata.utils import generate_guid
+from superdesk.metadata.item import GUID_NEWSML
+from planning.tests import TestCase
+from planning.tests.benchmarks import measure, report
+from planning.events.events import generate_recurring_dates, iter_recurring_events, setRecurringMode, \
+    overwrite_event_expiry_date, set_planning_schedule
+
+OCCURRENCES = (1000, 10000)
+
+
+def deepcopy_recurring_events(event, max_events):
+    """The previous implementation, copying the full Event for every occurrence"""
+    generated_events = []
+    setRecurringMode(event)
+    recurrence_id = event.get('recurrence_id', generate_guid(type=GUID_NEWSML))
+    time_delta = event['dates']['end'] - event['dates']['start']
+
+    for date in itertools.islice(generate_recurring_dates(
+            start=event['dates']['start'],
+            **event['dates']['recurring_rule']
+    ), 0, max_events):
+        new_event = copy.deepcopy(event)
+        for key in list(new_event.keys()):
+            if key.startswith('_') or key.startswith('lock_'):
+                new_event.pop(key)
+        new_event.pop('pubstatus', None)
+        new_event.pop('reschedule_from', None)
+
+        new_event['dates']['start'] = date
+        new_event['dates']['end'] = date + time_delta
+        new_event['guid'] = generate_guid(type=GUID_NEWSML)
+        new_event['_id'] = new_event['guid']
+        new_event['recurrence_id'] = recurrence_id
+        overwrite_event_expiry_date(new_event)
+        set_planning_schedule(new_event)
+        generated_events.append(new_event)
+
+    return generated_events
+
+
+def get_event(count):
+    """Get an Event with a large payload, repeating daily `count` times"""
+    return {
+        'name': 'Daily briefing',
+        'definition_short': 'Daily briefing ' * 50,
+        'files': [generate_guid(type=GUID_NEWSML) for _ in range(20)],
+        'event_contact_info': [generate_guid(type=GUID_NEWSML) for _ in range(20)],
+        'subject': [{'qcode': str(i), 'name': 'Subject {}'.format(i), 'scheme': 'subject'} for i in range(50)],
+        'location': [{'name': 'Parliament House', 'address': {'line': ['1 Main St'], 'country': 'Australia'}}],
+        'dates': {
+            'start': datetime(2099, 1, 1, 9, 0),
+            'end': datetime(2099, 1, 1, 10, 0),
+            'recurring_rule': {
+                'frequency': 'DAILY',
+                'interval': 1,
+                'count': count,
+                'endRepeatMode': 'count'
+            }
+        }
+    }
+
+
+class RecurringEventsBenchmark(TestCase):
+    """Compare generating occurrences with a deepcopy per occurrence against shared overlays"""
+
+    def test_generate_recurring_events(self):
+        rows = []
+        with self.app.app_context():
+            self.app.config['MAX_RECURRENT_EVENTS'] = max(OCCURRENCES)
+
+            for count in OCCURRENCES:
+                events, deepcopy_time, deepcopy_peak = measure(deepcopy_recurring_events, get_event(count), count)
+                self.assertEqual(len(events), count)
+                del events
+
+                events, overlay_time, overlay_peak = measure(lambda: list(iter_recurring_events(get_event(count))))
+                self.assertEqual(len(events), count)
+                self.assertEqual(events[-1]['dates']['start'], datetime(2099, 1, 1, 9, 0) + timedelta(days=count - 1))
+                del events
+
+                rows.append((
+                    count,
+                    '{:.0f}'.format(deepcopy_time), '{:.0f}'.format(deepcopy_peak),
+                    '{:.0f}'.format(overlay_time), '{:.0f}'.format(overlay_peak)
+                ))
+
+        report('Recurring event generation',
+               ('occurrences', 'deepcopy ms', 'deepcopy KiB', 'overlay ms', 'overlay KiB'),
+               rows)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015, 2016, 2017, 2018 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+from copy import deepcopy
+from bson import ObjectId
+from eve.utils import config
+from superdesk import get_resource_service
+from superdesk.utc import utcnow
+from planning.tests import TestCase
+from planning.tests.benchmarks import timed, report
+
+PLANNING_ITEMS = 500
+COVERAGES_PER_ITEM = 10
+
+
+class RelatedAssignmentsBenchmark(TestCase):
+    """Compare joining Assignments to Coverages by scanning the list against the id index"""
+
+    def setUp(self):
+        super().setUp()
+        self.plans = []
+        assignments = []
+        now = utcnow()
+
+        for i in range(PLANNING_ITEMS):
+            coverages = []
+            for j in range(COVERAGES_PER_ITEM):
+                coverage_id = 'cov{}-{}'.format(i, j)
+                assignment_id = ObjectId()
+                assignments.append({
+                    config.ID_FIELD: assignment_id,
+                    'coverage_item': coverage_id,
+                    'planning_item': 'plan{}'.format(i),
+                    'priority': 2,
+                    'assigned_to': {'desk': 'desk1', 'user': 'user1', 'state': 'assigned', 'assigned_date_desk': now},
+                    'planning': {'slugline': 'Coverage {}'.format(j), 'scheduled': now}
+                })
+                coverages.append({
+                    'coverage_id': coverage_id,
+                    'planning': {'scheduled': now},
+                    'assigned_to': {'assignment_id': assignment_id}
+                })
+
+            self.plans.append({config.ID_FIELD: 'plan{}'.format(i), 'coverages': coverages})
+
+        with self.app.app_context():
+            self.app.data.insert('assignments', assignments)
+
+    def test_related_assignments_join(self):
+        service = get_resource_service('planning')
+
+        def linear_scan(docs):
+            coverages = {cov['coverage_id']: cov for doc in docs for cov in doc['coverages']}
+            assignments = list(get_resource_service('assignments').get_from_mongo(
+                req=None,
+                lookup={'coverage_item': {'$in': list(coverages.keys())}}
+            ))
+            for coverage in coverages.values():
+                assignment = [a for a in assignments if str(a.get('_id')) ==
+                              str(coverage['assigned_to'].get('assignment_id'))][0]
+                coverage['assigned_to']['priority'] = assignment.get('priority')
+
+        def id_index(docs):
+            service._PlanningService__generate_related_assignments(docs)
+
+        with self.app.app_context():
+            id_index(self.plans)
+            for plan in self.plans:
+                for coverage in plan['coverages']:
+                    self.assertEqual(coverage['assigned_to']['desk'], 'desk1')
+                    self.assertEqual(coverage['assigned_to']['priority'], 2)
+
+            report(
+                'Related assignments join ({} planning items x {} coverages, ms)'.format(
+                    PLANNING_ITEMS,
+                    COVERAGES_PER_ITEM
+                ),
+                ('linear scan', 'id index'),
+                [(
+                    '{:.1f}'.format(timed(lambda: linear_scan(deepcopy(self.plans)), repeat=1)),
+                    '{:.1f}'.format(timed(lambda: id_index(deepcopy(self.plans))))
+                )]
+            )
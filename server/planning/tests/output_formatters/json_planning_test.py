@@ -247,3 +247,35 @@ class JsonPlanningTestCase(TestCase):
             self.assertEqual(output_item.get('coverages')[0].get('planning').get('slugline'), 'Raiders')
             self.assertEqual(output_item.get('coverages')[0].get('deliveries'), [])
             self.assertEqual(output_item.get('coverages')[0].get('workflow_status'), 'cancelled')
+
+    def test_format_batch(self):
+        with self.app.app_context():
+            self.app.data.insert('agenda', [{'_id': 1, 'is_enabled': True, 'name': 'Culture'}])
+            self.app.data.insert('assignments', self.assignment)
+            self.app.data.insert('delivery', self.delivery)
+
+            draft_item = deepcopy(self.item)
+            draft_item['_id'] = draft_item['guid'] = 'plan2'
+            draft_item['slugline'] = 'DRAFT'
+            draft_item['coverages'][0].pop('assigned_to', None)
+            draft_item['coverages'][0]['workflow_status'] = 'draft'
+
+            output = JsonPlanningFormatter().format_batch([self.item, draft_item])
+            self.assertEqual(len(output), 2)
+
+            completed, draft = [json.loads(item) for item in output]
+            self.assertEqual(completed['slugline'], 'SLUGLINE')
+            self.assertEqual(completed['agendas'], [{'_id': 1, 'name': 'Culture'}])
+            self.assertEqual(completed['coverages'][0]['workflow_status'], 'completed')
+            self.assertEqual(len(completed['coverages'][0]['deliveries']), 1)
+            self.assertNotIn('lock_user', completed)
+            self.assertNotIn('assigned_to', completed['coverages'][0])
+
+            self.assertEqual(draft['slugline'], 'DRAFT')
+            self.assertEqual(draft['agendas'], [{'_id': 1, 'name': 'Culture'}])
+            self.assertEqual(draft['coverages'][0]['workflow_status'], 'draft')
+            self.assertEqual(draft['coverages'][0]['deliveries'], [])
+
+            # The source items are left untouched
+            self.assertIn('lock_user', self.item)
+            self.assertIn('assigned_to', self.item['coverages'][0])